@@ -2,6 +2,8 @@
 ASGI config for frontend_server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; websocket connections go to the chat relay
+(web_ui/chat_relay.py), which refuses them unless CHAT_RELAY_ENABLED is set.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -13,4 +15,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'frontend_server.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from web_ui import chat_relay  # noqa: E402  (needs the app registry loaded above)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await chat_relay.application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -21,13 +22,29 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
 
+# DJANGO_ENV=production switches on the production profile at the bottom of
+# this file (cached templates, persistent DB connections, compression,
+# hashed static files, prebuilt Tailwind).
+DJANGO_ENV = os.getenv('DJANGO_ENV', 'development')
+PRODUCTION = DJANGO_ENV == 'production'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-2(efzs3zwx(g+eoqz(qg6@#0424p@c!+j1*o!wd4q%mg&7$n#h'
+# The insecure default is for development only; production refuses to start
+# without DJANGO_SECRET_KEY.
+SECRET_KEY = os.getenv('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    if PRODUCTION:
+        raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set when DJANGO_ENV=production.')
+    SECRET_KEY = 'django-insecure-2(efzs3zwx(g+eoqz(qg6@#0424p@c!+j1*o!wd4q%mg&7$n#h'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', '0' if PRODUCTION else '1') == '1'
 
-ALLOWED_HOSTS = []
+# Comma-separated. Production refuses to start with none: with DEBUG off,
+# Django would answer every request with 400.
+ALLOWED_HOSTS = [h for h in os.getenv('ALLOWED_HOSTS', '').split(',') if h]
+if PRODUCTION and not ALLOWED_HOSTS:
+    raise ImproperlyConfigured('ALLOWED_HOSTS must be set when DJANGO_ENV=production.')
 
 # Application definition
 
@@ -42,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'web_ui.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +73,8 @@ ROOT_URLCONF = 'frontend_server.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, plus render timing for web_ui.metrics.
+        'BACKEND': 'web_ui.template_backend.DjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -63,6 +82,9 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'web_ui.context_processors.assets',
+                'web_ui.context_processors.backend_status',
+                'web_ui.context_processors.fragments',
             ],
         },
     },
@@ -117,3 +139,283 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = os.getenv('STATIC_ROOT', str(BASE_DIR / 'staticfiles'))
+
+# Serve static/styles.css built ahead of time by `manage.py build_css`
+# instead of compiling Tailwind in the browser from the CDN script.
+TAILWIND_PREBUILT = os.getenv('TAILWIND_PREBUILT', '1' if PRODUCTION else '0') == '1'
+
+
+# Part of every page ETag (web_ui/conditional.py); change it when a deploy
+# changes templates so browsers don't keep showing the old markup.
+PAGE_ETAG_SALT = os.getenv('PAGE_ETAG_SALT', '')
+
+
+# Go backend client
+# Every view talks to the Go API through web_ui.backend, which keeps one pooled
+# connection per host per worker process instead of a handshake per call.
+
+GO_BACKEND_URL = os.getenv('GO_BACKEND_URL', 'http://127.0.0.1:8080')
+
+BACKEND_POOL_SIZE = int(os.getenv('BACKEND_POOL_SIZE', '20'))
+
+# Bounded retries (with exponential backoff) for idempotent GETs only.
+BACKEND_RETRIES = int(os.getenv('BACKEND_RETRIES', '2'))
+BACKEND_RETRY_BACKOFF = float(os.getenv('BACKEND_RETRY_BACKOFF', '0.2'))
+
+# (connect, read) timeouts in seconds, keyed by endpoint family: the request
+# path with numeric ids replaced by "{id}". Anything not listed uses "default".
+BACKEND_TIMEOUTS = {
+    'default': (
+        float(os.getenv('BACKEND_CONNECT_TIMEOUT', '2')),
+        float(os.getenv('BACKEND_READ_TIMEOUT', '10')),
+    ),
+    '/api/login': (2, 5),
+    '/api/signup': (2, 5),
+    '/api/groups/{id}/simplify': (2, 15),
+    '/api/expenses': (2, 15),
+}
+
+# Independent backend GETs for one page are fanned out over a small shared
+# thread pool and must all finish within one deadline (seconds).
+BACKEND_FANOUT_WORKERS = int(os.getenv('BACKEND_FANOUT_WORKERS', '8'))
+BACKEND_FANOUT_DEADLINE = float(os.getenv('BACKEND_FANOUT_DEADLINE', '5'))
+
+# Coalesce identical concurrent GETs (same URL and Authorization) inside one
+# worker process into a single backend request.
+BACKEND_SINGLE_FLIGHT = os.getenv('BACKEND_SINGLE_FLIGHT', '1') == '1'
+
+# Circuit breaker per endpoint family: after this many consecutive failures
+# (errors, timeouts, 5xx) calls fail immediately for BACKEND_BREAKER_RESET
+# seconds, then one probe decides whether the circuit closes again.
+BACKEND_BREAKER_THRESHOLD = int(os.getenv('BACKEND_BREAKER_THRESHOLD', '5'))
+BACKEND_BREAKER_RESET = float(os.getenv('BACKEND_BREAKER_RESET', '30'))
+
+# Seconds the last good response of each GET (per URL and user) is kept. It is
+# revalidated with If-None-Match when the backend sends ETags, and served,
+# marked stale, while the backend is failing. 0 turns both off. The copies
+# live in the "backend_responses" cache below, within BACKEND_STALE_CACHE_MB.
+BACKEND_STALE_TTL = int(os.getenv('BACKEND_STALE_TTL', '900'))
+
+# Serve the backend-bound views as native async views (web_ui.async_views).
+# Only worth enabling when running under ASGI, e.g.
+#   uvicorn frontend_server.asgi:application
+WEB_UI_ASYNC_VIEWS = os.getenv('WEB_UI_ASYNC_VIEWS', '0') == '1'
+
+# Connection limit of the pooled httpx.AsyncClient used by the async views.
+BACKEND_ASYNC_POOL_SIZE = int(os.getenv('BACKEND_ASYNC_POOL_SIZE', '200'))
+
+# Group chat sockets (/chat/<group_id>) on the Go backend.
+WS_BACKEND_URL = os.getenv('WS_BACKEND_URL', 'ws://localhost:8080')
+
+# Under ASGI, relay chat through this app (web_ui/chat_relay.py): browsers
+# connect to /ws/chat/<group_id> here and each worker keeps one backend socket
+# per group, answers new subscribers from the last CHAT_HISTORY_SIZE messages
+# and disconnects clients with more than CHAT_CLIENT_QUEUE frames unsent. The
+# backend socket is kept CHAT_UPSTREAM_LINGER seconds after the last client
+# leaves. Needs the websockets package.
+CHAT_RELAY_ENABLED = os.getenv('CHAT_RELAY_ENABLED', '0') == '1'
+CHAT_HISTORY_SIZE = int(os.getenv('CHAT_HISTORY_SIZE', '200'))
+CHAT_CLIENT_QUEUE = int(os.getenv('CHAT_CLIENT_QUEUE', '256'))
+CHAT_UPSTREAM_LINGER = float(os.getenv('CHAT_UPSTREAM_LINGER', '10'))
+
+# Live chat messages arriving within CHAT_BATCH_WINDOW seconds go to browsers
+# as one frame of up to CHAT_BATCH_MAX messages (0 sends each at once).
+# CHAT_DEFLATE asks the backend for permessage-deflate on the relay's sockets;
+# for browsers it is up to the ASGI server (uvicorn --ws-per-message-deflate).
+CHAT_BATCH_WINDOW = float(os.getenv('CHAT_BATCH_WINDOW', '0.05'))
+CHAT_BATCH_MAX = int(os.getenv('CHAT_BATCH_MAX', '100'))
+CHAT_DEFLATE = os.getenv('CHAT_DEFLATE', '1') == '1'
+
+# Chat attachments are uploaded by the browser in UPLOAD_CHUNK_SIZE pieces
+# (resumable; web_ui/uploads.py) to CHAT_UPLOAD_TARGET: "cloudinary" (direct,
+# with the CLOUDINARY_* settings) or "local", this app, which keeps chunks in
+# UPLOAD_TEMP_DIR and saves finished files to the "chat_uploads" storage.
+# Cloudinary needs chunks of at least 5 MB.
+CHAT_UPLOAD_TARGET = os.getenv('CHAT_UPLOAD_TARGET', 'cloudinary' if os.getenv('CLOUDINARY_CLOUD_NAME') else 'local')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(6 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_MB', '100')) * 1024 * 1024
+UPLOAD_TEMP_DIR = os.getenv('UPLOAD_TEMP_DIR', str(BASE_DIR / '.cache' / 'uploads'))
+UPLOAD_TEMP_TTL = int(os.getenv('UPLOAD_TEMP_TTL', '86400'))
+# Images are downscaled in the browser before upload: the attachment to at
+# most UPLOAD_IMAGE_MAX_PX on its long side, plus a UPLOAD_THUMB_PX preview
+# that chat messages show.
+UPLOAD_IMAGE_MAX_PX = int(os.getenv('UPLOAD_IMAGE_MAX_PX', '2048'))
+UPLOAD_THUMB_PX = int(os.getenv('UPLOAD_THUMB_PX', '320'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'chat_uploads': {
+        'BACKEND': os.getenv('CHAT_UPLOAD_STORAGE', 'django.core.files.storage.FileSystemStorage'),
+        'OPTIONS': {
+            'location': os.getenv('CHAT_UPLOAD_ROOT', str(BASE_DIR / 'media' / 'chat')),
+            'base_url': '/uploads/files/',
+        },
+    },
+}
+
+
+# Instrumentation
+# /metrics/ serves Prometheus-style counters and histograms, only to these
+# client addresses; they also get each backend call in the Server-Timing
+# header, where other clients only see the totals. With PROFILER_ENABLED, ?_profile=1 on any page returns a
+# profile of that request (pyinstrument if installed, cProfile otherwise).
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', '1' if DEBUG else '0') == '1'
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.001'))
+
+
+# Cache
+# Local-memory (LRU, per process) by default. Point CACHE_BACKEND/CACHE_LOCATION
+# at a shared backend for multi-process deployments, e.g.
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://127.0.0.1:6379/1
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'web-ui'),
+    }
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    # LocMemCache evicts least-recently-used keys past MAX_ENTRIES.
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000'))}
+
+# Rendered page fragments ({% cache %} blocks keyed on a group's data version,
+# see web_ui/fragments.py). Kept in process memory under a byte budget;
+# FRAGMENT_CACHE_TTL also bounds how long a write made elsewhere can go
+# unseen when the backend sends no ETags.
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '300'))
+CACHES['template_fragments'] = {
+    'BACKEND': 'web_ui.fragments.FragmentCache',
+    'LOCATION': 'web-ui-fragments',
+    'TIMEOUT': FRAGMENT_CACHE_TTL,
+    'OPTIONS': {
+        'MAX_ENTRIES': 100000,
+        'MAX_BYTES': int(os.getenv('FRAGMENT_CACHE_MB', '32')) * 1024 * 1024,
+    },
+}
+
+# Last good backend responses (BACKEND_STALE_TTL). Whole response bodies, so
+# they get their own byte budget and never evict the small shared entries of
+# the default cache (idempotency keys, members, debts, group versions).
+CACHES['backend_responses'] = {
+    'BACKEND': 'web_ui.fragments.ByteBudgetCache',
+    'LOCATION': 'web-ui-backend-responses',
+    'TIMEOUT': BACKEND_STALE_TTL,
+    'OPTIONS': {
+        'MAX_ENTRIES': 100000,
+        'MAX_BYTES': int(os.getenv('BACKEND_STALE_CACHE_MB', '64')) * 1024 * 1024,
+    },
+}
+
+# Sessions
+# Every request reads the session and login writes to it, so keep it off the
+# SQLite database (one writer at a time). SESSION_BACKEND picks the engine:
+#   cache          - the "sessions" cache below (default)
+#   cached_db      - write-through to the database, reads from the cache
+#   signed_cookies - no server storage; the session (JWT claims and the
+#                    group snapshot included) travels in a signed, readable
+#                    cookie, so keep an eye on its 4KB limit
+#   db             - Django's default database sessions
+# The "sessions" cache is in process memory by default: reads and writes are
+# dict operations, and past SESSION_CACHE_MAX_ENTRIES it drops the least
+# recently used 1% of sessions. The trade-off is that sessions live and die with
+# the process: restarts log everyone out, and with several worker processes
+# a login only exists on the worker that made it. Such deployments must set
+# SESSION_CACHE_BACKEND/LOCATION to a shared server (e.g. Redis or Memcached)
+# or use SESSION_BACKEND=db. Don't use FileBasedCache here: it lists its
+# whole directory on every save and culls a random third of the sessions
+# once full.
+SESSION_ENGINES = {
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_BACKEND', 'cache')]
+SESSION_CACHE_ALIAS = 'sessions'
+CACHES['sessions'] = {
+    'BACKEND': os.getenv('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+    'LOCATION': os.getenv('SESSION_CACHE_LOCATION', 'web-ui-sessions'),
+    'TIMEOUT': None,  # expiry is the session's own (SESSION_COOKIE_AGE)
+    'OPTIONS': {
+        'MAX_ENTRIES': int(os.getenv('SESSION_CACHE_MAX_ENTRIES', '100000')),
+        'CULL_FREQUENCY': 100,
+    },
+}
+
+# Seconds a group's member list is reused before refetching.
+MEMBERS_CACHE_TTL = int(os.getenv('MEMBERS_CACHE_TTL', '120'))
+
+# Seconds the home page reuses the user's group list kept in their session.
+# create_group and join_group drop it immediately.
+GROUPS_SNAPSHOT_TTL = int(os.getenv('GROUPS_SNAPSHOT_TTL', '60'))
+
+# Seconds a group's simplified debts are reused. add_expense, bulk add and
+# settle_debt drop them as soon as they write to the group.
+DEBTS_CACHE_TTL = int(os.getenv('DEBTS_CACHE_TTL', '60'))
+
+# When /simplify fails, compute the settlement plan locally from the activity
+# feed (web_ui/debts.py), if every expense in it carries its splits. It is
+# shown read-only. DEBTS_CROSS_CHECK=1 also recomputes it on every cache miss
+# and logs disagreements with the backend.
+DEBTS_LOCAL_FALLBACK = os.getenv('DEBTS_LOCAL_FALLBACK', '1') == '1'
+DEBTS_CROSS_CHECK = os.getenv('DEBTS_CROSS_CHECK', '0') == '1'
+
+# add_expense / settle_debt idempotency keys: how long a submitted key keeps
+# returning its first result, and how long a repeat waits on one in flight.
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '600'))
+IDEMPOTENCY_WAIT = int(os.getenv('IDEMPOTENCY_WAIT', '15'))
+
+# History page: activity items per page, and the most a client may ask for.
+ACTIVITY_PAGE_SIZE = int(os.getenv('ACTIVITY_PAGE_SIZE', '30'))
+ACTIVITY_PAGE_MAX = 200
+
+# Dashboard: one summary per group (balance, pending settlements, the latest
+# DASHBOARD_ACTIVITY_ITEMS activity items). Everything not in the group
+# caches is fetched in one fan-out that must finish within DASHBOARD_DEADLINE
+# seconds; groups that miss it are shown as partial. Their newest activity
+# is reused for RECENT_ACTIVITY_TTL seconds, or until the group changes.
+DASHBOARD_ACTIVITY_ITEMS = int(os.getenv('DASHBOARD_ACTIVITY_ITEMS', '5'))
+DASHBOARD_DEADLINE = float(os.getenv('DASHBOARD_DEADLINE', '1.5'))
+RECENT_ACTIVITY_TTL = int(os.getenv('RECENT_ACTIVITY_TTL', '60'))
+
+# Bulk expense entry: most rows per submission, and the overall deadline
+# (seconds) for posting them concurrently.
+BULK_EXPENSE_MAX_ROWS = int(os.getenv('BULK_EXPENSE_MAX_ROWS', '200'))
+BULK_EXPENSE_DEADLINE = float(os.getenv('BULK_EXPENSE_DEADLINE', '30'))
+
+
+# Production profile
+if PRODUCTION:
+    # Parse each template once per process.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+    # Reuse database connections across requests instead of reopening them.
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+    # Compress responses: Brotli and gzip if django-compression-middleware is
+    # installed, gzip only otherwise. Must run before anything that reads the
+    # response body.
+    try:
+        import compression_middleware  # noqa: F401
+        COMPRESSION_MIDDLEWARE = 'compression_middleware.middleware.CompressionMiddleware'
+    except ImportError:
+        COMPRESSION_MIDDLEWARE = 'django.middleware.gzip.GZipMiddleware'
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, COMPRESSION_MIDDLEWARE)
+
+    # collectstatic writes content-hashed names (cache forever) plus .gz / .br
+    # copies next to them for the front server (nginx gzip_static/brotli_static).
+    STORAGES['staticfiles'] = {'BACKEND': 'web_ui.storage.CompressedManifestStaticFilesStorage'}
@@ -0,0 +1,17 @@
+/** Tailwind build for static/styles.css (`python manage.py build_css`). */
+module.exports = {
+  darkMode: 'class',
+  content: [
+    './web_ui/templates/**/*.html',
+    './templates/**/*.html',
+    './static/**/*.js',
+  ],
+  theme: {
+    extend: {
+      screens: {
+        '3xl': '1920px',
+      },
+    },
+  },
+  plugins: [],
+};
@@ -0,0 +1,211 @@
+"""Async counterpart of ``web_ui.backend`` for the ASGI views.
+
+One pooled ``httpx.AsyncClient`` per event loop keeps hundreds of backend
+calls in flight on a single worker without a thread per request. Timeouts,
+endpoint families, the bearer header, GET coalescing, the circuit breakers
+and the last-good fallback follow the sync client; coalesced GETs count
+towards ``backend.singleflight_stats``.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+from . import backend, breaker, metrics
+from .backend import Deadline, endpoint_family, is_stale, response_key, responses, timeout_for, url_for
+
+logger = logging.getLogger(__name__)
+
+# httpx clients are bound to the loop they were first used on.
+_clients = weakref.WeakKeyDictionary()
+# loop -> {(url, headers): Task} of GETs in flight.
+_flights = weakref.WeakKeyDictionary()
+
+
+def _build_client():
+    pool = settings.BACKEND_ASYNC_POOL_SIZE
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool, max_keepalive_connections=pool),
+        transport=httpx.AsyncHTTPTransport(retries=settings.BACKEND_RETRIES),
+    )
+
+
+def get_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _build_client()
+    return client
+
+
+async def aclose():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def auth_headers(request=None, token=None):
+    if token is None and request is not None:
+        token = await request.session.aget('auth_token')
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+def _status(task):
+    if task.done() and not task.cancelled() and task.exception() is None:
+        return task.result().status_code
+    return 'error'
+
+
+class CircuitOpen(httpx.ConnectError):
+    """The endpoint family's circuit is open; the call was not sent."""
+
+
+def never_sent(exc):
+    """``backend.never_sent`` for httpx errors (``CircuitOpen`` is a ConnectError)."""
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+async def last_good(url, headers):
+    if not settings.BACKEND_STALE_TTL:
+        return None
+    return await responses().aget(response_key(url, headers))
+
+
+async def _remember(url, headers, res):
+    if settings.BACKEND_STALE_TTL and res.status_code == 200:
+        entry = (res.headers.get('ETag'), res.content)
+        await responses().aset(response_key(url, headers), entry, settings.BACKEND_STALE_TTL)
+
+
+def _from_cache(url, entry, family=None):
+    headers = {'Content-Type': 'application/json'}
+    if entry[0]:
+        headers['ETag'] = entry[0]
+    res = httpx.Response(200, content=entry[1], headers=headers, request=httpx.Request('GET', url))
+    res.stale = family is not None
+    if res.stale:
+        metrics.record_stale(family)
+    return metrics.time_json(res)
+
+
+async def _single_flight(key, send, family):
+    flights = _flights.setdefault(asyncio.get_running_loop(), {})
+    task = flights.get(key)
+    shared = task is not None
+    backend.count_flight(coalesced=shared)
+    if not shared:
+        task = flights[key] = asyncio.ensure_future(send())
+
+        def finished(t):
+            flights.pop(key, None)
+            if not t.cancelled():
+                t.exception()  # mark retrieved even if every waiter gave up
+
+        task.add_done_callback(finished)
+
+    started = time.perf_counter()
+    try:
+        # Shielded: one caller giving up (fan-out deadline) mustn't cancel the rest.
+        return await asyncio.shield(task)
+    finally:
+        if shared:
+            metrics.record_backend(family, _status(task), time.perf_counter() - started, shared=True)
+
+
+async def call(method, path, request=None, token=None, headers=None, deadline=None, **kwargs):
+    """Send one request and return the ``httpx.Response``.
+
+    Raises ``httpx.HTTPError`` on connection errors and timeouts, including
+    ``CircuitOpen``. Failed GETs fall back to the last good response and
+    304s are answered from it, as in ``backend.call``.
+    """
+    all_headers = await auth_headers(request, token)
+    if headers:
+        all_headers.update(headers)
+    connect, read = timeout_for(path, deadline)
+    url = url_for(path)
+
+    family = endpoint_family(path)
+    entry = await last_good(url, all_headers) if method == 'GET' else None
+    if entry is not None and entry[0]:
+        all_headers.setdefault('If-None-Match', entry[0])
+
+    async def send():
+        if not breaker.allow(family):
+            raise CircuitOpen(f"Circuit open for {family}")
+        started = time.perf_counter()
+        ok = False
+        try:
+            res = await get_client().request(
+                method,
+                url,
+                headers=all_headers,
+                timeout=httpx.Timeout(read, connect=connect),
+                **kwargs
+            )
+            ok = res.status_code < 500
+        except httpx.HTTPError:
+            metrics.record_backend(family, 'error', time.perf_counter() - started)
+            raise
+        finally:
+            breaker.record(family, ok)
+        metrics.record_backend(family, res.status_code, time.perf_counter() - started, len(res.content))
+        if method == 'GET':
+            if res.status_code == 304 and entry is not None:
+                await responses().atouch(response_key(url, all_headers), settings.BACKEND_STALE_TTL)
+                return _from_cache(url, entry)
+            await _remember(url, all_headers, res)
+        return metrics.time_json(res)
+
+    if method != 'GET':
+        return await send()
+    try:
+        if not kwargs and settings.BACKEND_SINGLE_FLIGHT:
+            res = await _single_flight((url, tuple(sorted(all_headers.items()))), send, family)
+        else:
+            res = await send()
+    except httpx.HTTPError:
+        if entry is None:
+            raise
+        return _from_cache(url, entry, family)
+    if res.status_code >= 500 and entry is not None:
+        return _from_cache(url, entry, family)
+    return res
+
+
+async def get(path, request=None, **kwargs):
+    return await call('GET', path, request=request, **kwargs)
+
+
+async def post(path, request=None, **kwargs):
+    return await call('POST', path, request=request, **kwargs)
+
+
+async def fetch_all(paths, request=None, deadline=None):
+    """Async ``backend.fetch_all``: key -> response, or None on failure/timeout."""
+    if deadline is None:
+        deadline = Deadline()
+    token = await request.session.aget('auth_token') if request is not None else None
+    keys = list(paths)
+    tasks = [
+        asyncio.ensure_future(call('GET', paths[key], token=token, deadline=deadline))
+        for key in keys
+    ]
+    done, pending = await asyncio.wait(tasks, timeout=max(deadline.remaining(), 0))
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for key, task in zip(keys, tasks):
+        results[key] = None
+        if task in pending:
+            logger.warning("async fan-out: %s missed the deadline", paths[key])
+        elif isinstance(task.exception(), httpx.HTTPError):
+            logger.warning("async fan-out: %s failed: %s", paths[key], task.exception())
+        else:
+            # Re-raises anything else: a bug, not an unreachable backend.
+            results[key] = task.result()
+    return results
@@ -0,0 +1,347 @@
+"""Native async versions of the backend-bound views.
+
+Enabled with ``WEB_UI_ASYNC_VIEWS=1`` when serving over ASGI. They share the
+form handling of ``web_ui.views`` and the response handling of
+``web_ui.loaders``, and only differ in awaiting the backend through
+``web_ui.async_backend`` instead of blocking a thread on ``requests``. Views without backend I/O worth awaiting (login,
+signup, create/join group, settle, bulk add, metrics, uploads) are re-exported
+unchanged.
+
+Each view awaits ``request.session.aget`` first; after that the session is
+loaded and the sync session helpers (``identity``, ``groupcache``) are safe
+to call without touching the session store.
+"""
+import logging
+
+import httpx
+from django.http import JsonResponse
+from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.conf import settings
+from django.contrib import messages
+
+from . import async_backend, conditional, debts, feed, fragments, groupcache, identity, idempotency, loaders, metrics, overview
+from .views import (
+    EXPENSE_OUTCOME_UNKNOWN,
+    EXPENSE_STILL_RUNNING,
+    GO_BACKEND_URL,
+    build_expense_payload,
+    bulk_add_expense,
+    chat_context,
+    create_group,
+    expense_form_context,
+    expense_saved,
+    feed_params,
+    get_current_user_id,
+    get_current_username,
+    join_group,
+    login_page,
+    logout_user,
+    metrics_page,
+    settle_debt,
+    signup_page,
+    upload_chunk,
+    upload_file,
+    upload_start,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def dashboard_page(request):
+    token = await request.session.aget('auth_token')
+    if not token:
+        messages.error(request, "You must log in to view the dashboard.")
+        return redirect('login')
+
+    deadline = async_backend.Deadline(settings.DASHBOARD_DEADLINE)
+    groups = identity.cached_groups(request.session)
+    paths = {"dashboard": "/api/dashboard"}
+    if groups is None:
+        paths["groups"] = "/api/groups"
+    results = await async_backend.fetch_all(paths, request, deadline)
+
+    response = results["dashboard"]
+    if response is not None and response.status_code == 401:
+        messages.error(request, "Session expired. Please login again.")
+        return redirect('login')
+    if groups is None:
+        res_groups = results["groups"]
+        groups = overview.json_body(res_groups, []) or []
+        if groups and not async_backend.is_stale(res_groups):
+            identity.store_groups(request.session, groups)
+
+    summaries = await load_overview(request, groups, deadline)
+    context = {
+        'user_email': await request.session.aget('user_email'),
+        'summaries': summaries,
+        'partial': any(s['partial'] for s in summaries),
+    }
+    data = overview.json_body(response, {})
+    if response is None:
+        context['error'] = 'Backend is offline'
+    elif data is None:
+        context['error'] = 'Could not fetch dashboard data'
+    else:
+        context['data'] = data
+    return render(request, 'web_ui/dashboard.html', context)
+
+
+async def load_overview(request, groups, deadline):
+    my_id = get_current_user_id(request)
+    cached, paths = {}, {}
+    for g in groups:
+        gid = g['id']
+        cached[gid] = (
+            await groupcache.acached_members(request, gid),
+            await groupcache.acached_debts(gid),
+            await groupcache.acached_recent(gid),
+        )
+        paths.update(overview.missing_paths(gid, *cached[gid]))
+    results = await async_backend.fetch_all(paths, request, deadline) if paths else {}
+
+    summaries = []
+    for g in groups:
+        gid = g['id']
+        members, index, recent, store, observed = loaders.group_parts(gid, cached[gid], results)
+        for path, etag in observed:
+            await groupcache.aobserve_activity(gid, path, etag)
+        if 'members' in store:
+            await groupcache.astore_members(gid, store['members'])
+        if 'debts' in store:
+            await groupcache.astore_debts(gid, store['debts'])
+        if 'recent' in store:
+            await groupcache.astore_recent(gid, store['recent'])
+        summaries.append(loaders.group_summary(g, my_id, members, index, recent))
+    return summaries
+
+
+async def home(request):
+    token = await request.session.aget("auth_token")
+    groups = []
+
+    if token:
+        groups = identity.cached_groups(request.session)
+        if groups is None:
+            groups = []
+            try:
+                res = await async_backend.get("/api/groups", token=token)
+                if res.status_code == 200:
+                    groups = res.json()
+                    if not async_backend.is_stale(res):
+                        identity.store_groups(request.session, groups)
+            except (httpx.HTTPError, ValueError):
+                pass
+
+    etag = conditional.page_etag(request, "home", groups)
+    unchanged = conditional.not_modified(request, "home", etag)
+    if unchanged is not None:
+        return unchanged
+
+    return conditional.tag(render(request, "web_ui/home.html", {
+        "is_logged_in": bool(token),
+        "groups": groups
+    }), etag)
+
+
+async def load_members(request, group_id):
+    cached = await groupcache.acached_members(request, group_id)
+    if cached is not None:
+        return cached, None, True
+    try:
+        res = await async_backend.get(loaders.members_path(group_id), request=request)
+    except httpx.ConnectError:
+        return [], f"Connection Refused. Is Go running at {GO_BACKEND_URL}?", False
+    except httpx.TimeoutException:
+        return [], "Backend timed out fetching members.", False
+    except httpx.HTTPError as e:
+        return [], f"Backend request failed: {e}", False
+    members, fresh, debug_error = loaders.members_or_error(res)
+    if fresh:
+        await groupcache.astore_members(group_id, members)
+    return members, debug_error, fresh
+
+
+async def add_expense(request, group_id):
+    token = await request.session.aget("auth_token")
+    if not token: return redirect("login")
+
+    members, debug_error, fresh = await load_members(request, group_id)
+
+    key = None
+    if request.method == "POST":
+        key = request.POST.get("idempotency_key")
+        payload = build_expense_payload(request, group_id, members)
+        if payload is not None:
+            async def send():
+                res = await async_backend.post(
+                    "/api/expenses", token=token, json=payload, headers=idempotency.headers(key)
+                )
+                return {"status": res.status_code, "text": res.text}
+
+            try:
+                res = await idempotency.arun_once(request, key, send, "/api/expenses")
+                await groupcache.ainvalidate_debts(group_id)
+                if expense_saved(request, res):
+                    return redirect("home")
+                if idempotency.final(res):
+                    key = None
+            except idempotency.StillRunning:
+                messages.error(request, EXPENSE_STILL_RUNNING)
+            except idempotency.OutcomeUnknown:
+                await groupcache.ainvalidate_debts(group_id)
+                messages.error(request, EXPENSE_OUTCOME_UNKNOWN)
+            except httpx.HTTPError:
+                messages.error(request, "Backend unavailable during save.")
+
+    return render(request, "web_ui/add_expense.html", expense_form_context(
+        request, group_id, members, debug_error, fresh, await groupcache.agroup_version(group_id), key
+    ))
+
+
+async def load_ledger(request, group_id):
+    members = await groupcache.acached_members(request, group_id)
+    paths = {"activity": loaders.ledger_path(group_id)}
+    if members is None:
+        paths["members"] = loaders.members_path(group_id)
+    results = await async_backend.fetch_all(paths, request)
+
+    if members is None:
+        members, fresh = loaders.members(results["members"])
+        if fresh:
+            await groupcache.astore_members(group_id, members)
+    activity = loaders.activity(results["activity"])
+    if activity is not None:
+        await groupcache.aobserve_activity(group_id, paths["activity"], loaders.etag(results["activity"]))
+    return activity, members or []
+
+
+async def load_debts(request, group_id):
+    my_id = get_current_user_id(request)
+    index = await groupcache.acached_debts(group_id)
+    if index is not None:
+        return groupcache.debts_for(index, my_id), False
+
+    path = loaders.simplify_path(group_id)
+    try:
+        res = await async_backend.get(path, request=request)
+    except httpx.HTTPError as e:
+        logger.warning("simplify: group %s unavailable: %s", group_id, e)
+        res = None
+    txns, stale = loaders.plan(res)
+    if txns is not None:
+        await groupcache.aobserve_activity(group_id, path, loaders.etag(res))
+
+    if txns is not None and stale:
+        # Last known plan during an outage: show it, but don't cache it.
+        return groupcache.debts_for(groupcache.index_debts(txns), my_id), False
+    if txns is not None:
+        index = await groupcache.astore_debts(group_id, txns)
+        if settings.DEBTS_CROSS_CHECK:
+            activity, _ = await load_ledger(request, group_id)
+            if activity is not None:
+                debts.cross_check(group_id, txns, activity)
+        return groupcache.debts_for(index, my_id), False
+
+    if not settings.DEBTS_LOCAL_FALLBACK:
+        return None, False
+    return loaders.local_plan(*await load_ledger(request, group_id), my_id)
+
+
+async def simplify_group(request, group_id):
+    token = await request.session.aget("auth_token")
+    if not token: return redirect('login')
+
+    txns, computed_locally = await load_debts(request, group_id)
+    # The idempotency key is left out on purpose: a 304 keeps the page's old
+    # key, which is still unused unless a settlement (and so new debts) followed.
+    etag = conditional.page_etag(request, "simplify", [group_id, txns, computed_locally])
+    unchanged = conditional.not_modified(request, "simplify", etag)
+    if unchanged is not None:
+        return unchanged
+
+    return conditional.tag(render(request, "web_ui/simplify.html", {
+        "txns": txns,
+        "group_id": group_id,
+        "computed_locally": computed_locally,
+        "idempotency_key": idempotency.new_key(),
+        "group_version": await groupcache.agroup_version(group_id),
+        "viewer_key": fragments.viewer_key(request),
+        "plan_key": fragments.data_key(txns, computed_locally)
+    }), etag)
+
+
+async def load_history(request, group_id):
+    before, limit = feed_params(request)
+
+    members = await groupcache.acached_members(request, group_id)
+    paths = {"activity": feed.activity_path(group_id, before, limit)}
+    if members is None:
+        paths["members"] = loaders.members_path(group_id)
+    results = await async_backend.fetch_all(paths, request)
+
+    if members is None:
+        members, fresh = loaders.members(results["members"])
+        if fresh:
+            await groupcache.astore_members(group_id, members)
+    activity = loaders.activity(results["activity"])
+    if activity is not None and before is None:
+        # The newest page changes whenever the group does.
+        await groupcache.aobserve_activity(group_id, paths["activity"], loaders.etag(results["activity"]))
+    return loaders.history_page(activity, members, before, limit)
+
+
+async def group_expenses(request, group_id):
+    token = await request.session.aget("auth_token")
+    if not token: return redirect('login')
+
+    expenses, next_cursor = await load_history(request, group_id)
+    etag = conditional.page_etag(request, "group_expenses", [group_id, expenses, next_cursor])
+    unchanged = conditional.not_modified(request, "group_expenses", etag)
+    if unchanged is not None:
+        return unchanged
+
+    return conditional.tag(render(request, "web_ui/group_expenses.html", {
+        "expenses": expenses,
+        "rows_key": fragments.data_key(expenses),
+        "group_id": group_id,
+        "next_cursor": next_cursor,
+        "group_version": await groupcache.agroup_version(group_id)
+    }), etag)
+
+
+async def group_expenses_more(request, group_id):
+    token = await request.session.aget("auth_token")
+    if not token:
+        return JsonResponse({"error": "Not logged in"}, status=401)
+
+    expenses, next_cursor = await load_history(request, group_id)
+    html = render_to_string("web_ui/_expense_rows.html", {
+        "expenses": expenses,
+        "rows_key": fragments.data_key(expenses),
+        "group_id": group_id,
+        "group_version": await groupcache.agroup_version(group_id)
+    }, request=request)
+    return JsonResponse({"html": html, "next_cursor": next_cursor, "stale": metrics.served_stale()})
+
+
+async def chat_page(request, group_id):
+    token = await request.session.aget("auth_token")
+    if not token: return redirect('login')
+
+    # Resolve the username here so chat_context never blocks on the sync client.
+    username = get_current_username(request)
+    if not request.session.get('username') and not (identity.get_claims(request.session) or {}).get('username'):
+        members = await groupcache.acached_members(request, group_id)
+        if members is None:
+            try:
+                members, fresh = loaders.members(await async_backend.get(loaders.members_path(group_id), token=token))
+            except httpx.HTTPError:
+                members, fresh = None, False
+            if fresh:
+                await groupcache.astore_members(group_id, members)
+        name = loaders.username_in(members, get_current_user_id(request))
+        if name:
+            username = request.session['username'] = name
+
+    return render(request, "web_ui/chat.html", chat_context(request, group_id, username))
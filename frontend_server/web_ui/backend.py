@@ -0,0 +1,379 @@
+"""Pooled HTTP client for the Go backend.
+
+All views go through ``get`` / ``post`` here instead of calling ``requests``
+directly, so connection reuse, timeouts, retries and the bearer token are
+handled in one place.
+
+Identical concurrent GETs (same URL, same headers, so the same user scope)
+are coalesced: the first caller sends the request and the others wait for
+its response instead of sending their own. ``singleflight_stats`` counts
+both.
+
+Each endpoint family has a circuit breaker (``web_ui.breaker``): while the
+backend keeps failing, calls raise ``CircuitOpen`` straight away. A GET that
+fails, or is refused by the breaker, falls back to the last good response
+for the same URL and user, marked with ``is_stale``. That copy also carries
+the backend's ETag: GETs revalidate it with ``If-None-Match`` and a 304 is
+answered from the cached body.
+"""
+import contextvars
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import caches
+
+from . import breaker, metrics
+
+logger = logging.getLogger(__name__)
+
+RESPONSES_CACHE = 'backend_responses'
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+_flight_stats = Counter()
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_family(path):
+    """'/api/groups/7/members?x=1' -> '/api/groups/{id}/members'."""
+    return _ID_RE.sub('/{id}', path.split('?', 1)[0])
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.BACKEND_RETRIES,
+        connect=settings.BACKEND_RETRIES,
+        read=settings.BACKEND_RETRIES,
+        status=settings.BACKEND_RETRIES,
+        backoff_factor=settings.BACKEND_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=settings.BACKEND_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _build_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.BACKEND_FANOUT_WORKERS,
+        thread_name_prefix='backend-fanout',
+    )
+
+
+def get_session():
+    """Process-wide session; created lazily so settings overrides apply."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _session_lock:
+            if _executor is None:
+                _executor = _build_executor()
+    return _executor
+
+
+def reset_session():
+    """Drop the pooled session (tests, or after changing pool settings)."""
+    global _session, _executor
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _session = None
+        _executor = None
+
+
+def url_for(path):
+    return f"{settings.GO_BACKEND_URL}{path}"
+
+
+def timeout_for(path, deadline=None):
+    timeouts = settings.BACKEND_TIMEOUTS
+    connect, read = timeouts.get(endpoint_family(path), timeouts['default'])
+    if deadline is not None:
+        # Never wait on a socket past the page's overall deadline.
+        left = max(deadline.remaining(), 0.01)
+        connect, read = min(connect, left), min(read, left)
+    return (connect, read)
+
+
+class Deadline:
+    """One latency budget shared by several backend calls."""
+
+    def __init__(self, seconds=None):
+        if seconds is None:
+            seconds = settings.BACKEND_FANOUT_DEADLINE
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """The endpoint family's circuit is open; the call was not sent."""
+
+
+def never_sent(exc):
+    """Whether a failed call certainly never reached the backend (refused,
+    connect timeout, open circuit). Anything else may have been applied."""
+    if isinstance(exc, (CircuitOpen, requests.exceptions.ConnectTimeout)):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+def responses():
+    """The cache holding last good responses (``BACKEND_STALE_TTL``)."""
+    return caches[RESPONSES_CACHE]
+
+
+def response_key(url, headers):
+    """Cache key of the last good response for this URL and user."""
+    scope = headers.get('Authorization', '')
+    return 'backend:' + hashlib.sha1(f'{url}\0{scope}'.encode()).hexdigest()
+
+
+def is_stale(response):
+    """Whether ``response`` is a last good copy served during an outage."""
+    return getattr(response, 'stale', False)
+
+
+def last_good(url, headers):
+    """``(etag, body)`` of the last 200 for this URL and user, or None."""
+    if not settings.BACKEND_STALE_TTL:
+        return None
+    return responses().get(response_key(url, headers))
+
+
+def _remember(url, headers, res):
+    if settings.BACKEND_STALE_TTL and res.status_code == 200 and isinstance(res.content, bytes):
+        entry = (res.headers.get('ETag'), res.content)
+        responses().set(response_key(url, headers), entry, settings.BACKEND_STALE_TTL)
+
+
+def _from_cache(url, entry, family=None):
+    """A 200 response rebuilt from a cache entry; stale if ``family`` is given."""
+    res = requests.Response()
+    res.status_code = 200
+    res._content = entry[1]
+    res.headers['Content-Type'] = 'application/json'
+    if entry[0]:
+        res.headers['ETag'] = entry[0]
+    res.url = url
+    res.stale = family is not None
+    if res.stale:
+        metrics.record_stale(family)
+    return metrics.time_json(res)
+
+
+def auth_headers(request=None, token=None):
+    """Authorization header for the logged-in user, if any."""
+    if token is None and request is not None:
+        token = request.session.get('auth_token')
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def singleflight_stats():
+    """``{"sent": n, "coalesced": n}`` GETs since start (or the last reset)."""
+    with _flights_lock:
+        return {"sent": _flight_stats["sent"], "coalesced": _flight_stats["coalesced"]}
+
+
+def count_flight(coalesced):
+    result = "coalesced" if coalesced else "sent"
+    with _flights_lock:
+        _flight_stats[result] += 1
+    metrics.inc('web_ui_singleflight_total', result=result)
+
+
+def reset_singleflight_stats():
+    with _flights_lock:
+        _flight_stats.clear()
+
+
+def _single_flight(key, send, timeout, family):
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    count_flight(coalesced=not leader)
+
+    if leader:
+        try:
+            flight.response = send()
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                _flights.pop(key, None)
+            flight.done.set()
+
+    started = time.perf_counter()
+    finished = flight.done.wait(sum(timeout) if isinstance(timeout, tuple) else timeout)
+    status = getattr(flight.response, 'status_code', 'error')
+    metrics.record_backend(family, status, time.perf_counter() - started, shared=True)
+    if not finished:
+        raise requests.exceptions.Timeout(f"Timed out waiting on a shared request for {key[0]}")
+    if flight.error is not None:
+        raise flight.error
+    return flight.response
+
+
+def call(method, path, request=None, token=None, headers=None, timeout=None, deadline=None, **kwargs):
+    """Send one request to the Go backend and return the ``requests.Response``.
+
+    Raises ``requests.exceptions.RequestException`` on connection errors and
+    timeouts, exactly like calling ``requests`` directly, and ``CircuitOpen``
+    (a ``ConnectionError``) when the breaker refuses the call. A coalesced GET
+    returns the same response object to every waiting caller, so treat it as
+    read-only. A GET that fails or gets a 5xx returns the last good response
+    instead, if there is one (see ``is_stale``); one answered 304 returns the
+    cached copy as a fresh 200.
+    """
+    all_headers = auth_headers(request, token)
+    if headers:
+        all_headers.update(headers)
+    timeout = timeout or timeout_for(path, deadline)
+    url = url_for(path)
+    family = endpoint_family(path)
+    entry = last_good(url, all_headers) if method == 'GET' else None
+    if entry is not None and entry[0]:
+        all_headers.setdefault('If-None-Match', entry[0])
+
+    def send():
+        if not breaker.allow(family):
+            raise CircuitOpen(f"Circuit open for {family}")
+        started = time.perf_counter()
+        ok = False
+        try:
+            res = get_session().request(method, url, headers=all_headers, timeout=timeout, **kwargs)
+            ok = res.status_code < 500
+        except requests.exceptions.RequestException:
+            metrics.record_backend(family, 'error', time.perf_counter() - started)
+            raise
+        finally:
+            breaker.record(family, ok)
+        body = res.content
+        metrics.record_backend(
+            family, res.status_code, time.perf_counter() - started, len(body) if isinstance(body, bytes) else 0
+        )
+        if method == 'GET':
+            if res.status_code == 304 and entry is not None:
+                responses().touch(response_key(url, all_headers), settings.BACKEND_STALE_TTL)
+                return _from_cache(url, entry)
+            _remember(url, all_headers, res)
+        return metrics.time_json(res)
+
+    if method != 'GET':
+        return send()
+    try:
+        if not kwargs and settings.BACKEND_SINGLE_FLIGHT:
+            res = _single_flight((url, tuple(sorted(all_headers.items()))), send, timeout, family)
+        else:
+            res = send()
+    except requests.exceptions.RequestException:
+        if entry is None:
+            raise
+        return _from_cache(url, entry, family)
+    if res.status_code >= 500 and entry is not None:
+        return _from_cache(url, entry, family)
+    return res
+
+
+def get(path, request=None, **kwargs):
+    return call('GET', path, request=request, **kwargs)
+
+
+def post(path, request=None, **kwargs):
+    return call('POST', path, request=request, **kwargs)
+
+
+def fetch_all(paths, request=None, deadline=None):
+    """GET several independent endpoints concurrently.
+
+    ``paths`` maps a caller-chosen key to a backend path. Returns the same keys
+    mapped to a ``requests.Response``, or ``None`` if that call failed or did
+    not finish before the shared ``deadline``. One slow or broken endpoint
+    never takes the others down with it.
+    """
+    calls = {key: ('GET', path, {}) for key, path in paths.items()}
+    return send_all(calls, request, deadline)
+
+
+def send_all(calls, request=None, deadline=None):
+    """Run independent backend calls on the shared pool under one deadline.
+
+    ``calls`` maps a key to ``(method, path, kwargs)``; results are as for
+    ``fetch_all``. At most ``BACKEND_FANOUT_WORKERS`` run at once.
+    """
+    if deadline is None:
+        deadline = Deadline()
+    token = request.session.get('auth_token') if request is not None else None
+    # Each call runs in a copy of this request's context so its timings are
+    # recorded against the request that fanned it out.
+    futures = {
+        key: get_executor().submit(
+            contextvars.copy_context().run, call, method, path, token=token, deadline=deadline, **kwargs
+        )
+        for key, (method, path, kwargs) in calls.items()
+    }
+    wait(futures.values(), timeout=max(deadline.remaining(), 0))
+
+    results = {}
+    for key, future in futures.items():
+        path = calls[key][1]
+        results[key] = None
+        if not future.done():
+            future.cancel()
+            logger.warning("backend fan-out: %s missed the deadline", path)
+            continue
+        try:
+            results[key] = future.result()
+        except requests.exceptions.RequestException as e:
+            logger.warning("backend fan-out: %s failed: %s", path, e)
+    return results
@@ -0,0 +1,90 @@
+"""Circuit breaker for the Go backend, one circuit per endpoint family.
+
+A circuit opens after ``BACKEND_BREAKER_THRESHOLD`` consecutive failures
+(connection errors, timeouts, 5xx) and then fails calls immediately instead
+of letting every view wait out its own timeout. After
+``BACKEND_BREAKER_RESET`` seconds it goes half-open and lets a single probe
+through: success closes it, failure opens it again. State is per process.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_lock = threading.Lock()
+_circuits = {}
+
+metrics.describe('web_ui_breaker_opened_total', 'counter', 'Times a backend circuit opened, by endpoint family.')
+metrics.describe('web_ui_breaker_rejected_total', 'counter', 'Backend calls failed fast by an open circuit.')
+metrics.describe('web_ui_breaker_open', 'gauge', 'Backend circuits currently not closed (1 open, 0.5 half-open).')
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+
+def _circuit(family):
+    c = _circuits.get(family)
+    if c is None:
+        c = _circuits[family] = _Circuit()
+    return c
+
+
+def allow(family):
+    """Whether a call to ``family`` may go out now."""
+    with _lock:
+        c = _circuit(family)
+        if c.state == OPEN:
+            if time.monotonic() - c.opened_at < settings.BACKEND_BREAKER_RESET:
+                allowed = False
+            else:
+                c.state, c.probing = HALF_OPEN, False
+        if c.state == HALF_OPEN:
+            allowed = not c.probing
+            c.probing = True
+        elif c.state == CLOSED:
+            allowed = True
+    if not allowed:
+        metrics.inc('web_ui_breaker_rejected_total', endpoint=family)
+    return allowed
+
+
+def record(family, ok):
+    """Report the outcome of a call that ``allow`` let through."""
+    with _lock:
+        c = _circuit(family)
+        if ok:
+            c.state, c.failures, c.probing = CLOSED, 0, False
+            return
+        c.failures += 1
+        if c.state == HALF_OPEN or c.failures >= settings.BACKEND_BREAKER_THRESHOLD:
+            opened = c.state != OPEN
+            c.state, c.opened_at, c.probing = OPEN, time.monotonic(), False
+        else:
+            opened = False
+    if opened:
+        metrics.inc('web_ui_breaker_opened_total', endpoint=family)
+
+
+def state(family):
+    with _lock:
+        return _circuit(family).state
+
+
+def states():
+    """``{family: state}`` for every family called so far."""
+    with _lock:
+        return {family: c.state for family, c in _circuits.items()}
+
+
+def reset():
+    with _lock:
+        _circuits.clear()
@@ -0,0 +1,76 @@
+"""Parsing for bulk expense entry (pasted text or an uploaded CSV).
+
+One expense per line::
+
+    amount, description, split_mode, members
+
+``split_mode`` is one of ``splits.SPLIT_MODES``: ``equal_all`` (members
+ignored), ``equal_subset`` (members is ``alice;bob``), or ``custom`` /
+``percentage`` / ``shares`` (members is ``alice:120;bob:80``). Members may be
+given by username or user id. A header row starting with "amount" is
+skipped.
+"""
+import csv
+import io
+
+from .splits import SPLIT_MODES, to_cents
+
+
+def read_rows(text):
+    """CSV text -> list of ``(line_number, [cells])``, skipping blanks/header."""
+    rows = []
+    for line_no, cells in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cells = [c.strip() for c in cells]
+        if not any(cells):
+            continue
+        if line_no == 1 and cells[0].lower() == "amount":
+            continue
+        rows.append((line_no, cells))
+    return rows
+
+
+def resolve_member(token, members):
+    """Username or id from the members column -> user id, or None."""
+    for m in members:
+        if token == str(m['id']) or token.lower() == str(m['username']).lower():
+            return int(m['id'])
+    return None
+
+
+def parse_row(cells, members):
+    """Cells of one row -> dict of split inputs, or raise ValueError.
+
+    ``amount`` is in cents; ``values`` maps user id -> the typed value.
+    """
+    if len(cells) < 2:
+        raise ValueError("Expected at least amount and description")
+    amount_str, description = cells[0], cells[1]
+    split_mode = (cells[2] if len(cells) > 2 and cells[2] else "equal_all").lower()
+    member_spec = cells[3] if len(cells) > 3 else ""
+
+    amount = to_cents(amount_str)
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    if not description:
+        raise ValueError("Description is required")
+    if split_mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode: {split_mode}")
+
+    selected_ids, values = [], {}
+    for part in filter(None, (p.strip() for p in member_spec.split(";"))):
+        name, _, share = part.partition(":")
+        uid = resolve_member(name.strip(), members)
+        if uid is None:
+            raise ValueError(f"Not a group member: {name.strip()}")
+        if split_mode in ("custom", "percentage", "shares"):
+            values[uid] = share.strip()
+        else:
+            selected_ids.append(uid)
+
+    return {
+        "amount": amount,
+        "description": description,
+        "split_mode": split_mode,
+        "selected_ids": selected_ids,
+        "values": values,
+    }
@@ -0,0 +1,341 @@
+"""WebSocket chat relay for ASGI deployments.
+
+Without it every open chat tab holds its own socket to the Go backend's
+``/chat/<group_id>`` and gets its own history replay. With
+``CHAT_RELAY_ENABLED`` the browser connects to ``/ws/chat/<group_id>`` on
+this app instead (``frontend_server.asgi`` hands websocket scopes to
+``application`` below) and each worker process keeps one upstream socket per
+group:
+
+* a ``Hub`` per group fans upstream frames out to its local subscribers and
+  forwards what they send upstream;
+* the group's last ``CHAT_HISTORY_SIZE`` messages stay in a ring buffer, so a
+  new subscriber gets its ``history`` batch without a backend replay;
+* every subscriber has a queue of ``CHAT_CLIENT_QUEUE`` frames. A client that
+  lets it fill up is disconnected (close code 1013) instead of holding up the
+  group or growing memory; its reconnect is served from the ring buffer;
+* live messages arriving within ``CHAT_BATCH_WINDOW`` seconds of each other
+  go out as one ``history`` frame (the shape the page already renders), so a
+  burst costs one frame, one JSON encode and one DOM insert per tab instead
+  of one per message.
+
+Frames to browsers are compressed by the ASGI server when it negotiates
+permessage-deflate (uvicorn does by default); the upstream socket asks for
+it when ``CHAT_DEFLATE`` is set.
+
+The upstream socket comes from ``connect(url)``, which needs the optional
+``websockets`` package; tests and ``bench_chat_relay`` patch in
+``web_ui.fake_backend.FakeChat.connect``.
+"""
+import asyncio
+import json
+import logging
+import re
+import weakref
+from collections import deque
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http.cookie import parse_cookie
+
+from . import metrics
+
+try:
+    import websockets
+except ImportError:  # optional; only needed with CHAT_RELAY_ENABLED
+    websockets = None
+
+logger = logging.getLogger(__name__)
+
+PATH_RE = re.compile(r'/ws/chat/(\d+)/?')
+
+# Close codes sent to browsers.
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+
+UNAVAILABLE = json.dumps({"type": "error", "message": "Chat is reconnecting, please try again in a moment."})
+
+metrics.describe('web_ui_chat_upstream_connects_total', 'counter', 'Upstream chat sockets opened, by result.')
+metrics.describe('web_ui_chat_frames_total', 'counter', 'Chat frames relayed, by direction.')
+metrics.describe('web_ui_chat_messages_total', 'counter', 'Live chat messages fanned out, batched into fewer frames.')
+metrics.describe('web_ui_chat_slow_clients_total', 'counter', 'Chat clients disconnected for not keeping up.')
+metrics.describe('web_ui_chat_clients', 'gauge', 'Chat sockets relayed by this process.')
+metrics.describe('web_ui_chat_upstreams', 'gauge', 'Upstream chat sockets open for the relayed ones.')
+
+# loop -> {group_id: Hub}; like httpx clients, hubs belong to one event loop.
+_hubs = weakref.WeakKeyDictionary()
+
+
+async def connect(url):
+    """Open the upstream socket for one group."""
+    if websockets is None:
+        raise RuntimeError("The chat relay needs the websockets package")
+    return await websockets.connect(url, compression='deflate' if settings.CHAT_DEFLATE else None)
+
+
+def _message_id(message):
+    return message.get('messageID') or message.get('MessageID')
+
+
+class Hub:
+    """One group's upstream socket, local subscribers and recent messages."""
+
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.url = f"{settings.WS_BACKEND_URL.rstrip('/')}/chat/{group_id}"
+        self.history = deque(maxlen=settings.CHAT_HISTORY_SIZE)
+        self.primed = False  # the backend's history batch has arrived
+        self.subscribers = set()
+        self.upstream = None
+        self._newest = None  # highest message id seen
+        self._task = None
+        self._linger = None
+        self._pending = []  # live messages waiting for the batch window
+        self._flush_at = None
+
+    def subscribe(self):
+        # Pending messages are already in the ring buffer; send them to the
+        # existing subscribers first so the newcomer doesn't get them twice.
+        self._flush()
+        queue = asyncio.Queue(max(settings.CHAT_CLIENT_QUEUE, 1))
+        if self.primed:
+            queue.put_nowait(self._history_frame(list(self.history)))
+        self.subscribers.add(queue)
+        if self._linger is not None:
+            self._linger.cancel()
+            self._linger = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._linger is None:
+            # Keep the upstream socket (and history) across page reloads.
+            self._linger = asyncio.get_running_loop().call_later(settings.CHAT_UPSTREAM_LINGER, self.close)
+
+    def close(self):
+        self._linger = None
+        if self.subscribers:
+            return
+        hubs = _hubs.get(asyncio.get_running_loop(), {})
+        if hubs.get(self.group_id) is self:
+            del hubs[self.group_id]
+        if self._flush_at is not None:
+            self._flush_at.cancel()
+            self._flush_at = None
+        if self._task is not None:
+            self._task.cancel()
+
+    async def send(self, text):
+        """Forward a client's frame upstream; False while disconnected."""
+        if self.upstream is None:
+            return False
+        try:
+            await self.upstream.send(text)
+        except Exception:
+            logger.warning("chat upstream send failed for group %s", self.group_id, exc_info=True)
+            return False
+        metrics.inc('web_ui_chat_frames_total', direction='upstream')
+        return True
+
+    async def _run(self):
+        delay = 0.5
+        while self.subscribers:
+            try:
+                self.upstream = await connect(self.url)
+                metrics.inc('web_ui_chat_upstream_connects_total', result='ok')
+                while True:
+                    self._receive(await self.upstream.recv())
+                    delay = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if self.upstream is None:
+                    metrics.inc('web_ui_chat_upstream_connects_total', result='error')
+                logger.warning("chat upstream for group %s failed", self.group_id, exc_info=True)
+            finally:
+                upstream, self.upstream = self.upstream, None
+                if upstream is not None:
+                    try:
+                        await upstream.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _receive(self, text):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        kind = data.get('type') or data.get('Type')
+        if kind == 'history':
+            fresh = self._remember(data.get('messages') or [])
+            if not self.primed:
+                self.primed = True
+                self._publish(self._history_frame(list(self.history)))
+            else:
+                # Live messages, or the replay after an upstream reconnect
+                # minus what subscribers already have.
+                self._batch(fresh)
+        elif kind == 'chat':
+            self._batch(self._remember([data]))
+        else:
+            self._flush()
+            self._publish(text)
+
+    def _batch(self, messages):
+        if not messages:
+            return
+        self._pending.extend(messages)
+        if not settings.CHAT_BATCH_WINDOW or len(self._pending) >= settings.CHAT_BATCH_MAX:
+            self._flush()
+        elif self._flush_at is None:
+            self._flush_at = asyncio.get_running_loop().call_later(settings.CHAT_BATCH_WINDOW, self._flush)
+
+    def _flush(self):
+        if self._flush_at is not None:
+            self._flush_at.cancel()
+            self._flush_at = None
+        if self._pending:
+            messages, self._pending = self._pending, []
+            metrics.inc('web_ui_chat_messages_total', len(messages))
+            self._publish(self._history_frame(messages))
+
+    def _remember(self, messages):
+        # Message ids only grow, so anything at or below the newest one seen
+        # is a replay (the backend resends its history on every connect).
+        newest = self._newest
+        fresh = []
+        for message in messages:
+            if not isinstance(message, dict):
+                continue
+            message_id = _message_id(message)
+            if isinstance(message_id, int):
+                if newest is not None and message_id <= newest:
+                    continue
+                self._newest = max(self._newest or 0, message_id)
+            fresh.append(message)
+        self.history.extend(fresh)
+        return fresh
+
+    def _history_frame(self, messages):
+        return json.dumps({"type": "history", "messages": messages})
+
+    def _publish(self, text):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self._drop(queue)
+        metrics.inc('web_ui_chat_frames_total', direction='downstream')
+
+    def _drop(self, queue):
+        self.subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)  # tells the writer to close the socket
+        metrics.inc('web_ui_chat_slow_clients_total')
+
+
+def get_hub(group_id):
+    hubs = _hubs.setdefault(asyncio.get_running_loop(), {})
+    hub = hubs.get(group_id)
+    if hub is None:
+        hub = hubs[group_id] = Hub(group_id)
+    return hub
+
+
+async def aclose():
+    """Drop every hub on the running loop and close their upstream sockets."""
+    hubs = _hubs.pop(asyncio.get_running_loop(), {})
+    tasks = [hub._task for hub in hubs.values() if hub._task is not None]
+    for hub in hubs.values():
+        hub.subscribers.clear()
+        for handle in (hub._linger, hub._flush_at):
+            if handle is not None:
+                handle.cancel()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stats():
+    """Hubs, subscribers and connected upstream sockets in this process."""
+    hubs = [hub for loop_hubs in list(_hubs.values()) for hub in list(loop_hubs.values())]
+    return {
+        'hubs': len(hubs),
+        'clients': sum(len(hub.subscribers) for hub in hubs),
+        'upstreams': sum(hub.upstream is not None for hub in hubs),
+    }
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _same_origin(scope):
+    # Browsers always send Origin on websockets; refuse other sites' pages.
+    origin = _header(scope, b'origin')
+    return origin is None or urlsplit(origin).netloc == _header(scope, b'host')
+
+
+async def _logged_in(scope):
+    cookies = parse_cookie(_header(scope, b'cookie') or '')
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return False
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    return bool(await session.aget('auth_token'))
+
+
+async def _read(hub, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        text = message.get('text')
+        if text is None:
+            text = (message.get('bytes') or b'').decode('utf-8', 'replace')
+        if not await hub.send(text):
+            await send({'type': 'websocket.send', 'text': UNAVAILABLE})
+
+
+async def _write(queue, send):
+    while True:
+        text = await queue.get()
+        if text is None:
+            await send({'type': 'websocket.close', 'code': TRY_AGAIN_LATER})
+            return
+        await send({'type': 'websocket.send', 'text': text})
+
+
+async def application(scope, receive, send):
+    """ASGI app for ``websocket`` scopes."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    match = PATH_RE.fullmatch(scope['path'])
+    if (not settings.CHAT_RELAY_ENABLED or match is None
+            or not _same_origin(scope) or not await _logged_in(scope)):
+        await send({'type': 'websocket.close', 'code': POLICY_VIOLATION})
+        return
+
+    hub = get_hub(int(match.group(1)))
+    queue = hub.subscribe()
+    await send({'type': 'websocket.accept'})
+    reader = asyncio.create_task(_read(hub, receive, send))
+    writer = asyncio.create_task(_write(queue, send))
+    try:
+        await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        reader.cancel()
+        writer.cancel()
+        hub.unsubscribe(queue)
@@ -0,0 +1,44 @@
+"""Conditional GET for pages built from backend data.
+
+A view hashes the data it is about to render into an ETag *before* rendering.
+A browser revalidating with a matching ``If-None-Match`` gets a 304 and the
+template never runs. The tag covers the viewer, whether the data was stale
+and ``PAGE_ETAG_SALT`` (bump it when a deploy changes the templates).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from . import metrics
+
+metrics.describe('web_ui_not_modified_total', 'counter', 'Pages answered 304 without rendering, by view.')
+
+
+def page_etag(request, view, data):
+    payload = [settings.PAGE_ETAG_SALT, view, request.session.get('user_id'), metrics.served_stale(), data]
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def not_modified(request, view, etag):
+    """A 304 if the browser already has this version of the page, else None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    # Pending flash messages are shown (and consumed) by the next render.
+    if len(messages.get_messages(request)):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        return None
+    metrics.inc('web_ui_not_modified_total', view=view)
+    return tag(response, etag)
+
+
+def tag(response, etag):
+    """Mark a rendered page with ``etag``; browsers must revalidate it."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
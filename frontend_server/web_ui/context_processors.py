@@ -0,0 +1,18 @@
+from django.conf import settings
+
+from . import metrics
+
+
+def assets(request):
+    """Lets base.html pick the prebuilt stylesheet over the Tailwind CDN."""
+    return {"TAILWIND_PREBUILT": settings.TAILWIND_PREBUILT}
+
+
+def backend_status(request):
+    """``backend_stale`` makes base.html say the page shows last known data."""
+    return {"backend_stale": metrics.served_stale()}
+
+
+def fragments(request):
+    """Expiry for the ``{% cache %}`` blocks in the group pages."""
+    return {"FRAGMENT_CACHE_TTL": settings.FRAGMENT_CACHE_TTL}
@@ -0,0 +1,181 @@
+"""Local debt simplification, in integer cents.
+
+Used when ``/api/groups/{id}/simplify`` is slow or down, and optionally to
+cross-check its answer. Net balances come from the group's activity feed:
+an expense credits its payer and debits each of its ``splits``, a settlement
+credits the payer and debits the payee. Positive balance = is owed money.
+An expense without ``splits`` can't be booked (it may have been a custom
+split, or made before someone joined), so such a feed raises
+``IncompleteLedger`` rather than produce a guessed plan.
+
+``settle_greedy`` repeatedly matches the largest debtor with the largest
+creditor (two heaps, O(n log n)); it needs at most n - 1 transfers.
+``settle_exact`` finds the fewest transfers by splitting the group into as
+many zero-sum subsets as possible; it is exponential, so ``simplify`` only
+uses it for up to ``EXACT_MAX_MEMBERS`` non-zero balances.
+"""
+import heapq
+import logging
+
+from .splits import from_cents, to_cents
+
+try:
+    import numpy as np
+except ImportError:  # optional; only speeds up very large ledgers
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EXACT_MAX_MEMBERS = 12
+NUMPY_MIN_ENTRIES = 10_000
+
+
+def aggregate(user_ids, deltas):
+    """Sum parallel ``user_ids`` / ``deltas`` (cents) into ``{user_id: cents}``."""
+    if np is not None and len(deltas) >= NUMPY_MIN_ENTRIES:
+        uniq, idx = np.unique(np.asarray(user_ids, dtype=np.int64), return_inverse=True)
+        totals = np.zeros(len(uniq), dtype=np.int64)
+        np.add.at(totals, idx, np.asarray(deltas, dtype=np.int64))
+        return dict(zip(uniq.tolist(), totals.tolist()))
+    totals = {}
+    for uid, delta in zip(user_ids, deltas):
+        totals[uid] = totals.get(uid, 0) + delta
+    return totals
+
+
+class IncompleteLedger(ValueError):
+    """The activity feed doesn't say how every expense was split."""
+
+
+def ledger_entries(activity):
+    """Activity items -> parallel ``(user_ids, deltas)`` lists in cents."""
+    user_ids, deltas = [], []
+    for item in activity:
+        payer = item.get('payer_id')
+        amount = to_cents(item.get('amount') or 0)
+        if not payer or amount <= 0:
+            continue
+        payee = item.get('payee_id')
+        if payee:
+            user_ids += [payer, payee]
+            deltas += [amount, -amount]
+            continue
+        if not item.get('splits'):
+            raise IncompleteLedger(f"activity item {item.get('id')} has no splits")
+        shares = [(s['user_id'], to_cents(s['amount'])) for s in item['splits']]
+        user_ids.append(payer)
+        deltas.append(sum(c for _, c in shares))
+        for uid, cents in shares:
+            user_ids.append(uid)
+            deltas.append(-cents)
+    return user_ids, deltas
+
+
+def balances_from_activity(activity):
+    """``{user_id: net cents}`` for the group, zero balances dropped."""
+    totals = aggregate(*ledger_entries(activity))
+    return {uid: c for uid, c in totals.items() if c}
+
+
+def settle_greedy(balances):
+    """``[(from_id, to_id, cents), ...]`` settling ``balances`` in at most n - 1 transfers."""
+    debtors = [(c, uid) for uid, c in balances.items() if c < 0]
+    creditors = [(-c, uid) for uid, c in balances.items() if c > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    transfers = []
+    while debtors and creditors:
+        owed, debtor = heapq.heappop(debtors)
+        due, creditor = heapq.heappop(creditors)
+        paid = min(-owed, -due)
+        transfers.append((debtor, creditor, paid))
+        if owed + paid:
+            heapq.heappush(debtors, (owed + paid, debtor))
+        if due + paid:
+            heapq.heappush(creditors, (due + paid, creditor))
+    return transfers
+
+
+def settle_exact(balances):
+    """Fewest transfers: greedy within each of the most zero-sum subsets."""
+    ids = [uid for uid, c in balances.items() if c]
+    n = len(ids)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + balances[ids[low.bit_length() - 1]]
+        best[mask] = max(best[mask ^ (1 << i)] for i in range(n) if mask >> i & 1) + (sums[mask] == 0)
+
+    # Walk back down; every zero-sum mask on the way closes one subset.
+    transfers, group, mask = [], [], full
+    while mask:
+        i = max((i for i in range(n) if mask >> i & 1), key=lambda i: best[mask ^ (1 << i)])
+        group.append(ids[i])
+        mask ^= 1 << i
+        if sums[mask] == 0:
+            transfers += settle_greedy({uid: balances[uid] for uid in group})
+            group = []
+    return transfers
+
+
+def simplify(balances, exact=None):
+    """Settle ``balances``; ``exact`` defaults to on for small groups."""
+    if exact is None:
+        exact = sum(1 for c in balances.values() if c) <= EXACT_MAX_MEMBERS
+    return settle_exact(balances) if exact else settle_greedy(balances)
+
+
+def to_txns(transfers, user_map):
+    """Transfers in the shape ``/api/groups/{id}/simplify`` returns."""
+    return [
+        {
+            "from": debtor,
+            "to": creditor,
+            "amount": from_cents(cents),
+            "from_username": user_map.get(debtor, f"User {debtor}"),
+            "to_username": user_map.get(creditor, f"User {creditor}"),
+        }
+        for debtor, creditor, cents in transfers
+    ]
+
+
+def local_txns(activity, members):
+    """Simplified transactions computed here from the activity feed, or None
+    when the feed or the member list can't be trusted for it."""
+    try:
+        user_map = {int(m['id']): m['username'] for m in members}
+        balances = balances_from_activity(activity)
+    except IncompleteLedger as e:
+        logger.info("local simplify skipped: %s", e)
+        return None
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("local simplify skipped: malformed data: %r", e)
+        return None
+    return to_txns(simplify(balances), user_map)
+
+
+def cross_check(group_id, txns, activity):
+    """Log when the backend's transactions don't settle the local balances.
+
+    Returns True when they agree (to within a cent per transaction), None
+    when the feed doesn't carry enough to tell.
+    """
+    try:
+        expected = balances_from_activity(activity)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.info("simplify cross-check: group %s skipped: %s", group_id, e)
+        return None
+    balances = dict(expected)
+    for t in txns:
+        cents = to_cents(t.get('amount') or 0)
+        balances[t.get('from')] = balances.get(t.get('from'), 0) + cents
+        balances[t.get('to')] = balances.get(t.get('to'), 0) - cents
+    off = {uid: c for uid, c in balances.items() if abs(c) > len(txns)}
+    if off:
+        logger.warning("simplify cross-check: group %s left unsettled by backend: %s", group_id, off)
+    local = len(simplify(expected))
+    if len(txns) > local:
+        logger.info("simplify cross-check: group %s backend used %d transfers, local %d", group_id, len(txns), local)
+    return not off
@@ -0,0 +1,365 @@
+"""Local stand-in for the Go backend, for benchmarks and tests.
+
+Serves canned JSON for the endpoints the views call, with a configurable
+per-request latency (optionally per endpoint family) and payload sizes, on a
+background thread::
+
+    with FakeBackend(latency=0.05, members=20, activity=200) as fake:
+        settings.GO_BACKEND_URL = fake.url
+
+or on its own, for pointing a dev server at::
+
+    python -m web_ui.fake_backend --port 8080 --latency 0.02
+
+``FakeChat`` stands in for the backend's chat sockets in process, and
+``WebSocketClient`` plays a browser against an ASGI websocket app; together
+they drive ``web_ui.chat_relay`` without a server or the websockets package.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def make_token(user_id, username, ttl=3600):
+    """An unsigned JWT with the claims the views read."""
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+    claims = {"user_id": user_id, "username": username, "exp": int(time.time()) + ttl}
+    return f"{part({'alg': 'none'})}.{part(claims)}.fake"
+
+
+class FakeData:
+    """The canned state behind the fake; ``text_size`` pads descriptions and
+    chat messages to that many characters to grow payloads."""
+
+    def __init__(self, groups=3, members=5, activity=50, chat=100, text_size=0):
+        self.groups = [
+            {"id": g, "name": f"Group {g}", "join_code": f"CODE{g:04d}"}
+            for g in range(1, groups + 1)
+        ]
+        self.members = [{"id": u, "username": f"user{u}"} for u in range(1, members + 1)]
+        self.activity = [
+            {
+                "id": i,
+                "amount": 10 + i % 90,
+                "description": f"Expense {i}".ljust(text_size, '.'),
+                "payer_id": 1 + i % members,
+                "payee_id": 0,
+                "created_at": f"2026-01-{1 + i % 28:02d}T12:00:00Z",
+            }
+            for i in range(activity, 0, -1)
+        ]
+        self.simplify = [
+            {"from": u, "to": 1, "amount": 5 * u, "from_username": f"user{u}", "to_username": "user1"}
+            for u in range(2, members + 1)
+        ]
+        self.chat = [
+            {
+                "messageID": i,
+                "userID": 1 + i % members,
+                "username": f"user{1 + i % members}",
+                "message": f"Message {i}".ljust(text_size, '.'),
+                "created_at": f"2026-01-{1 + i % 28:02d}T12:00:00Z",
+            }
+            for i in range(1, chat + 1)
+        ]
+        # Paths that answer 500, to exercise the views' failure handling.
+        self.down = set()
+
+    def route(self, method, path, body=None):
+        """Return (status, body) for a request; ``body`` is the decoded JSON sent."""
+        url = urlsplit(path)
+        path, query = url.path, parse_qs(url.query)
+        if path in self.down:
+            return 500, {"error": "unavailable"}
+        if method == 'GET':
+            if path == '/api/groups':
+                return 200, self.groups
+            if path == '/api/dashboard':
+                return 200, {"message": "Welcome back"}
+            m = re.fullmatch(r'/api/groups/\d+/(members|activity|simplify)', path)
+            if m:
+                kind = m.group(1)
+                if kind == 'activity':
+                    return 200, {"activity_feed": self.activity, "chat_history": []}
+                return 200, getattr(self, kind)
+            if re.fullmatch(r'/api/groups/\d+/chat-pagination', path):
+                before = int(query.get('before_id', ['0'])[0] or 0) or len(self.chat) + 1
+                older = [m for m in self.chat if m["messageID"] < before]
+                return 200, {"messages": older[:-51:-1], "has_more": len(older) > 50}
+        if method == 'POST':
+            if path == '/api/login':
+                email = (body or {}).get('email') or ''
+                m = re.fullmatch(r'user(\d+)@example\.com', email)
+                if not m or (body or {}).get('password') == 'wrong':
+                    return 401, {"error": "invalid credentials"}
+                user_id = int(m.group(1))
+                return 200, {"token": make_token(user_id, f"user{user_id}")}
+            if path == '/api/join-group':
+                return 200, {"message": "Joined group"}
+            if path == '/api/create-group':
+                group_id = len(self.groups) + 1
+                group = {"id": group_id, "name": f"Group {group_id}", "join_code": f"CODE{group_id:04d}"}
+                self.groups.append(group)
+                return 200, {"group_id": group_id, "join_code": group["join_code"]}
+            if path in ('/api/expenses', '/api/settlements'):
+                return 201, {"message": "Created"}
+        return 404, {"error": "not found"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, Nagle plus
+    # delayed ACKs add ~40ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        sent = None
+        if length:
+            try:
+                sent = json.loads(self.rfile.read(length))
+            except ValueError:
+                pass
+        path = self.path.split('?', 1)[0]
+        # Counted on arrival, so a slow request a test gave up on can't land
+        # in the next test's counts.
+        with self.server.lock:
+            self.server.hits[path] += 1
+        latency = self.server.latencies.get(_ID_RE.sub('/{id}', path), self.server.latency)
+        if latency:
+            time.sleep(latency)
+        status, body = self.server.data.route(self.command, self.path, sent)
+        raw = json.dumps(body).encode()
+        etag = None
+        if self.server.etags and self.command == 'GET' and status == 200:
+            etag = '"%s"' % hashlib.sha1(raw).hexdigest()[:16]
+            if self.headers.get('If-None-Match') == etag:
+                status, raw = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    do_GET = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog of 5 drops connections under benchmark load.
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on requests that missed their deadline (the deadline
+        # tests do it on purpose); only report real failures.
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeBackend:
+    """``latencies`` maps endpoint families ('/api/groups/{id}/simplify') to
+    seconds, overriding ``latency`` for those. With ``etags`` GETs carry an
+    ETag and answer a matching If-None-Match with 304. Other options go to
+    FakeData."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latencies=None, etags=True, **data_options):
+        self.server = _Server((host, port), _Handler)
+        self.server.etags = etags
+        self.server.latency = latency
+        self.server.latencies = dict(latencies or {})
+        self.server.data = FakeData(**data_options)
+        self.server.hits = Counter()
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def hits(self):
+        """Counter of requests received, keyed by path without query string."""
+        return self.server.hits
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _FakeChatSocket:
+    def __init__(self, chat, group_id):
+        self.chat = chat
+        self.group_id = group_id
+        self.inbox = asyncio.Queue()
+
+    async def send(self, text):
+        self.chat.post(self.group_id, json.loads(text))
+
+    async def recv(self):
+        text = await self.inbox.get()
+        if text is None:
+            raise ConnectionError("chat socket closed")
+        return text
+
+    async def close(self):
+        if self in self.chat.sockets[self.group_id]:
+            self.chat.sockets[self.group_id].discard(self)
+            self.inbox.put_nowait(None)
+
+
+class FakeChat:
+    """The backend's ``/chat/<group_id>`` sockets, in process. ``connect``
+    has the signature of ``chat_relay.connect``; every socket is sent the
+    group's last ``replay`` messages as a ``history`` frame, then each message
+    any socket of the group posts, as a one-message ``history`` frame."""
+
+    def __init__(self, data=None, latency=0.0, replay=50):
+        self.data = data or FakeData()
+        self.latency = latency
+        self.replay = replay
+        self.sockets = defaultdict(set)
+        self.opened = 0
+        self.replayed = 0  # history messages sent on connect
+
+    async def connect(self, url):
+        group_id = int(url.rstrip('/').rsplit('/', 1)[1])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        sock = _FakeChatSocket(self, group_id)
+        self.sockets[group_id].add(sock)
+        self.opened += 1
+        history = self.data.chat[-self.replay:]
+        self.replayed += len(history)
+        sock.inbox.put_nowait(json.dumps({"type": "history", "messages": history}))
+        return sock
+
+    def post(self, group_id, payload):
+        message = {
+            "messageID": len(self.data.chat) + 1,
+            "userID": payload.get("userID"),
+            "username": payload.get("username"),
+            "message": payload.get("message", ""),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        for key in ("file_url", "file_type", "thumb_url", "width", "height"):
+            if payload.get(key):
+                message[key] = payload[key]
+        self.data.chat.append(message)
+        frame = json.dumps({"type": "history", "messages": [message]})
+        for sock in self.sockets[group_id]:
+            sock.inbox.put_nowait(frame)
+        return message
+
+    def drop(self, group_id):
+        """Close every socket of a group, as a backend restart would."""
+        for sock in list(self.sockets[group_id]):
+            self.sockets[group_id].discard(sock)
+            sock.inbox.put_nowait(None)
+
+    @property
+    def open_sockets(self):
+        return sum(len(socks) for socks in self.sockets.values())
+
+
+class WebSocketClient:
+    """A browser tab on an ASGI websocket app, over in-memory queues; with
+    ``buffer`` frames the tab has not read hold up the app's sends::
+
+        tab = WebSocketClient(chat_relay.application, '/ws/chat/1', cookies={...})
+        await tab.connect()
+        frame = await tab.receive_json()
+    """
+
+    def __init__(self, app, path, cookies=None, headers=(), buffer=0):
+        header_list = [(b'host', b'testserver')] + [(k.encode(), v.encode()) for k, v in headers]
+        if cookies:
+            cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+            header_list.append((b'cookie', cookie.encode()))
+        self.scope = {'type': 'websocket', 'path': path, 'headers': header_list, 'subprotocols': []}
+        self.app = app
+        self.to_app = asyncio.Queue()
+        # A bounded buffer makes the app's sends block, like a slow network.
+        self.from_app = asyncio.Queue(buffer)
+        self.close_code = None
+        self.task = None
+
+    async def connect(self):
+        """Open the socket; True if the app accepted it."""
+        self.task = asyncio.create_task(self.app(self.scope, self.to_app.get, self.from_app.put))
+        self.to_app.put_nowait({'type': 'websocket.connect'})
+        message = await self.from_app.get()
+        if message['type'] == 'websocket.close':
+            self.close_code = message.get('code', 1000)
+        return message['type'] == 'websocket.accept'
+
+    async def send_json(self, data):
+        self.to_app.put_nowait({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive(self, timeout=5):
+        """The next frame's text, or None once the app closed the socket."""
+        message = await asyncio.wait_for(self.from_app.get(), timeout)
+        if message['type'] == 'websocket.close':
+            self.close_code = message.get('code', 1000)
+            return None
+        return message.get('text')
+
+    async def receive_json(self, timeout=5):
+        text = await self.receive(timeout)
+        return None if text is None else json.loads(text)
+
+    async def disconnect(self):
+        self.to_app.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        if self.task is not None:
+            await asyncio.wait_for(self.task, 5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--groups', type=int, default=3)
+    parser.add_argument('--members', type=int, default=5)
+    parser.add_argument('--activity', type=int, default=50)
+    parser.add_argument('--chat', type=int, default=100)
+    parser.add_argument('--text-size', type=int, default=0)
+    opts = vars(parser.parse_args(argv))
+    fake = FakeBackend(**opts)
+    print(f"fake Go backend on {fake.url}; log in as user1@example.com")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Cursor pagination for a group's activity feed.
+
+A cursor is ``"<created_at>|<id>"`` of the last item already shown; the next
+page is everything strictly older. The cursor and limit are passed through
+to the backend, and the window is also applied locally, so a backend that
+ignores them still yields a bounded page.
+"""
+import heapq
+from urllib.parse import urlencode
+
+
+def make_cursor(item):
+    return f"{item.get('created_at') or ''}|{item.get('id') or 0}"
+
+
+def parse_cursor(cursor):
+    """Cursor string -> sortable (created_at, id) key, or None."""
+    if not cursor:
+        return None
+    created_at, _, item_id = cursor.partition('|')
+    try:
+        return (created_at, int(item_id or 0))
+    except ValueError:
+        return (created_at, 0)
+
+
+def _key(item):
+    try:
+        item_id = int(item.get('id') or 0)
+    except (TypeError, ValueError):
+        item_id = 0
+    return (item.get('created_at') or '', item_id)
+
+
+def activity_path(group_id, before=None, limit=None):
+    params = {}
+    if before:
+        params['before'] = before
+    if limit:
+        # One extra item tells us whether another page exists.
+        params['limit'] = limit + 1
+    query = f"?{urlencode(params)}" if params else ''
+    return f"/api/groups/{group_id}/activity{query}"
+
+
+def window(activity, before, limit):
+    """Items older than ``before``, newest first, at most ``limit`` of them.
+
+    Returns ``(items, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    bound = parse_cursor(before)
+    older = (item for item in activity if bound is None or _key(item) < bound)
+    # O(n log limit): only the page (plus one look-ahead item) is ever sorted.
+    newest = heapq.nlargest(limit + 1, older, key=_key)
+    page = newest[:limit]
+    next_cursor = make_cursor(page[-1]) if len(newest) > limit else None
+    return page, next_cursor
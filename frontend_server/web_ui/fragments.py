@@ -0,0 +1,161 @@
+"""Rendered-fragment cache for per-group page sections.
+
+The member pickers on the add-expense page, the history rows and the
+settle-up list are wrapped in ``{% cache %}`` blocks keyed on the group's
+data version (``groupcache.group_version``), so every viewer of an unchanged
+group reuses the same rendered HTML. Their keys also carry a digest of the
+data rendered (``data_key``): a fragment rendered from a stale copy, a local
+fallback or "User {id}" names never stands in for the backend's answer. The
+member picker is only cached at all for members (``members_key``). Django's cache tag uses the
+``template_fragments`` cache alias, which is a ``FragmentCache``: a
+``ByteBudgetCache`` (local memory with a byte budget, ``MAX_BYTES``, on top
+of the usual entry limit; also used for the backend's last good responses)
+plus hit/miss counts per fragment.
+"""
+import hashlib
+import json
+import pickle
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.middleware.csrf import get_token
+
+from . import metrics
+
+ALIAS = 'template_fragments'
+
+_MISSING = object()
+_lock = threading.Lock()
+_bytes = {}  # cache name -> bytes held; shared like LocMemCache's storage
+_stats = Counter()  # (fragment, "hit" | "miss") -> count
+
+metrics.describe('web_ui_fragment_cache_total', 'counter', 'Template fragment cache lookups, by fragment and result.')
+metrics.describe('web_ui_fragment_cache_bytes', 'gauge', 'Rendered fragments held in this process, in bytes.')
+metrics.describe('web_ui_fragment_cache_entries', 'gauge', 'Rendered fragments held in this process.')
+
+
+def _fragment(key):
+    # Django's keys look like ":1:template.cache.<fragment>.<md5 of vary_on>".
+    _, _, rest = key.partition('template.cache.')
+    return rest.rsplit('.', 1)[0] if rest else 'other'
+
+
+class ByteBudgetCache(LocMemCache):
+    """``LocMemCache`` that also evicts least recently used entries to stay
+    under ``OPTIONS["MAX_BYTES"]`` of pickled values."""
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._name = name
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', 32 * 1024 * 1024))
+        _bytes.setdefault(name, 0)
+
+    # The _methods below run under self._lock, like LocMemCache's own.
+
+    def _adjust(self, delta):
+        _bytes[self._name] += delta
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        # Drop the old value first, so a _cull() in super()._set() can't pop
+        # (and subtract) it a second time.
+        self._delete(key)
+        super()._set(key, value, timeout)
+        self._adjust(len(value))
+        while _bytes[self._name] > self._max_bytes and len(self._cache) > 1:
+            old_key, old_value = self._cache.popitem()  # least recently used
+            del self._expire_info[old_key]
+            self._adjust(-len(old_value))
+
+    def _delete(self, key):
+        value = self._cache.get(key)
+        deleted = super()._delete(key)
+        if deleted:
+            self._adjust(-len(value))
+        return deleted
+
+    def _cull(self):
+        count = len(self._cache) // self._cull_frequency if self._cull_frequency else len(self._cache)
+        for _ in range(count):
+            key, value = self._cache.popitem()
+            del self._expire_info[key]
+            self._adjust(-len(value))
+
+    def incr(self, key, delta=1, version=None):
+        # LocMemCache.incr writes self._cache directly; go through _set so the
+        # new value's size is counted, keeping the key's expiry.
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                raise ValueError("Key '%s' not found" % key)
+            new_value = pickle.loads(self._cache[key]) + delta
+            expires = self._expire_info[key]
+            self._set(key, pickle.dumps(new_value, self.pickle_protocol))
+            self._expire_info[key] = expires
+        return new_value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            _bytes[self._name] = 0
+
+    def usage(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'bytes': _bytes[self._name], 'max_bytes': self._max_bytes}
+
+
+class FragmentCache(ByteBudgetCache):
+    """``ByteBudgetCache`` counting hits and misses per fragment."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        result = 'miss' if value is _MISSING else 'hit'
+        fragment = _fragment(key)
+        with _lock:
+            _stats[fragment, result] += 1
+        metrics.inc('web_ui_fragment_cache_total', fragment=fragment, result=result)
+        return default if value is _MISSING else value
+
+
+def stats():
+    """Hits and misses per fragment, plus the cache's current size."""
+    with _lock:
+        per_fragment = {}
+        for (fragment, result), count in _stats.items():
+            per_fragment.setdefault(fragment, {'hit': 0, 'miss': 0})[result] = count
+    fragment_cache = caches[ALIAS]
+    usage = fragment_cache.usage() if isinstance(fragment_cache, FragmentCache) else {}
+    return {'fragments': per_fragment, **usage}
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def viewer_key(request):
+    """Varies fragments holding forms per browser: the CSRF token they embed
+    is only valid with that browser's CSRF cookie."""
+    get_token(request)
+    secret = request.META.get('CSRF_COOKIE', '')
+    return hashlib.sha1(f"{request.session.get('user_id')}:{secret}".encode()).hexdigest()
+
+
+def data_key(*parts):
+    """Digest of the data a fragment renders, for its cache key."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def members_key(user_id, members, fresh):
+    """Cache key part for the member picker, or '' to render it uncached:
+    when the list didn't come fresh from the backend or cache, or the viewer
+    isn't in it (the backend refused them; the picker is not theirs to see)."""
+    if not fresh or not members or user_id is None:
+        return ''
+    if not any(m.get('id') == user_id for m in members):
+        return ''
+    return data_key(members)
@@ -0,0 +1,190 @@
+"""Per-group data cached through Django's cache framework.
+
+Membership rarely changes, so ``/api/groups/{id}/members`` is fetched once
+per TTL and shared by every view and every user of that group. A cached list
+is only served to users who appear in it, so the cache never shows a group's
+members to someone the backend would refuse.
+
+The simplified debts of a group are cached the same way, indexed by user so
+each member's balance page is a dict lookup instead of a refetch and filter.
+Writes that change balances (``add_expense``, ``settle_debt``) drop it.
+
+Each group also has a data version, a random token that changes whenever we
+drop one of its caches or the backend's ETag for its activity feed or
+settlement plan changes. Rendered page fragments are keyed on it (see
+``web_ui.fragments``), and so is the newest activity the dashboard shows for
+each group.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def members_key(group_id):
+    return f"group:{group_id}:members"
+
+
+def cached_members(request, group_id):
+    """Cached member list for ``group_id``, or None on a miss.
+
+    ``request`` scopes the hit: the current user must be one of the members.
+    """
+    members = cache.get(members_key(group_id))
+    if members is None:
+        return None
+    user_id = request.session.get('user_id')
+    if user_id is None or not any(m.get('id') == int(user_id) for m in members):
+        return None
+    return members
+
+
+def store_members(group_id, members):
+    cache.set(members_key(group_id), members, settings.MEMBERS_CACHE_TTL)
+
+
+def invalidate_members(group_id):
+    cache.delete(members_key(group_id))
+    bump_version(group_id)
+
+
+def user_map(members):
+    """user_id -> username for labelling activity items."""
+    return {m['id']: m['username'] for m in members}
+
+
+def debts_key(group_id):
+    return f"group:{group_id}:debts"
+
+
+def index_debts(txns):
+    """Simplified transactions -> ``{"all": txns, "by_user": {user_id: txns}}``."""
+    by_user = {}
+    for t in txns:
+        for uid in {t.get('from'), t.get('to')}:
+            if uid is not None:
+                by_user.setdefault(uid, []).append(t)
+    return {"all": txns, "by_user": by_user}
+
+
+def debts_for(index, user_id):
+    """The transactions ``user_id`` pays or receives (all of them if unknown)."""
+    if not user_id:
+        return index["all"]
+    return index["by_user"].get(user_id, [])
+
+
+def cached_debts(group_id):
+    return cache.get(debts_key(group_id))
+
+
+def store_debts(group_id, txns):
+    index = index_debts(txns)
+    cache.set(debts_key(group_id), index, settings.DEBTS_CACHE_TTL)
+    return index
+
+
+def invalidate_debts(group_id):
+    cache.delete(debts_key(group_id))
+    bump_version(group_id)
+
+
+def version_key(group_id):
+    return f"group:{group_id}:version"
+
+
+def group_version(group_id):
+    version = cache.get(version_key(group_id))
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        if not cache.add(version_key(group_id), version, None):
+            version = cache.get(version_key(group_id), version)
+    return version
+
+
+def bump_version(group_id):
+    cache.set(version_key(group_id), uuid.uuid4().hex[:12], None)
+
+
+def observe_activity(group_id, path, etag):
+    """Bump the group's version when the backend's ETag for one of its
+    activity or simplify ``path``s changes, so writes made through other
+    clients show up too."""
+    if not etag:
+        return
+    key = f"group:{group_id}:etag:{path}"
+    if cache.get(key) != etag:
+        cache.set(key, etag, None)
+        bump_version(group_id)
+
+
+def recent_key(group_id, version):
+    return f"group:{group_id}:recent:{version}"
+
+
+def cached_recent(group_id):
+    """The group's newest activity items, unless it changed since they were stored."""
+    return cache.get(recent_key(group_id, group_version(group_id)))
+
+
+def store_recent(group_id, items):
+    cache.set(recent_key(group_id, group_version(group_id)), items, settings.RECENT_ACTIVITY_TTL)
+
+
+async def acached_members(request, group_id):
+    members = await cache.aget(members_key(group_id))
+    if members is None:
+        return None
+    user_id = await request.session.aget('user_id')
+    if user_id is None or not any(m.get('id') == int(user_id) for m in members):
+        return None
+    return members
+
+
+async def astore_members(group_id, members):
+    await cache.aset(members_key(group_id), members, settings.MEMBERS_CACHE_TTL)
+
+
+async def acached_debts(group_id):
+    return await cache.aget(debts_key(group_id))
+
+
+async def astore_debts(group_id, txns):
+    index = index_debts(txns)
+    await cache.aset(debts_key(group_id), index, settings.DEBTS_CACHE_TTL)
+    return index
+
+
+async def ainvalidate_debts(group_id):
+    await cache.adelete(debts_key(group_id))
+    await abump_version(group_id)
+
+
+async def agroup_version(group_id):
+    version = await cache.aget(version_key(group_id))
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        if not await cache.aadd(version_key(group_id), version, None):
+            version = await cache.aget(version_key(group_id), version)
+    return version
+
+
+async def abump_version(group_id):
+    await cache.aset(version_key(group_id), uuid.uuid4().hex[:12], None)
+
+
+async def aobserve_activity(group_id, path, etag):
+    if not etag:
+        return
+    key = f"group:{group_id}:etag:{path}"
+    if await cache.aget(key) != etag:
+        await cache.aset(key, etag, None)
+        await abump_version(group_id)
+
+
+async def acached_recent(group_id):
+    return await cache.aget(recent_key(group_id, await agroup_version(group_id)))
+
+
+async def astore_recent(group_id, items):
+    await cache.aset(recent_key(group_id, await agroup_version(group_id)), items, settings.RECENT_ACTIVITY_TTL)
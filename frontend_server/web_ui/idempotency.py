@@ -0,0 +1,156 @@
+"""Idempotency keys for the write views (add_expense, settle_debt).
+
+Each form render carries a fresh key. The first submit with that key claims
+it in the cache with ``cache.add`` (atomic, and shared across workers when
+the cache is), sends the write, and stores the result for
+``IDEMPOTENCY_TTL`` seconds. A double click or a retry with the same key
+gets the stored result instead of a second ledger row; a submit that
+arrives while the first is still in flight waits for its result. The key is
+also forwarded to the backend as ``Idempotency-Key``.
+
+Results are only kept for responses below 500, so a write that failed on
+the backend's side can be retried with the same form. So can one that
+failed before it was sent (connection refused, open circuit). A write that
+timed out or lost its connection after being sent may have been applied:
+its key is marked ``UNKNOWN`` for ``IDEMPOTENCY_TTL`` and every submit with
+it, the first included, raises ``OutcomeUnknown`` instead of sending again.
+
+The in-flight marker outlives the write it guards (``pending_ttl``: the
+connect plus read timeout of the backend path, plus a margin), so it can't
+expire under a slow write and let a retry send it again.
+``IDEMPOTENCY_WAIT`` only bounds how long a repeat submit waits for it.
+"""
+import asyncio
+import time
+import uuid
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from . import async_backend, backend
+
+PENDING = "pending"
+UNKNOWN = "unknown"
+PENDING_MARGIN = 5  # seconds on top of the write's own timeouts
+_POLL = 0.05
+
+
+class StillRunning(Exception):
+    """Another submit with this key hasn't finished within IDEMPOTENCY_WAIT."""
+
+
+class OutcomeUnknown(Exception):
+    """The write with this key was sent but never answered; it may have been applied."""
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def headers(key):
+    return {"Idempotency-Key": key} if key else {}
+
+
+def _cache_key(request, key):
+    scope = request.session.get('user_id') or request.session.session_key
+    return f"idem:{scope}:{key}"
+
+
+def pending_ttl(path=None):
+    """Seconds a claimed key stays pending: longer than a write to ``path``
+    can take (the longest configured timeout if no path is given)."""
+    if path is None:
+        connect, read = max(settings.BACKEND_TIMEOUTS.values(), key=sum)
+    else:
+        connect, read = backend.timeout_for(path)
+    return max(connect + read + PENDING_MARGIN, settings.IDEMPOTENCY_WAIT)
+
+
+def _raise_unknown(exc, key):
+    # Transport errors become OutcomeUnknown; anything else (a bug, a
+    # cancelled task) propagates as is, with the key still marked.
+    if isinstance(exc, (requests.exceptions.RequestException, httpx.HTTPError)):
+        raise OutcomeUnknown(key) from exc
+    raise exc
+
+
+def final(result):
+    """Whether ``result`` is kept for its key: resubmitting the key replays it."""
+    return result.get("status", 500) < 500
+
+
+def run_once(request, key, send, path=None):
+    """Return ``send()``'s result, calling it at most once per ``key``.
+
+    ``send`` returns a picklable dict with a ``status``; ``path`` is the
+    backend path it writes to. Without a key it is simply called. Raises
+    ``StillRunning`` and ``OutcomeUnknown`` as described above.
+    """
+    if not key:
+        return send()
+    ck = _cache_key(request, key)
+    if cache.add(ck, PENDING, pending_ttl(path)):
+        try:
+            result = send()
+        except BaseException as e:
+            if backend.never_sent(e):
+                cache.delete(ck)
+                raise
+            cache.set(ck, UNKNOWN, settings.IDEMPOTENCY_TTL)
+            _raise_unknown(e, key)
+        if final(result):
+            cache.set(ck, result, settings.IDEMPOTENCY_TTL)
+        else:
+            cache.delete(ck)
+        return result
+
+    give_up = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        result = cache.get(ck)
+        if result is None:
+            # The first attempt failed and released the key: try ourselves.
+            return run_once(request, key, send, path)
+        if result == UNKNOWN:
+            raise OutcomeUnknown(key)
+        if result != PENDING:
+            return result
+        if time.monotonic() > give_up:
+            raise StillRunning(key)
+        time.sleep(_POLL)
+
+
+async def arun_once(request, key, send, path=None):
+    """``run_once`` for the async views; ``send`` is a coroutine function."""
+    if not key:
+        return await send()
+    scope = await request.session.aget('user_id') or request.session.session_key
+    ck = f"idem:{scope}:{key}"
+    if await cache.aadd(ck, PENDING, pending_ttl(path)):
+        try:
+            result = await send()
+        except BaseException as e:
+            if async_backend.never_sent(e):
+                await cache.adelete(ck)
+                raise
+            await cache.aset(ck, UNKNOWN, settings.IDEMPOTENCY_TTL)
+            _raise_unknown(e, key)
+        if final(result):
+            await cache.aset(ck, result, settings.IDEMPOTENCY_TTL)
+        else:
+            await cache.adelete(ck)
+        return result
+
+    give_up = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        result = await cache.aget(ck)
+        if result is None:
+            return await arun_once(request, key, send, path)
+        if result == UNKNOWN:
+            raise OutcomeUnknown(key)
+        if result != PENDING:
+            return result
+        if time.monotonic() > give_up:
+            raise StillRunning(key)
+        await asyncio.sleep(_POLL)
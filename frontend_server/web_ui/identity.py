@@ -0,0 +1,84 @@
+"""Per-session identity cache: decoded JWT claims and the user's group list.
+
+The token is decoded once per login and its claims kept in the session next
+to it, so ``get_current_user_id`` and friends never re-parse it. The group
+list is kept as a short-lived snapshot so the home page doesn't hit
+``/api/groups`` on every view; writes that change it (create/join) drop it.
+"""
+import base64
+import json
+import time
+
+from django.conf import settings
+
+CLAIMS_KEY = 'jwt_claims'
+GROUPS_KEY = 'groups_snapshot'
+
+
+def decode_claims(token):
+    """Payload of a JWT, without verifying it (the Go backend does that)."""
+    try:
+        parts = token.split('.')
+        if len(parts) < 2: return None
+        # Fix padding
+        payload = parts[1] + '=' * (-len(parts[1]) % 4)
+        data = json.loads(base64.urlsafe_b64decode(payload))
+        return data if isinstance(data, dict) else None
+    except Exception as e:
+        print(f"Token decode error: {e}")
+        return None
+
+
+def remember_token(session, token):
+    """Store a fresh login token together with its decoded claims."""
+    session['auth_token'] = token
+    claims = decode_claims(token) or {}
+    session[CLAIMS_KEY] = {'token': token, 'claims': claims}
+    for key in (GROUPS_KEY, 'user_id', 'username'):
+        session.pop(key, None)
+    if claims.get('user_id'):
+        session['user_id'] = int(claims['user_id'])
+    if claims.get('username'):
+        session['username'] = claims['username']
+    return claims
+
+
+def get_claims(session):
+    """Claims of the session's token, decoding it at most once per token."""
+    token = session.get('auth_token')
+    if not token:
+        return None
+    cached = session.get(CLAIMS_KEY)
+    if cached and cached.get('token') == token:
+        return cached['claims']
+    claims = decode_claims(token) or {}
+    session[CLAIMS_KEY] = {'token': token, 'claims': claims}
+    return claims
+
+
+def token_expired(session):
+    claims = get_claims(session) or {}
+    exp = claims.get('exp')
+    return exp is not None and exp <= time.time()
+
+
+def cached_groups(session):
+    """The user's group list if a fresh snapshot exists, else None."""
+    snapshot = session.get(GROUPS_KEY)
+    if not snapshot or snapshot.get('token') != session.get('auth_token'):
+        return None
+    if time.time() - snapshot['at'] > settings.GROUPS_SNAPSHOT_TTL or token_expired(session):
+        return None
+    return snapshot['groups']
+
+
+def store_groups(session, groups):
+    session[GROUPS_KEY] = {
+        'token': session.get('auth_token'),
+        'at': time.time(),
+        'groups': groups,
+    }
+
+
+def invalidate_groups(session):
+    session.pop(GROUPS_KEY, None)
@@ -0,0 +1,153 @@
+"""Backend response handling shared by ``views`` and ``async_views``.
+
+The two view modules differ only in how they talk to the backend and the
+caches (``requests`` and ``groupcache.store_*`` vs. ``httpx`` and
+``groupcache.astore_*``). Everything in between lives here: these functions
+take responses that were already fetched and what was already cached, and
+return the data to render plus what should be written back. They do no I/O.
+"""
+from . import debts, feed, groupcache, overview
+from .backend import is_stale
+
+
+def members_path(group_id):
+    return f"/api/groups/{group_id}/members"
+
+
+def simplify_path(group_id):
+    return f"/api/groups/{group_id}/simplify"
+
+
+def ledger_path(group_id):
+    return f"/api/groups/{group_id}/activity"
+
+
+def etag(res):
+    return res.headers.get('ETag')
+
+
+def members(res):
+    """``(members, fresh)`` from a members response. ``members`` is None when
+    the call failed; ``fresh`` is False for an outage's last good copy."""
+    body = overview.json_body(res, [])
+    if not isinstance(body, list):
+        return None, False
+    return body, not is_stale(res)
+
+
+def members_or_error(res):
+    """``(members, fresh, debug_error)`` for the expense forms."""
+    if res.status_code != 200:
+        return [], False, f"Backend Error {res.status_code}: {res.text}"
+    body, fresh = members(res)
+    if body is None:
+        return [], False, "Backend returned invalid JSON for members."
+    return body, fresh, None
+
+
+def activity(res):
+    """The ``activity_feed`` of an activity response, or None if it failed."""
+    body = overview.json_body(res, {})
+    if not isinstance(body, dict):
+        return None
+    return body.get('activity_feed') or []
+
+
+def plan(res):
+    """``(txns, stale)`` from a simplify response; ``txns`` is None on failure."""
+    txns = overview.json_body(res, [])
+    if not isinstance(txns, list):
+        return None, False
+    return txns, is_stale(res)
+
+
+def username_in(members, user_id):
+    """The username of ``user_id`` among ``members``, or None."""
+    for m in (members or []):
+        if m.get('id') == user_id:
+            return m.get('username')
+    return None
+
+
+def format_activity(activity_feed, user_map):
+    """Shape raw activity_feed items for group_expenses.html."""
+    payload = []
+    for item in activity_feed:
+        payer_id = item.get('payer_id')
+        payee_id = item.get('payee_id') # Usually 0 for expenses, valid ID for settlements
+
+        payer_name = user_map.get(payer_id, f"User {payer_id}")
+        payee_name = user_map.get(payee_id, f"User {payee_id}")
+
+        description = item.get('description', '')
+        # Simple heuristic to detect settlement if payee_id is used
+        is_settlement = (payee_id is not None and payee_id != 0) or ('Payment to' in description)
+
+        payload.append({
+            "amount": item.get('amount'),
+            "description": description,
+            "created_at": item.get('created_at'),
+            "payer_name": payer_name,
+            "payee_name": payee_name,
+            "is_settlement": is_settlement
+        })
+    return payload
+
+
+def history_page(activity_feed, members, before, limit):
+    """``(expenses, next_cursor)``: the requested window, formatted."""
+    window, next_cursor = feed.window(activity_feed or [], before, limit)
+    return format_activity(window, groupcache.user_map(members or [])), next_cursor
+
+
+def local_plan(activity_feed, members, user_id):
+    """``load_debts``' answer when the backend has no plan: ``(txns,
+    computed_locally)`` worked out from the activity feed. ``txns`` is None
+    (no plan at all) unless the feed loaded and records every split."""
+    txns = debts.local_txns(activity_feed, members) if activity_feed is not None else None
+    if txns is None:
+        return None, False
+    # Not cached: the backend's own plan should replace it as soon as it's back.
+    return groupcache.debts_for(groupcache.index_debts(txns), user_id), True
+
+
+def group_parts(group_id, cached, results):
+    """One dashboard group from what was cached plus the fan-out ``results``.
+
+    Returns ``(members, index, recent, store, observed)``: ``store`` maps
+    ``members`` / ``debts`` / ``recent`` to fresh values to cache (``debts``
+    holds the backend's transactions) and ``observed`` lists ``(path, etag)``
+    pairs for ``groupcache.observe_activity``.
+    """
+    group_members, index, recent = cached
+    store, observed = {}, []
+    if group_members is None:
+        group_members, fresh = members(results.get((group_id, 'members')))
+        if fresh:
+            store['members'] = group_members
+    if index is None:
+        res = results.get((group_id, 'simplify'))
+        txns, stale = plan(res)
+        if txns is not None:
+            observed.append((simplify_path(group_id), etag(res)))
+            index = groupcache.index_debts(txns)
+            if not stale:
+                store['debts'] = txns
+    if recent is None:
+        res = results.get((group_id, 'activity'))
+        items = activity(res)
+        if items is not None:
+            recent = overview.recent_items(items)
+            observed.append((overview.activity_path(group_id), etag(res)))
+            if not is_stale(res):
+                store['recent'] = recent
+    return group_members, index, recent, store, observed
+
+
+def group_summary(group, user_id, group_members, index, recent):
+    """The dashboard card for ``group_parts``' result."""
+    return overview.summarise(
+        group, user_id,
+        groupcache.debts_for(index, user_id) if index is not None else None,
+        format_activity(recent, groupcache.user_map(group_members or [])) if recent is not None else None,
+    )
@@ -0,0 +1,23 @@
+"""Shared helpers for the benchmark management commands."""
+import statistics
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(name, latencies, elapsed):
+    """One aligned report line; latencies and elapsed are in seconds."""
+    count = len(latencies)
+    rps = count / elapsed if elapsed else 0.0
+    return (
+        f"{name:<24} n={count:<6} {rps:9.1f} req/s  "
+        f"p50={percentile(latencies, 50) * 1000:7.1f}ms  "
+        f"p95={percentile(latencies, 95) * 1000:7.1f}ms  "
+        f"p99={percentile(latencies, 99) * 1000:7.1f}ms  "
+        f"mean={(statistics.fmean(latencies) if latencies else 0) * 1000:7.1f}ms"
+    )
@@ -0,0 +1,101 @@
+"""Load-test the sync (WSGI) views against the async (ASGI) views.
+
+Both paths run in-process against a local fake Go backend with a fixed
+per-call latency, so the comparison isolates how each serving model copes
+with slow backend I/O::
+
+    python manage.py bench_async --requests 400 --concurrency 100 --latency 0.05
+"""
+import asyncio
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from web_ui import async_views, backend, views
+from web_ui.fake_backend import FakeBackend
+from web_ui.urls import build_urlpatterns
+
+from ._bench import summarize
+
+
+def _urlconf(v):
+    module = types.ModuleType(f"bench_urls_{v.__name__}")
+    module.urlpatterns = [path("", include(build_urlpatterns(v)))]
+    return module
+
+
+class Command(BaseCommand):
+    help = "Compare WSGI (thread per request) and ASGI (async views) throughput against a fake backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help="In-flight requests on the ASGI path.")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Worker threads on the WSGI path (like gunicorn --threads).")
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help="Seconds the fake backend sleeps per call.")
+        parser.add_argument('--path', default='/groups/1/history/')
+
+    def handle(self, **opts):
+        with FakeBackend(latency=opts['latency']) as fake, override_settings(
+            GO_BACKEND_URL=fake.url,
+            ALLOWED_HOSTS=['testserver'],
+            SESSION_ENGINE='django.contrib.sessions.backends.cache',
+            BACKEND_POOL_SIZE=max(opts['threads'], opts['concurrency']),
+            BACKEND_FANOUT_WORKERS=max(opts['threads'], opts['concurrency']) * 2,
+        ):
+            backend.reset_session()
+            session = SessionStore()
+            session['auth_token'] = 'bench-token'
+            session['user_id'] = 1
+            session.save()
+            cookie = session.session_key
+
+            with override_settings(ROOT_URLCONF=_urlconf(views)):
+                self.stdout.write(self._run_wsgi(opts, cookie))
+            with override_settings(ROOT_URLCONF=_urlconf(async_views)):
+                self.stdout.write(asyncio.run(self._run_asgi(opts, cookie)))
+            stats = backend.singleflight_stats()
+            self.stdout.write(f"backend GETs sent={stats['sent']} coalesced={stats['coalesced']}")
+            backend.reset_session()
+
+    def _run_wsgi(self, opts, cookie):
+        local = threading.local()
+
+        def one(_):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+                client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+            start = time.perf_counter()
+            client.get(opts['path'])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts['threads']) as pool:
+            latencies = list(pool.map(one, range(opts['requests'])))
+        return summarize(f"wsgi threads={opts['threads']}", latencies, time.perf_counter() - start)
+
+    async def _run_asgi(self, opts, cookie):
+        gate = asyncio.Semaphore(opts['concurrency'])
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+
+        async def one():
+            async with gate:
+                start = time.perf_counter()
+                await client.get(opts['path'])
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one() for _ in range(opts['requests'])))
+        return summarize(f"asgi inflight={opts['concurrency']}", latencies, time.perf_counter() - start)
@@ -0,0 +1,123 @@
+"""Compare browsers on direct backend chat sockets with the chat relay.
+
+Opens ``--clients`` chat tabs spread over ``--groups`` groups, in process
+against ``web_ui.fake_backend.FakeChat``: once with every tab holding its own
+backend socket (what ``chat.html`` did before the relay), once through
+``web_ui.chat_relay``. Each group then gets ``--messages`` posts and every
+tab must receive all of them. The direct sockets cost no network here, so
+the latency columns show the relay's own overhead; the backend socket and
+replay counts are what it saves. Repeat ``--clients`` to see how both scale::
+
+    python manage.py bench_chat_relay --clients 100 --clients 1000 --clients 5000 --groups 20
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from web_ui import chat_relay
+from web_ui.fake_backend import FakeChat, FakeData, WebSocketClient
+
+from ._bench import percentile
+
+
+async def _deliveries(receive_frame, expected, latencies):
+    """Read frames until ``expected`` timestamped messages have arrived;
+    returns the number of frames that took."""
+    got = frames = 0
+    while got < expected:
+        frame = await receive_frame()
+        frames += 1
+        if frame is None:
+            raise RuntimeError("chat socket closed during the benchmark")
+        now = time.perf_counter()
+        for message in frame.get('messages', []):
+            latencies.append(now - float(message['message']))
+            got += 1
+    return frames
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat tabs on direct backend sockets against the fan-out relay."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, action='append', help="Open tabs (repeatable); default 100 and 1000.")
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--messages', type=int, default=20, help="Posts per group.")
+        parser.add_argument('--interval', type=float, default=0.005, help="Seconds between rounds of posts.")
+        parser.add_argument('--history', type=int, default=50, help="Messages the backend replays per socket.")
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds a backend socket takes to open.")
+        parser.add_argument('--batch-window', type=float, default=settings.CHAT_BATCH_WINDOW,
+                            help="The relay's CHAT_BATCH_WINDOW; 0 sends every message as its own frame.")
+
+    def handle(self, **opts):
+        with override_settings(
+            SESSION_ENGINE='django.contrib.sessions.backends.cache',
+            CHAT_RELAY_ENABLED=True,
+            CHAT_HISTORY_SIZE=opts['history'],
+            CHAT_BATCH_WINDOW=opts['batch_window'],
+            # Room for every post: this measures throughput, not slow clients.
+            CHAT_CLIENT_QUEUE=max(settings.CHAT_CLIENT_QUEUE, opts['messages'] + 2),
+        ):
+            session = SessionStore()
+            session['auth_token'] = 'bench-token'
+            session.save()
+            cookies = {settings.SESSION_COOKIE_NAME: session.session_key}
+            for clients in opts['clients'] or [100, 1000]:
+                for mode in ('direct', 'relay'):
+                    self.stdout.write(asyncio.run(self._run(mode, clients, opts, cookies)))
+
+    async def _run(self, mode, clients, opts, cookies):
+        chat = FakeChat(FakeData(chat=opts['history']), latency=opts['latency'], replay=opts['history'])
+        groups = [1 + i % opts['groups'] for i in range(clients)]
+
+        async def open_tab(group_id):
+            start = time.perf_counter()
+            if mode == 'direct':
+                sock = await chat.connect(f"{settings.WS_BACKEND_URL}/chat/{group_id}")
+
+                async def receive_frame():
+                    return json.loads(await sock.recv())
+            else:
+                tab = WebSocketClient(chat_relay.application, f'/ws/chat/{group_id}', cookies=cookies)
+                if not await tab.connect():
+                    raise RuntimeError(f"relay refused the socket (close code {tab.close_code})")
+                receive_frame = tab.receive_json
+            await receive_frame()  # the history batch
+            return time.perf_counter() - start, receive_frame
+
+        original = chat_relay.connect
+        chat_relay.connect = chat.connect
+        try:
+            started = time.perf_counter()
+            tabs = await asyncio.gather(*(open_tab(g) for g in groups))
+            connect_time = time.perf_counter() - started
+
+            fanout = []
+            readers = [
+                asyncio.create_task(_deliveries(receive_frame, opts['messages'], fanout))
+                for _, receive_frame in tabs
+            ]
+            started = time.perf_counter()
+            for _ in range(opts['messages']):
+                for group_id in range(1, opts['groups'] + 1):
+                    chat.post(group_id, {"message": repr(time.perf_counter()), "userID": 1})
+                await asyncio.sleep(opts['interval'])
+            frames = sum(await asyncio.gather(*readers))
+            fanout_time = time.perf_counter() - started
+        finally:
+            chat_relay.connect = original
+            await chat_relay.aclose()
+
+        connects = [seconds for seconds, _ in tabs]
+        return (
+            f"{mode:<6} clients={clients:<6} backend sockets={chat.opened:<6} "
+            f"backend replayed={chat.replayed:<8} "
+            f"open all={connect_time * 1000:7.1f}ms p95={percentile(connects, 95) * 1000:6.1f}ms  "
+            f"delivered={len(fanout)} in {frames} frames, {fanout_time:.2f}s "
+            f"p50={percentile(fanout, 50) * 1000:6.1f}ms p95={percentile(fanout, 95) * 1000:6.1f}ms"
+        )
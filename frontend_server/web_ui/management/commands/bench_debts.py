@@ -0,0 +1,64 @@
+"""Benchmark the local debt simplifier over a range of group sizes::
+
+    python manage.py bench_debts --members 10 100 1000 10000 --repeat 5
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_ui import debts
+
+from ._bench import summarize
+
+
+def _activity(rng, members, per_member):
+    return [
+        {"payer_id": rng.randint(1, members), "payee_id": 0,
+         "amount": rng.randint(100, 500_000) / 100,
+         "splits": [{"user_id": uid, "amount": 1.0} for uid in rng.sample(range(1, members + 1), min(3, members))]}
+        for _ in range(members * per_member)
+    ]
+
+
+def _time(fn, repeat):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started, result
+
+
+class Command(BaseCommand):
+    help = "Time balance aggregation and greedy/exact debt simplification."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, nargs='+', default=[10, 100, 1000, 10000])
+        parser.add_argument('--per-member', type=int, default=5,
+                            help="Activity items per member in the generated ledger.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, **opts):
+        rng = random.Random(opts['seed'])
+        self.stdout.write(f"numpy aggregation: {'on' if debts.np is not None else 'not installed'}")
+        for size in opts['members']:
+            activity = _activity(rng, size, opts['per_member'])
+            ids = list(range(1, size + 1))
+
+            latencies, elapsed, balances = _time(lambda: debts.balances_from_activity(activity, ids), opts['repeat'])
+            self.stdout.write(summarize(f"balances x{size}", latencies, elapsed))
+
+            latencies, elapsed, greedy = _time(lambda: debts.settle_greedy(balances), opts['repeat'])
+            self.stdout.write(summarize(f"greedy x{size}", latencies, elapsed) + f"  transfers={len(greedy)}")
+
+            # Exact mode is exponential: run it on a zero-sum slice it would accept.
+            small = dict(list(balances.items())[:debts.EXACT_MAX_MEMBERS - 1])
+            small[0] = -sum(small.values())
+            latencies, elapsed, exact = _time(lambda: debts.settle_exact(small), opts['repeat'])
+            self.stdout.write(
+                summarize(f"exact x{len(small)}", latencies, elapsed)
+                + f"  transfers={len(exact)} (greedy {len(debts.settle_greedy(small))})"
+            )
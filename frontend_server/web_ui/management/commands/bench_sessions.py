@@ -0,0 +1,115 @@
+"""Compare session engines under concurrent workers::
+
+    python manage.py bench_sessions --threads 8 --requests 2000
+
+Each simulated request loads a session and reads ``auth_token`` / ``user_id``
+like the views do; ``--write-ratio`` of them also change a key and save, as
+login and the group snapshot do. The database engines use the configured
+DATABASES and are skipped if the sessions table hasn't been migrated.
+"""
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test.utils import override_settings
+
+from ._bench import summarize
+
+ENGINES = {
+    'db': ('django.contrib.sessions.backends.db', None),
+    'cached_db (locmem)': ('django.contrib.sessions.backends.cached_db', 'locmem'),
+    'cache (locmem)': ('django.contrib.sessions.backends.cache', 'locmem'),
+    'cache (file)': ('django.contrib.sessions.backends.cache', 'file'),
+    'signed_cookies': ('django.contrib.sessions.backends.signed_cookies', None),
+}
+
+
+class Command(BaseCommand):
+    help = "Session read/write throughput per engine under concurrent workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--write-ratio', type=float, default=0.1)
+        parser.add_argument('--engine', action='append', choices=list(ENGINES),
+                            help="Only these engines (repeatable); default all.")
+
+    def handle(self, **opts):
+        file_dir = tempfile.mkdtemp(prefix='bench-sessions-')
+        caches = dict(settings.CACHES)
+        caches['bench-locmem'] = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bench-sessions',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+        caches['bench-file'] = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': file_dir,
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+        try:
+            with override_settings(CACHES=caches):
+                for name in opts['engine'] or ENGINES:
+                    engine, cache = ENGINES[name]
+                    if engine.endswith(('.db', '.cached_db')) and not self._has_table():
+                        self.stdout.write(f"{name:<24} skipped: run `manage.py migrate` first")
+                        continue
+                    alias = f"bench-{cache}" if cache else settings.SESSION_CACHE_ALIAS
+                    with override_settings(SESSION_ENGINE=engine, SESSION_CACHE_ALIAS=alias):
+                        self.stdout.write(self._run(name, engine, opts))
+        finally:
+            shutil.rmtree(file_dir, ignore_errors=True)
+
+    def _has_table(self):
+        try:
+            return 'django_session' in connection.introspection.table_names()
+        except DatabaseError:
+            return False
+
+    def _run(self, name, engine, opts):
+        store = import_module(engine).SessionStore
+        rng = random.Random(0)
+        lock = threading.Lock()
+
+        # One session per simulated user, shaped like a logged-in one.
+        keys = []
+        for uid in range(opts['users']):
+            s = store()
+            s.update({
+                'auth_token': 'x' * 180,
+                'user_id': uid,
+                'user_email': f'user{uid}@example.com',
+                'username': f'user{uid}',
+            })
+            s.save()
+            keys.append(s.session_key)
+
+        def one(i):
+            with lock:
+                slot = rng.randrange(len(keys))
+                write = rng.random() < opts['write_ratio']
+            start = time.perf_counter()
+            s = store(session_key=keys[slot])
+            s.get('auth_token'), s.get('user_id')
+            if write:
+                s['username'] = f'user{i}'
+                s.save()
+                keys[slot] = s.session_key
+            return time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts['threads']) as pool:
+            latencies = list(pool.map(one, range(opts['requests'])))
+        elapsed = time.perf_counter() - started
+
+        for key in keys:
+            store(session_key=key).delete()
+        return summarize(name, latencies, elapsed)
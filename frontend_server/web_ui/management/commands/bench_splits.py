@@ -0,0 +1,51 @@
+"""Microbenchmark the split engine for each mode and group size::
+
+    python manage.py bench_splits --members 10 1000 --iterations 2000
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_ui import splits
+
+from ._bench import summarize
+
+
+def _inputs(mode, members, rng):
+    ids = [m['id'] for m in members]
+    if mode == "equal_subset":
+        return ids[::2], None
+    if mode == "custom":
+        cents = splits.allocate(100_000_00, [rng.randint(1, 9) for _ in ids])
+        return (), {uid: f"{c / 100:.2f}" for uid, c in zip(ids, cents)}
+    if mode == "percentage":
+        hundredths = splits.allocate(100_00, [1] * len(ids))
+        return (), {uid: f"{h / 100:.2f}" for uid, h in zip(ids, hundredths)}
+    if mode == "shares":
+        return (), {uid: str(rng.randint(1, 5)) for uid in ids}
+    return (), None
+
+
+class Command(BaseCommand):
+    help = "Time splits.split for every mode over a range of group sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, nargs='+', default=[5, 50, 1000])
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, **opts):
+        rng = random.Random(opts['seed'])
+        for size in opts['members']:
+            members = [{'id': i, 'username': f'user{i}'} for i in range(1, size + 1)]
+            for mode in splits.SPLIT_MODES:
+                selected, values = _inputs(mode, members, rng)
+                latencies = []
+                started = time.perf_counter()
+                for _ in range(opts['iterations']):
+                    t0 = time.perf_counter()
+                    splits.split(100_000_00, mode, members, selected, values)
+                    latencies.append(time.perf_counter() - t0)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(summarize(f"{mode} x{size}", latencies, elapsed))
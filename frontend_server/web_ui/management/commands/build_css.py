@@ -0,0 +1,35 @@
+"""Build the purged, minified Tailwind stylesheet into static/styles.css::
+
+    python manage.py build_css
+
+Needs Node.js; the Tailwind CLI is fetched by npx on first use. Run it before
+collectstatic when deploying with TAILWIND_PREBUILT=1.
+"""
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+TAILWIND_CLI = ['npx', '--yes', 'tailwindcss@3']
+
+
+class Command(BaseCommand):
+    help = "Compile Tailwind ahead of time into static/styles.css."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help="Rebuild on template changes.")
+
+    def handle(self, **opts):
+        cmd = TAILWIND_CLI + [
+            '-c', str(settings.BASE_DIR / 'tailwind.config.js'),
+            '-i', str(settings.BASE_DIR / 'web_ui' / 'tailwind' / 'input.css'),
+            '-o', str(settings.BASE_DIR / 'static' / 'styles.css'),
+            '--watch' if opts['watch'] else '--minify',
+        ]
+        try:
+            subprocess.run(cmd, cwd=settings.BASE_DIR, check=True)
+        except FileNotFoundError:
+            raise CommandError("npx not found; install Node.js to build the stylesheet.")
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Tailwind build failed (exit {e.returncode}).")
+        self.stdout.write(self.style.SUCCESS("Wrote static/styles.css"))
@@ -0,0 +1,243 @@
+"""Drive the views through realistic user flows against a fake Go backend::
+
+    python manage.py loadtest --users 40 --iterations 10 --processes 2 --threads 8 --latency 0.02
+
+Every virtual user logs in through the login form, repeats a weighted random
+flow (browse the history, add an expense and settle up, open the chat, check
+the dashboard) and logs out. Users are spread over ``--processes`` forked
+workers, each running ``--threads`` of them at a time like a gunicorn
+deployment (with ``--views async``: that many users in flight on one event
+loop per worker, like uvicorn). The report has p50/p95/p99 per step and
+overall, throughput, error counts and the peak RSS of each worker. With
+``--fail-p95`` or ``--fail-errors`` it exits non-zero, so it can gate a CI
+job.
+"""
+import asyncio
+import multiprocessing
+import random
+import resource
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from web_ui import async_backend, async_views, backend, views
+from web_ui.fake_backend import FakeBackend
+from web_ui.urls import build_urlpatterns
+
+from ._bench import percentile, summarize
+
+
+def _urlconf(v):
+    module = types.ModuleType(f"loadtest_urls_{v.__name__}")
+    module.urlpatterns = [path("", include(build_urlpatterns(v)))]
+    return module
+
+
+# Flows yield (step, method, url, form data) for one pass through the site.
+
+def browse(group, user_id):
+    yield 'home', 'get', '/', None
+    yield 'history', 'get', f'/groups/{group}/history/', None
+    yield 'history_more', 'get', f'/groups/{group}/history/more/', None
+    yield 'simplify', 'get', f'/groups/{group}/simplify/', None
+
+
+def spend(group, user_id):
+    yield 'add_expense_form', 'get', f'/add-expense/{group}/', None
+    yield 'add_expense', 'post', f'/add-expense/{group}/', {
+        'amount': str(random.randint(1, 500)),
+        'description': 'Load test',
+        'split_mode': 'equal_all',
+        'idempotency_key': uuid.uuid4().hex,
+    }
+    yield 'simplify', 'get', f'/groups/{group}/simplify/', None
+    yield 'settle', 'post', f'/groups/{group}/settle/', {
+        'payee_id': 1 if user_id != 1 else 2,
+        'payee_name': 'user1',
+        'amount': '5',
+        'idempotency_key': uuid.uuid4().hex,
+    }
+
+
+def chat(group, user_id):
+    yield 'home', 'get', '/', None
+    yield 'chat', 'get', f'/groups/{group}/chat/', None
+
+
+def dashboard(group, user_id):
+    yield 'dashboard', 'get', '/dashboard/', None
+    yield 'home', 'get', '/', None
+
+
+# name -> (weight, flow)
+FLOWS = {
+    'browse': (5, browse),
+    'spend': (2, spend),
+    'chat': (2, chat),
+    'dashboard': (1, dashboard),
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def session_steps(opts, rng, user_id):
+    """Every step of one user's visit: login, the chosen flows, logout."""
+    names = list(FLOWS)
+    weights = [FLOWS[n][0] for n in names]
+    steps = [('login', 'post', '/login/', {'email': f'user{user_id}@example.com', 'password': 'secret'})]
+    for flow in rng.choices(names, weights, k=opts['iterations']):
+        steps.extend(FLOWS[flow][1](rng.randint(1, opts['groups']), user_id))
+    steps.append(('logout', 'get', '/logout/', None))
+    return steps
+
+
+def run_worker(opts, users):
+    """Run ``users`` (a list of user ids) to completion; returns the samples.
+
+    Sync views get a thread per concurrent user; async views get one event
+    loop with ``--threads`` users in flight, as under an ASGI server.
+    """
+    backend.reset_session()
+    rng = random.Random(opts['seed'] + (users[0] if users else 0))
+    visits = [session_steps(opts, rng, user_id) for user_id in users]
+    latencies = defaultdict(list)
+    errors = Counter()
+
+    def record(name, seconds, status):
+        latencies[name].append(seconds)
+        if status >= 400:
+            errors[name] += 1
+
+    if opts['views'] == 'async':
+        asyncio.run(_run_async(opts, visits, record))
+    else:
+        lock = threading.Lock()
+
+        def visit(steps):
+            client = Client()
+            for name, method, url, data in steps:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data) if data else getattr(client, method)(url)
+                with lock:
+                    record(name, time.perf_counter() - start, response.status_code)
+
+        with ThreadPoolExecutor(max_workers=opts['threads']) as pool:
+            list(pool.map(visit, visits))
+    backend.reset_session()
+    return {'latencies': dict(latencies), 'errors': errors, 'peak_rss_mb': _peak_rss_mb()}
+
+
+async def _run_async(opts, visits, record):
+    gate = asyncio.Semaphore(opts['threads'])
+
+    async def visit(steps):
+        async with gate:
+            client = AsyncClient()
+            for name, method, url, data in steps:
+                start = time.perf_counter()
+                call = getattr(client, method)
+                response = await (call(url, data) if data else call(url))
+                record(name, time.perf_counter() - start, response.status_code)
+
+    await asyncio.gather(*(visit(steps) for steps in visits))
+    await async_backend.aclose()
+
+
+class Command(BaseCommand):
+    help = "Load-test the views with realistic user flows against a fake Go backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=5, help="Flows per user between login and logout.")
+        parser.add_argument('--processes', type=int, default=1, help="Forked worker processes.")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="Concurrent users per worker (threads, or in-flight users with --views async).")
+        parser.add_argument('--views', choices=('sync', 'async'), default='sync')
+        parser.add_argument('--latency', type=float, default=0.02, help="Seconds the fake backend sleeps per call.")
+        parser.add_argument('--slow', action='append', default=[], metavar='FAMILY=SECONDS',
+                            help="Per endpoint family latency, e.g. /api/groups/{id}/simplify=0.2 (repeatable).")
+        parser.add_argument('--groups', type=int, default=3)
+        parser.add_argument('--members', type=int, default=20)
+        parser.add_argument('--activity', type=int, default=200)
+        parser.add_argument('--text-size', type=int, default=0, help="Pad descriptions to this many characters.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fail-p95', type=float, metavar='MS', help="Exit non-zero if the overall p95 is above this.")
+        parser.add_argument('--fail-errors', action='store_true', help="Exit non-zero on any 4xx/5xx response.")
+
+    def handle(self, **opts):
+        latencies = {}
+        for item in opts['slow']:
+            family, _, seconds = item.partition('=')
+            try:
+                latencies[family] = float(seconds)
+            except ValueError:
+                raise CommandError(f"--slow expects FAMILY=SECONDS, got {item!r}")
+
+        fake = FakeBackend(
+            latency=opts['latency'], latencies=latencies, groups=opts['groups'],
+            members=opts['members'], activity=opts['activity'], text_size=opts['text_size'],
+        )
+        urlconf = _urlconf(async_views if opts['views'] == 'async' else views)
+        with fake, override_settings(
+            GO_BACKEND_URL=fake.url,
+            ALLOWED_HOSTS=['testserver'],
+            ROOT_URLCONF=urlconf,
+            BACKEND_POOL_SIZE=max(settings.BACKEND_POOL_SIZE, opts['threads']),
+        ):
+            users = [1 + i % opts['members'] for i in range(opts['users'])]
+            shares = [users[i::opts['processes']] for i in range(opts['processes'])]
+            started = time.perf_counter()
+            if opts['processes'] == 1:
+                results = [run_worker(opts, users)]
+            else:
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(opts['processes']) as pool:
+                    results = pool.starmap(run_worker, [(opts, share) for share in shares])
+            elapsed = time.perf_counter() - started
+            hits = dict(fake.hits)
+
+        self._report(opts, results, elapsed, hits)
+
+    def _report(self, opts, results, elapsed, hits):
+        steps = defaultdict(list)
+        errors = Counter()
+        for result in results:
+            for name, samples in result['latencies'].items():
+                steps[name].extend(samples)
+            errors.update(result['errors'])
+        everything = [s for samples in steps.values() for s in samples]
+
+        self.stdout.write(
+            f"{opts['views']} views, {opts['processes']} worker(s) x {opts['threads']} threads, "
+            f"{opts['users']} users x {opts['iterations']} flows, backend latency {opts['latency'] * 1000:.0f}ms"
+        )
+        for name in sorted(steps):
+            line = summarize(name, steps[name], elapsed)
+            if errors[name]:
+                line += f"  errors={errors[name]}"
+            self.stdout.write(line)
+        self.stdout.write(summarize('all', everything, elapsed) + f"  errors={sum(errors.values())}")
+        for i, result in enumerate(results):
+            requests = sum(len(s) for s in result['latencies'].values())
+            self.stdout.write(f"worker {i}: {requests} requests, peak RSS {result['peak_rss_mb']:.1f} MB")
+        self.stdout.write(f"backend calls: {sum(hits.values())} ({sum(hits.values()) / max(len(everything), 1):.2f} per page)")
+
+        p95 = percentile(everything, 95) * 1000
+        if opts['fail_p95'] is not None and p95 > opts['fail_p95']:
+            raise CommandError(f"p95 {p95:.1f}ms is above --fail-p95 {opts['fail_p95']:.1f}ms")
+        if opts['fail_errors'] and errors:
+            raise CommandError(f"{sum(errors.values())} requests failed: {dict(errors)}")
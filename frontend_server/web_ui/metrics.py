@@ -0,0 +1,204 @@
+"""Request timings and Prometheus-style metrics.
+
+``TimingMiddleware`` opens a ``RequestTimings`` for each request in a context
+variable. The backend clients record every call into it (endpoint family,
+status, latency, bytes), responses time their own ``.json()`` decoding, and
+the template backend times rendering. At the end of the request the totals
+go out as a ``Server-Timing`` header and into the process-wide counters and
+histograms served by the ``metrics`` view. Gauges (sizes of things in this
+process) are set with ``set_gauge`` when the view is scraped.
+"""
+import threading
+import time
+from contextvars import ContextVar
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_gauges = {}      # (name, labels) -> float
+_help = {}
+
+_current = ContextVar('web_ui_request_timings', default=None)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def describe(name, kind, text):
+    _help[name] = (kind, text)
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def clear_gauge(name):
+    """Drop every series of ``name``, e.g. before setting the current ones."""
+    with _lock:
+        for key in [k for k in _gauges if k[0] == name]:
+            del _gauges[key]
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+describe('web_ui_requests_total', 'counter', 'Requests served, by view and status.')
+describe('web_ui_request_seconds', 'histogram', 'Total request time, by view.')
+describe('web_ui_backend_calls_total', 'counter', 'Requests sent to the Go backend, by endpoint family and status.')
+describe('web_ui_backend_seconds', 'histogram', 'Go backend call latency, by endpoint family.')
+describe('web_ui_backend_bytes_total', 'counter', 'Response bytes received from the Go backend, by endpoint family.')
+describe('web_ui_backend_coalesced_total', 'counter', 'Backend GETs answered by an identical request already in flight.')
+describe('web_ui_singleflight_total', 'counter', 'Backend GETs sent vs. coalesced since start.')
+describe('web_ui_backend_stale_total', 'counter', 'Last good responses served in place of a failed backend GET.')
+describe('web_ui_json_decode_seconds', 'histogram', 'Time decoding backend JSON responses.')
+describe('web_ui_render_seconds', 'histogram', 'Template render time, by template.')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.backend = []  # (family, status, seconds, bytes, shared)
+        self.json_seconds = 0.0
+        self.render_seconds = 0.0
+        self.stale = []  # families answered from the last good response
+
+    def server_timing(self, total, detail=True):
+        """The ``Server-Timing`` value; ``detail`` adds each backend call and
+        the stale endpoint families, which name internal endpoints."""
+        backend = sum(c[2] for c in self.backend)
+        parts = [
+            f'app;dur={total * 1000:.1f}',
+            f'backend;desc="{len(self.backend)} calls";dur={backend * 1000:.1f}',
+            f'json;dur={self.json_seconds * 1000:.1f}',
+            f'render;dur={self.render_seconds * 1000:.1f}',
+        ]
+        if not detail:
+            return ', '.join(parts)
+        if self.stale:
+            parts.append(f'stale;desc="{", ".join(sorted(set(self.stale)))}"')
+        for i, (family, status, seconds, _, shared) in enumerate(self.backend[:20], start=1):
+            desc = f'{family} {status}{" shared" if shared else ""}'.replace('"', "'")
+            parts.append(f'be{i};desc="{desc}";dur={seconds * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def record_backend(family, status, seconds, nbytes=0, shared=False):
+    """One backend call; ``shared`` calls waited on another caller's request."""
+    timings = _current.get()
+    if timings is not None:
+        timings.backend.append((family, status, seconds, nbytes, shared))
+    if shared:
+        inc('web_ui_backend_coalesced_total', endpoint=family)
+        return
+    inc('web_ui_backend_calls_total', endpoint=family, status=str(status))
+    inc('web_ui_backend_bytes_total', nbytes, endpoint=family)
+    observe('web_ui_backend_seconds', seconds, endpoint=family)
+
+
+def record_stale(family):
+    timings = _current.get()
+    if timings is not None:
+        timings.stale.append(family)
+    inc('web_ui_backend_stale_total', endpoint=family)
+
+
+def served_stale():
+    """Whether the current request used any last good (stale) backend data."""
+    timings = _current.get()
+    return bool(timings is not None and timings.stale)
+
+
+def record_render(template, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.render_seconds += seconds
+    observe('web_ui_render_seconds', seconds, template=template or 'string')
+
+
+def time_json(response):
+    """Make ``response.json()`` record its decode time."""
+    decode = response.json
+
+    def json(**kwargs):
+        start = time.perf_counter()
+        try:
+            return decode(**kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            timings = _current.get()
+            if timings is not None:
+                timings.json_seconds += seconds
+            observe('web_ui_json_decode_seconds', seconds)
+
+    response.json = json
+    return response
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+def exposition():
+    """All metrics in the Prometheus text format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        gauges = dict(_gauges)
+    lines = []
+    for name, (kind, text) in _help.items():
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind in ('counter', 'gauge'):
+            values = counters if kind == 'counter' else gauges
+            for (n, labels), value in sorted(values.items()):
+                if n == name:
+                    lines.append(f'{name}{_fmt_labels(labels)} {value:g}')
+            continue
+        for (n, labels), h in sorted(histograms.items()):
+            if n != name:
+                continue
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", f"{bound:g}")])} {count}')
+            lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", "+Inf")])} {h[-1]}')
+            lines.append(f'{name}_sum{_fmt_labels(labels)} {h[-2]:.6f}')
+            lines.append(f'{name}_count{_fmt_labels(labels)} {h[-1]}')
+    return '\n'.join(lines) + '\n'
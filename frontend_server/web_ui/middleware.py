@@ -0,0 +1,110 @@
+"""Per-request timing, Server-Timing headers and the on-demand profiler."""
+import cProfile
+import io
+import pstats
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics
+
+try:
+    import pyinstrument
+except ImportError:  # optional sampling profiler; cProfile is the fallback
+    pyinstrument = None
+
+
+def profiling_requested(request):
+    return settings.PROFILER_ENABLED and request.GET.get('_profile') == '1'
+
+
+def _profile_response(profiler):
+    if pyinstrument is not None:
+        return HttpResponse(profiler.output_html())
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(60)
+    return HttpResponse(out.getvalue(), content_type='text/plain')
+
+
+def _profiler(async_mode=False):
+    if pyinstrument is not None:
+        return pyinstrument.Profiler(
+            interval=settings.PROFILER_INTERVAL, async_mode='enabled' if async_mode else 'disabled'
+        )
+    return cProfile.Profile()
+
+
+def _start(profiler):
+    (profiler.start if pyinstrument is not None else profiler.enable)()
+
+
+def _stop(profiler):
+    (profiler.stop if pyinstrument is not None else profiler.disable)()
+
+
+class TimingMiddleware:
+    """Time each request and what it spent on the backend, JSON and templates.
+
+    Adds a ``Server-Timing`` header (each backend call for clients in
+    ``METRICS_ALLOWED_IPS``, only the totals for everyone else) and feeds
+    ``web_ui.metrics``. With ``PROFILER_ENABLED``, ``?_profile=1`` returns a
+    profile of the view instead of the page (pyinstrument's sampling profiler if installed,
+    cProfile otherwise).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        try:
+            if profiling_requested(request):
+                profiler = _profiler()
+                _start(profiler)
+                try:
+                    self.get_response(request)
+                finally:
+                    _stop(profiler)
+                response = _profile_response(profiler)
+            else:
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            if profiling_requested(request):
+                profiler = _profiler(async_mode=True)
+                _start(profiler)
+                try:
+                    await self.get_response(request)
+                finally:
+                    _stop(profiler)
+                response = _profile_response(profiler)
+            else:
+                response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        # Per-call detail only for the clients allowed to scrape /metrics/.
+        detail = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        response['Server-Timing'] = timings.server_timing(total, detail)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.inc('web_ui_requests_total', view=view, status=str(response.status_code))
+        metrics.observe('web_ui_request_seconds', total, view=view)
+        return response
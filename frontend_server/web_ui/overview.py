@@ -0,0 +1,86 @@
+"""Per-group summaries for the dashboard.
+
+For each of the user's groups the dashboard shows their net balance, the
+settlements still pending (their part of the simplified debts) and the
+latest ``DASHBOARD_ACTIVITY_ITEMS`` activity items. That takes a group's
+members, simplified debts and newest activity: 3 backend calls per group,
+one after the other, if done naively. Instead the views take what
+``groupcache`` already has, ask ``missing_paths`` for the rest of every
+group at once and fetch it in one fan-out (``backend.fetch_all``, at most
+``BACKEND_FANOUT_WORKERS`` at a time) under a single ``DASHBOARD_DEADLINE``.
+A group whose calls miss the deadline or fail is summarised from what did
+arrive and marked partial rather than holding up the page.
+"""
+from django.conf import settings
+
+from . import feed, metrics
+from .splits import from_cents, to_cents
+
+metrics.describe('web_ui_dashboard_partial_total', 'counter', 'Dashboard group summaries rendered with data missing.')
+
+
+def activity_path(group_id):
+    # The history page's first page, so the two share the backend's ETag and
+    # last good copy.
+    return feed.activity_path(group_id, None, settings.ACTIVITY_PAGE_SIZE)
+
+
+def missing_paths(group_id, members, index, recent):
+    """Fan-out paths, keyed ``(group_id, kind)``, for what isn't cached."""
+    paths = {}
+    if members is None:
+        paths[(group_id, 'members')] = f"/api/groups/{group_id}/members"
+    if index is None:
+        paths[(group_id, 'simplify')] = f"/api/groups/{group_id}/simplify"
+    if recent is None:
+        paths[(group_id, 'activity')] = activity_path(group_id)
+    return paths
+
+
+def json_body(res, empty):
+    """Decoded body of a 200 response (``empty`` for null); None if the call
+    failed, missed the deadline or didn't answer JSON."""
+    if res is None or res.status_code != 200:
+        return None
+    try:
+        return res.json() or empty
+    except ValueError:
+        return None
+
+
+def recent_items(activity):
+    """The newest ``DASHBOARD_ACTIVITY_ITEMS`` items of an activity page."""
+    return feed.window(activity, None, settings.DASHBOARD_ACTIVITY_ITEMS)[0]
+
+
+def net_balance(txns, user_id):
+    """What ``user_id`` is owed (positive) or owes (negative) in ``txns``."""
+    cents = 0
+    for t in txns:
+        if t.get('to') == user_id:
+            cents += to_cents(t.get('amount') or 0)
+        if t.get('from') == user_id:
+            cents -= to_cents(t.get('amount') or 0)
+    return from_cents(cents)
+
+
+def summarise(group, user_id, txns, recent):
+    """One dashboard card. ``txns`` (the user's simplified transactions) and
+    ``recent`` (formatted activity) are None when they couldn't be loaded."""
+    summary = {
+        "group": group,
+        "balance": None,
+        "balance_amount": None,  # abs(balance), for templates
+        "owes": [],
+        "owed": [],
+        "recent": recent or [],
+        "partial": txns is None or recent is None,
+    }
+    if summary["partial"]:
+        metrics.inc('web_ui_dashboard_partial_total')
+    if txns is not None:
+        summary["balance"] = net_balance(txns, user_id)
+        summary["balance_amount"] = abs(summary["balance"])
+        summary["owes"] = [t for t in txns if t.get('from') == user_id]
+        summary["owed"] = [t for t in txns if t.get('to') == user_id]
+    return summary
@@ -0,0 +1,169 @@
+"""Expense split engine, in integer cents.
+
+Every mode reduces to "share ``total`` cents in proportion to integer
+weights". ``allocate`` gives each member the floor of their exact share and
+hands the few leftover cents to the largest fractional parts, earliest
+member first on ties, so the shares always sum to the total and the same
+inputs always give the same split. With numpy installed, splits between
+``NUMPY_MIN_WEIGHTS`` or more weights (bulk imports, big groups) are done
+vectorised, with the same result.
+
+Modes (``values`` maps user id -> the string typed for that member):
+
+* ``equal_all``    -- every member, equally
+* ``equal_subset`` -- the ``selected_ids``, equally
+* ``custom``       -- exact amounts, which must add up to the total
+* ``percentage``   -- percentages (up to 2 decimals), which must add up to 100
+* ``shares``       -- relative shares, e.g. 2 / 1 / 1 (up to 2 decimals)
+"""
+import heapq
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+try:
+    import numpy as np
+except ImportError:  # optional; only speeds up very large splits
+    np = None
+
+SPLIT_MODES = ("equal_all", "equal_subset", "custom", "percentage", "shares")
+
+NUMPY_MIN_WEIGHTS = 1_000
+# total * weight must fit in int64 for the numpy path.
+_NUMPY_MAX_PRODUCT = 2 ** 62
+
+_CENT = Decimal("0.01")
+
+
+class SplitError(ValueError):
+    """The split can't be computed; the message is shown to the user."""
+
+
+def to_cents(value):
+    """'12.345' / 12.3 / Decimal -> 1235 / 1230 (half-up); ValueError if not a number."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Cents -> the float amount the Go backend expects."""
+    return float(Decimal(cents) * _CENT)
+
+
+def allocate(total, weights):
+    """Split ``total`` cents in proportion to non-negative integer ``weights``.
+
+    Returns one int per weight, summing to ``total``.
+    """
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise SplitError("Nothing to split between.")
+    if np is not None and len(weights) >= NUMPY_MIN_WEIGHTS and total * max(weights) < _NUMPY_MAX_PRODUCT:
+        return _allocate_numpy(total, weights, weight_sum)
+    shares = []
+    remainders = []
+    for w in weights:
+        share, rem = divmod(total * w, weight_sum)
+        shares.append(share)
+        remainders.append(rem)
+    left = total - sum(shares)
+    # left < len(weights), so only the winners are ever ordered.
+    for i in heapq.nlargest(left, range(len(weights)), key=lambda i: (remainders[i], -i)):
+        shares[i] += 1
+    return shares
+
+
+def _allocate_numpy(total, weights, weight_sum):
+    shares, remainders = np.divmod(total * np.asarray(weights, dtype=np.int64), weight_sum)
+    left = total - int(shares.sum())
+    if left:
+        # Largest remainder first, earliest index on ties, as ``allocate``.
+        order = np.lexsort((np.arange(len(weights)), -remainders))
+        shares[order[:left]] += 1
+    return shares.tolist()
+
+
+def _member_ids(members):
+    return [int(m['id']) for m in members]
+
+
+def _typed_values(member_ids, values, label):
+    """user id -> cents for each member with a non-blank, positive value."""
+    typed = {}
+    for uid in member_ids:
+        raw = (values or {}).get(uid)
+        if raw is None or not str(raw).strip():
+            continue
+        try:
+            cents = to_cents(raw)
+        except ValueError:
+            raise SplitError(f"Invalid {label}: {raw!r}")
+        if cents < 0:
+            raise SplitError(f"{label.capitalize()} can't be negative.")
+        if cents:
+            typed[uid] = cents
+    if not typed:
+        raise SplitError(f"Enter a {label} for at least one member.")
+    return typed
+
+
+def split(total, mode, members, selected_ids=(), values=None):
+    """Split ``total`` cents; returns ``[(user_id, cents), ...]``.
+
+    Raises ``SplitError`` with a user-facing message.
+    """
+    if total <= 0:
+        raise SplitError("Amount must be positive.")
+    member_ids = _member_ids(members)
+
+    if mode == "equal_all":
+        if not member_ids:
+            raise SplitError("Cannot split: No members found.")
+        ids = member_ids
+        weights = [1] * len(ids)
+
+    elif mode == "equal_subset":
+        chosen = {int(uid) for uid in selected_ids}
+        if not chosen:
+            raise SplitError("Please select at least one member.")
+        unknown = chosen.difference(member_ids)
+        if unknown:
+            raise SplitError(f"Not a group member: {', '.join(map(str, sorted(unknown)))}")
+        ids = [uid for uid in member_ids if uid in chosen]
+        weights = [1] * len(ids)
+
+    elif mode == "custom":
+        typed = _typed_values(member_ids, values, "amount")
+        custom_total = sum(typed.values())
+        if custom_total != total:
+            raise SplitError(
+                f"Total ({from_cents(custom_total):.2f}) does not match Amount ({from_cents(total):.2f})"
+            )
+        return list(typed.items())
+
+    elif mode == "percentage":
+        # Percentages to 2 decimals, i.e. weights in hundredths of a percent.
+        typed = _typed_values(member_ids, values, "percentage")
+        if sum(typed.values()) != 100 * 100:
+            raise SplitError(f"Percentages add up to {from_cents(sum(typed.values())):g}%, not 100%.")
+        ids, weights = list(typed), list(typed.values())
+
+    elif mode == "shares":
+        typed = _typed_values(member_ids, values, "share")
+        ids, weights = list(typed), list(typed.values())
+
+    else:
+        raise SplitError(f"Unknown split mode: {mode}")
+
+    return list(zip(ids, allocate(total, weights)))
+
+
+def payload_splits(total, mode, members, selected_ids=(), values=None):
+    """``split`` in the ``[{"user_id", "amount"}]`` shape of /api/expenses."""
+    return [
+        {"user_id": uid, "amount": from_cents(cents)}
+        for uid, cents in split(total, mode, members, selected_ids, values)
+    ]
@@ -1,3 +1,1131 @@
-from django.test import TestCase
+import base64
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipIf
 
-# Create your tests here.
+import httpx
+import requests
+
+import types
+
+from django.conf import settings
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import include, path
+
+from . import async_backend, async_views, backend, breaker, bulk, chat_relay, debts, feed, fragments, groupcache, identity, idempotency, loaders, metrics, splits, uploads, views
+from .fake_backend import FakeBackend, FakeChat, FakeData, WebSocketClient
+from .urls import build_urlpatterns
+
+
+class BackendClientTests(SimpleTestCase):
+    def tearDown(self):
+        backend.reset_session()
+
+    def test_endpoint_family_strips_ids_and_query(self):
+        self.assertEqual(backend.endpoint_family('/api/groups/42/members?x=1'), '/api/groups/{id}/members')
+        self.assertEqual(backend.endpoint_family('/api/groups'), '/api/groups')
+
+    @override_settings(BACKEND_TIMEOUTS={'default': (1, 2), '/api/groups/{id}/simplify': (1, 9)})
+    def test_timeout_per_endpoint_family(self):
+        self.assertEqual(backend.timeout_for('/api/groups/3/simplify'), (1, 9))
+        self.assertEqual(backend.timeout_for('/api/groups'), (1, 2))
+
+    def test_session_is_shared(self):
+        self.assertIs(backend.get_session(), backend.get_session())
+
+    def test_bearer_header_from_session(self):
+        request = mock.Mock(session={'auth_token': 'abc'})
+        with mock.patch.object(backend.get_session(), 'request') as send:
+            send.return_value.status_code = 200
+            backend.get('/api/groups', request)
+        _, kwargs = send.call_args
+        self.assertEqual(kwargs['headers'], {'Authorization': 'Bearer abc'})
+        self.assertEqual(kwargs['timeout'], backend.timeout_for('/api/groups'))
+
+
+@override_settings(BACKEND_BREAKER_THRESHOLD=2, BACKEND_BREAKER_RESET=60)
+class BreakerTests(SimpleTestCase):
+    def setUp(self):
+        breaker.reset()
+
+    def test_opens_after_consecutive_failures(self):
+        breaker.record('/api/groups', False)
+        breaker.record('/api/groups', True)
+        breaker.record('/api/groups', False)
+        self.assertTrue(breaker.allow('/api/groups'))
+        breaker.record('/api/groups', False)
+        self.assertEqual(breaker.state('/api/groups'), breaker.OPEN)
+        self.assertFalse(breaker.allow('/api/groups'))
+        self.assertTrue(breaker.allow('/api/dashboard'))
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker.record('/api/groups', False)
+        breaker.record('/api/groups', False)
+        with override_settings(BACKEND_BREAKER_RESET=0):
+            self.assertTrue(breaker.allow('/api/groups'))
+            self.assertFalse(breaker.allow('/api/groups'))
+            breaker.record('/api/groups', False)
+            self.assertEqual(breaker.state('/api/groups'), breaker.OPEN)
+            self.assertTrue(breaker.allow('/api/groups'))
+            breaker.record('/api/groups', True)
+        self.assertEqual(breaker.state('/api/groups'), breaker.CLOSED)
+        self.assertTrue(breaker.allow('/api/groups'))
+
+
+class FragmentCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used_past_byte_budget(self):
+        fragment_cache = fragments.FragmentCache('test-fragments', {'OPTIONS': {'MAX_BYTES': 1000}})
+        fragment_cache.clear()
+        fragment_cache.set('a', 'x' * 400)
+        fragment_cache.set('b', 'y' * 400)
+        fragment_cache.get('a')
+        fragment_cache.set('c', 'z' * 400)
+        self.assertIsNone(fragment_cache.get('b'))
+        self.assertEqual(fragment_cache.get('a'), 'x' * 400)
+        usage = fragment_cache.usage()
+        self.assertEqual(usage['entries'], 2)
+        self.assertLessEqual(usage['bytes'], 1000)
+        fragment_cache.delete('a')
+        self.assertLess(fragment_cache.usage()['bytes'], 500)
+
+    def test_byte_count_matches_entries(self):
+        fragment_cache = fragments.FragmentCache('test-fragment-bytes', {
+            'OPTIONS': {'MAX_BYTES': 10000, 'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 1},
+        })
+        fragment_cache.clear()
+        for key in 'abc':
+            fragment_cache.set(key, key * 100)
+        # Full: overwriting culls, and must not count the replaced value twice.
+        fragment_cache.set('a', 'a' * 200)
+        fragment_cache.set('n', 1)
+        fragment_cache.incr('n', 10 ** 30)
+        held = sum(len(v) for v in fragment_cache._cache.values())
+        self.assertEqual(fragment_cache.usage()['bytes'], held)
+        self.assertEqual(fragment_cache.get('n'), 10 ** 30 + 1)
+
+
+class FanOutTests(SimpleTestCase):
+    def tearDown(self):
+        backend.reset_session()
+
+    def test_failures_and_late_calls_are_isolated(self):
+        def fake_call(method, path, **kwargs):
+            if path == '/slow':
+                time.sleep(0.5)
+            if path == '/broken':
+                raise requests.exceptions.ConnectionError()
+            return path
+
+        with mock.patch.object(backend, 'call', side_effect=fake_call), self.assertLogs('web_ui.backend', 'WARNING'):
+            results = backend.fetch_all(
+                {'ok': '/ok', 'slow': '/slow', 'broken': '/broken'},
+                deadline=backend.Deadline(0.1),
+            )
+        self.assertEqual(results, {'ok': '/ok', 'slow': None, 'broken': None})
+
+    async def test_async_fan_out_only_absorbs_http_errors(self):
+        async def fake_call(method, path, **kwargs):
+            if path == '/broken':
+                raise httpx.ConnectError('refused')
+            if path == '/bug':
+                raise KeyError('id')
+            return path
+
+        with mock.patch.object(async_backend, 'call', side_effect=fake_call), self.assertLogs('web_ui.async_backend', 'WARNING'):
+            results = await async_backend.fetch_all({'ok': '/ok', 'broken': '/broken'})
+        self.assertEqual(results, {'ok': '/ok', 'broken': None})
+        with mock.patch.object(async_backend, 'call', side_effect=fake_call), self.assertRaises(KeyError):
+            await async_backend.fetch_all({'ok': '/ok', 'bug': '/bug'})
+
+
+class SingleFlightTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeBackend(latency=0.2).start()
+        cls.enterClassContext(override_settings(GO_BACKEND_URL=cls.fake.url))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+        backend.reset_session()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fake.hits.clear()
+        backend.reset_singleflight_stats()
+
+    def test_identical_gets_share_one_request(self):
+        tokens = ['a'] * 4 + ['b']
+        results = {}
+
+        def one(i, token):
+            results[i] = backend.get('/api/groups/1/members', token=token).status_code
+
+        threads = [threading.Thread(target=one, args=(i, t)) for i, t in enumerate(tokens)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(list(results.values()), [200] * 5)
+        # Different Authorization means a different scope: not coalesced.
+        self.assertEqual(self.fake.hits['/api/groups/1/members'], 2)
+        self.assertEqual(backend.singleflight_stats(), {'sent': 2, 'coalesced': 3})
+
+    async def test_async_gets_share_one_request(self):
+        responses = await asyncio.gather(*[
+            async_backend.get('/api/groups/1/activity', token='a') for _ in range(4)
+        ])
+        self.assertEqual({r.status_code for r in responses}, {200})
+        self.assertEqual(self.fake.hits['/api/groups/1/activity'], 1)
+        self.assertEqual(backend.singleflight_stats()['coalesced'], 3)
+        await async_backend.aclose()
+
+
+def _urlconf(v):
+    module = types.ModuleType(f"test_urls_{v.__name__}")
+    module.urlpatterns = [path("", include(build_urlpatterns(v)))]
+    return module
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+class FakeBackendViewTests(SimpleTestCase):
+    """Drive the real views against the local Go backend stand-in."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeBackend(members=3, activity=4).start()
+        cls.enterClassContext(override_settings(GO_BACKEND_URL=cls.fake.url))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+        backend.reset_session()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        backend.responses().clear()
+        self.fake.hits.clear()
+        self.fake.server.data.down.clear()
+        breaker.reset()
+        caches[fragments.ALIAS].clear()
+        fragments.reset_stats()
+
+    def login(self, client):
+        session = SessionStore()
+        session['auth_token'] = 'test-token'
+        session['user_id'] = 1
+        session.save()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def test_sync_history_page(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['expenses']), 4)
+        self.assertContains(response, 'user2')
+
+    async def test_async_history_page(self):
+        self.login(self.async_client)
+        with override_settings(ROOT_URLCONF=_urlconf(async_views)):
+            response = await self.async_client.get('/groups/1/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['expenses']), 4)
+        self.assertContains(response, 'user2')
+
+    def test_history_is_paginated(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views), ACTIVITY_PAGE_SIZE=3):
+            response = self.client.get('/groups/1/history/')
+            self.assertEqual(len(response.context['expenses']), 3)
+            more = self.client.get('/groups/1/history/more/', {'before': response.context['next_cursor']}).json()
+        self.assertEqual(more['html'].count('Paid by'), 1)
+        self.assertIsNone(more['next_cursor'])
+
+    def test_chat_page_makes_no_activity_call(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/chat/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['username'], 'user1')
+        self.assertEqual(self.fake.hits['/api/groups/1/activity'], 0)
+
+    def test_members_are_cached_between_pages(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            self.client.get('/groups/1/history/')
+            self.client.get('/groups/1/history/')
+            response = self.client.get('/add-expense/1/')
+        self.assertEqual(len(response.context['members']), 3)
+        self.assertEqual(self.fake.hits['/api/groups/1/members'], 1)
+        self.assertEqual(self.fake.hits['/api/groups/1/activity'], 2)
+
+    def test_cached_members_not_served_to_outsiders(self):
+        groupcache.store_members(1, [{'id': 2, 'username': 'user2'}])
+        request = types.SimpleNamespace(session={'user_id': 99})
+        self.assertIsNone(groupcache.cached_members(request, 1))
+        request.session['user_id'] = 2
+        self.assertEqual(groupcache.cached_members(request, 1), [{'id': 2, 'username': 'user2'}])
+
+    def test_dashboard_summarises_every_group(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views), DASHBOARD_ACTIVITY_ITEMS=2):
+            response = self.client.get('/dashboard/')
+            # Compared against this snapshot: a retry abandoned by an earlier
+            # test's deadline may still land on the fake server meanwhile.
+            hits = dict(self.fake.hits)
+            self.client.get('/dashboard/')
+        summaries = response.context['summaries']
+        self.assertEqual([s['group']['id'] for s in summaries], [1, 2, 3])
+        self.assertFalse(response.context['partial'])
+        # user2 and user3 owe user1 10 and 15.
+        self.assertEqual(summaries[0]['balance'], 25.0)
+        self.assertEqual(len(summaries[0]['owed']), 2)
+        self.assertEqual(len(summaries[0]['recent']), 2)
+        self.assertContains(response, 'You are owed ₹25.0')
+        # The second dashboard comes from the group caches.
+        for kind in ('members', 'simplify', 'activity'):
+            path = f'/api/groups/3/{kind}'
+            self.assertEqual(self.fake.hits[path], hits.get(path))
+
+    async def test_async_dashboard_summarises_every_group(self):
+        self.login(self.async_client)
+        with override_settings(ROOT_URLCONF=_urlconf(async_views)):
+            response = await self.async_client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['balance'] for s in response.context['summaries']], [25.0] * 3)
+        self.assertEqual(response.context['data'], {'message': 'Welcome back'})
+
+    def test_dashboard_shows_slow_groups_as_partial(self):
+        self.login(self.client)
+        groupcache.store_debts(1, self.fake.server.data.simplify)
+        self.fake.server.latencies['/api/groups/{id}/simplify'] = 1
+        self.addCleanup(self.fake.server.latencies.clear)
+        with override_settings(ROOT_URLCONF=_urlconf(views), DASHBOARD_DEADLINE=0.3), \
+                self.assertLogs('web_ui.backend', 'WARNING'):
+            started = time.monotonic()
+            response = self.client.get('/dashboard/')
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertTrue(response.context['partial'])
+        summaries = response.context['summaries']
+        self.assertEqual([s['partial'] for s in summaries], [False, True, True])
+        self.assertIsNone(summaries[1]['balance'])
+        # What did arrive is still shown.
+        self.assertEqual(len(summaries[1]['recent']), 4)
+        self.assertContains(response, "didn't load in time")
+
+    def test_home_reuses_group_snapshot_until_join(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            self.client.get('/')
+            response = self.client.get('/')
+            self.assertEqual(len(response.context['groups']), 3)
+            self.assertEqual(self.fake.hits['/api/groups'], 1)
+            self.client.post('/join-group/', {'code': 'CODE0002'})
+            self.client.get('/')
+        # join resolved the group through /api/groups and refreshed the snapshot.
+        self.assertEqual(self.fake.hits['/api/groups'], 2)
+
+    def test_debts_fetched_once_per_group_until_settle(self):
+        self.login(self.client)
+        other = self.client_class()
+        session = SessionStore()
+        session.update({'auth_token': 'other-token', 'user_id': 3})
+        session.save()
+        other.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            mine = self.client.get('/groups/1/simplify/').context['txns']
+            theirs = other.get('/groups/1/simplify/').context['txns']
+            self.assertEqual(self.fake.hits['/api/groups/1/simplify'], 1)
+            self.client.post('/groups/1/settle/', {'payee_id': 1, 'payee_name': 'user1', 'amount': '5'})
+            self.client.get('/groups/1/simplify/')
+        self.assertEqual(len(mine), 2)
+        self.assertEqual([(t['from'], t['to']) for t in theirs], [(3, 1)])
+        self.assertEqual(self.fake.hits['/api/groups/1/simplify'], 2)
+
+    def split_activity(self):
+        """Give every fake expense its splits, as the local plan needs."""
+        data = self.fake.server.data
+        original = data.activity
+        data.activity = [
+            dict(item, splits=[{'user_id': m['id'], 'amount': item['amount'] / 5} for m in data.members])
+            for item in original
+        ]
+        self.addCleanup(setattr, data, 'activity', original)
+
+    def test_settlement_plan_computed_locally_when_simplify_fails(self):
+        self.login(self.client)
+        self.split_activity()
+        self.fake.server.data.down.add('/api/groups/1/simplify')
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/simplify/')
+        self.assertTrue(response.context['computed_locally'])
+        self.assertContains(response, 'worked out from the group history')
+        self.assertTrue(response.context['txns'])
+        # A guessed plan is shown, never offered for payment.
+        self.assertNotContains(response, 'settle/')
+        self.assertEqual(cache.get(groupcache.debts_key(1)), None)
+
+    def test_no_local_plan_from_a_feed_without_splits(self):
+        self.login(self.client)
+        self.fake.server.data.down.add('/api/groups/1/simplify')
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/simplify/')
+        self.assertIsNone(response.context['txns'])
+        self.assertFalse(response.context['computed_locally'])
+        self.assertContains(response, 'settlement plan is unavailable')
+        self.assertNotContains(response, 'All settled up')
+
+    @override_settings(BACKEND_BREAKER_THRESHOLD=2)
+    def test_history_served_stale_during_outage(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            self.client.get('/groups/1/history/')
+            cache.delete(groupcache.members_key(1))
+            self.fake.server.data.down.update({'/api/groups/1/activity', '/api/groups/1/members'})
+            responses = [self.client.get('/groups/1/history/') for _ in range(3)]
+        for response in responses:
+            self.assertEqual(len(response.context['expenses']), 4)
+            self.assertTrue(response.context['backend_stale'])
+            self.assertContains(response, 'may be out of date')
+        # The third page load was answered without asking the backend at all.
+        self.assertEqual(self.fake.hits['/api/groups/1/activity'], 3)
+        self.assertEqual(breaker.state('/api/groups/{id}/activity'), breaker.OPEN)
+        self.assertIsNone(cache.get(groupcache.members_key(1)))
+
+    async def test_async_home_served_stale_during_outage(self):
+        self.login(self.async_client)
+        with override_settings(ROOT_URLCONF=_urlconf(async_views), GROUPS_SNAPSHOT_TTL=0):
+            fresh = await self.async_client.get('/')
+            self.fake.server.data.down.add('/api/groups')
+            stale = await self.async_client.get('/')
+        self.assertFalse(fresh.context['backend_stale'])
+        self.assertEqual(stale.context['groups'], fresh.context['groups'])
+        self.assertTrue(stale.context['backend_stale'])
+
+    def test_login_against_fake_backend(self):
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            ok = self.client.post('/login/', {'email': 'user2@example.com', 'password': 'x'})
+            bad = self.client.post('/login/', {'email': 'nobody@example.com', 'password': 'x'})
+        self.assertEqual(ok.status_code, 302)
+        self.assertEqual(self.client.session['user_id'], 2)
+        self.assertEqual(self.client.session['username'], 'user2')
+        self.assertContains(bad, 'invalid credentials')
+
+    def test_loadtest_command_runs_every_flow(self):
+        out = io.StringIO()
+        call_command('loadtest', users=2, iterations=12, latency=0, fail_errors=True, stdout=out)
+        report = out.getvalue()
+        for step in ('login', 'history', 'add_expense', 'settle', 'chat', 'logout'):
+            self.assertIn(step, report)
+        self.assertIn('errors=0', report)
+
+    def test_backend_get_revalidates_with_etag(self):
+        metrics.reset()
+        first = backend.get('/api/groups/1/members', token='t')
+        second = backend.get('/api/groups/1/members', token='t')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertFalse(backend.is_stale(second))
+        self.assertEqual(self.fake.hits['/api/groups/1/members'], 2)
+        exposition = metrics.exposition()
+        self.assertIn('web_ui_backend_calls_total{endpoint="/api/groups/{id}/members",status="304"} 1', exposition)
+
+    def test_last_good_copies_stay_out_of_the_default_cache(self):
+        url = backend.url_for('/api/groups/1/members')
+        headers = {'Authorization': 'Bearer t'}
+        backend.get('/api/groups/1/members', token='t')
+        self.assertIsNotNone(backend.last_good(url, headers))
+        self.assertIsNone(cache.get(backend.response_key(url, headers)))
+        self.assertIsInstance(backend.responses(), fragments.ByteBudgetCache)
+
+    def test_unchanged_history_page_is_not_rendered_again(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            first = self.client.get('/groups/1/history/')
+            again = self.client.get('/groups/1/history/', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.fake.server.data.activity.insert(0, dict(self.fake.server.data.activity[0], id=99))
+            self.addCleanup(self.fake.server.data.activity.pop, 0)
+            changed = self.client.get('/groups/1/history/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.templates, [])
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    async def test_async_home_answers_304(self):
+        self.login(self.async_client)
+        with override_settings(ROOT_URLCONF=_urlconf(async_views)):
+            first = await self.async_client.get('/')
+            again = await self.async_client.get('/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertIn('private', again['Cache-Control'])
+
+    def test_history_rows_render_from_fragment_cache_until_a_write(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            first = self.client.get('/groups/1/history/')
+            second = self.client.get('/groups/1/history/')
+            self.client.post('/add-expense/1/', {'amount': '30', 'description': 'Taxi', 'split_mode': 'equal_all'})
+            third = self.client.get('/groups/1/history/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(fragments.stats()['fragments']['expense_rows'], {'hit': 1, 'miss': 2})
+
+    def test_member_picker_is_not_served_to_outsiders_or_from_outages(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            self.assertContains(self.client.get('/add-expense/1/'), 'user2')
+            session = SessionStore()
+            session.update({'auth_token': 'outsider-token', 'user_id': 99})
+            session.save()
+            outsider = self.client_class()
+            outsider.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+            self.fake.server.data.down.add('/api/groups/1/members')
+            self.assertNotContains(outsider.get('/add-expense/1/'), 'user2')
+            # A picker rendered during the outage isn't kept either.
+            cache.clear()
+            backend.responses().clear()
+            self.assertContains(self.client.get('/add-expense/1/'), 'No members found')
+            self.fake.server.data.down.clear()
+            self.assertContains(self.client.get('/add-expense/1/'), 'user2')
+
+    def test_local_settlement_plan_is_not_served_after_recovery(self):
+        self.login(self.client)
+        self.split_activity()
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            self.fake.server.data.down.add('/api/groups/1/simplify')
+            local = self.client.get('/groups/1/simplify/')
+            self.fake.server.data.down.clear()
+            recovered = self.client.get('/groups/1/simplify/')
+        self.assertTrue(local.context['computed_locally'])
+        self.assertFalse(recovered.context['computed_locally'])
+        self.assertContains(recovered, '/groups/1/settle/')
+        self.assertContains(recovered, 'Total Debt: ₹10', count=1)
+        self.assertContains(recovered, 'Total Debt: ₹15', count=1)
+
+    def test_resubmitted_expense_is_sent_once(self):
+        self.login(self.client)
+        form = {'amount': '30', 'description': 'Taxi', 'split_mode': 'equal_all', 'idempotency_key': 'k1'}
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            first = self.client.post('/add-expense/1/', form)
+            second = self.client.post('/add-expense/1/', form)
+            self.client.post('/groups/1/settle/', {'payee_id': 1, 'payee_name': 'user1', 'amount': '5', 'idempotency_key': 'k2'})
+            self.client.post('/groups/1/settle/', {'payee_id': 1, 'payee_name': 'user1', 'amount': '5', 'idempotency_key': 'k2'})
+            self.client.post('/groups/1/settle/', {'payee_id': 2, 'payee_name': 'user2', 'amount': '5', 'idempotency_key': 'k2'})
+        self.assertEqual((first.status_code, second.status_code), (302, 302))
+        self.assertEqual(self.fake.hits['/api/expenses'], 1)
+        self.assertEqual(self.fake.hits['/api/settlements'], 2)
+
+    @override_settings(BACKEND_TIMEOUTS={'default': (1, 2), '/api/expenses': (1, 0.1)})
+    def test_timed_out_expense_is_not_sent_again(self):
+        self.login(self.client)
+        self.fake.server.latencies['/api/expenses'] = 0.4
+        self.addCleanup(self.fake.server.latencies.pop, '/api/expenses')
+        form = {'amount': '30', 'description': 'Taxi', 'split_mode': 'equal_all', 'idempotency_key': 'k1'}
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            first = self.client.post('/add-expense/1/', form)
+            retry = self.client.post('/add-expense/1/', dict(form, idempotency_key=first.context['idempotency_key']))
+        # The re-rendered form kept the key, and the retry wasn't sent.
+        self.assertEqual(first.context['idempotency_key'], 'k1')
+        for response in (first, retry):
+            self.assertIn('may have been saved', ' '.join(map(str, response.context['messages'])))
+        self.assertEqual(self.fake.hits['/api/expenses'], 1)
+
+    def test_rejected_expense_form_gets_a_new_key(self):
+        self.login(self.client)
+        form = {'amount': '30', 'description': 'Taxi', 'split_mode': 'equal_all', 'idempotency_key': 'k1'}
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            route = self.fake.server.data.route
+
+            def reject_expenses(method, path, body=None):
+                return (400, {'error': 'bad'}) if path == '/api/expenses' else route(method, path, body)
+
+            with mock.patch.object(self.fake.server.data, 'route', side_effect=reject_expenses):
+                rejected = self.client.post('/add-expense/1/', form)
+            invalid = self.client.post('/add-expense/1/', dict(form, amount='x', idempotency_key='k2'))
+        self.assertNotEqual(rejected.context['idempotency_key'], 'k1')
+        self.assertEqual(invalid.context['idempotency_key'], 'k2')
+
+    def test_server_timing_and_metrics(self):
+        self.login(self.client)
+        metrics.reset()
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/history/')
+            scrape = self.client.get('/metrics/').content.decode()
+        timing = response['Server-Timing']
+        self.assertIn('backend;desc="2 calls"', timing)
+        self.assertIn('/api/groups/{id}/activity 200', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('web_ui_backend_calls_total{endpoint="/api/groups/{id}/members",status="200"} 1', scrape)
+        self.assertIn('web_ui_requests_total{status="200",view="group_expenses"} 1', scrape)
+        self.assertIn('web_ui_render_seconds_count{template="web_ui/group_expenses.html"} 1', scrape)
+        self.assertIn('# TYPE web_ui_fragment_cache_entries gauge\nweb_ui_fragment_cache_entries ', scrape)
+        self.assertIn('# TYPE web_ui_chat_upstreams gauge\nweb_ui_chat_upstreams 0\n', scrape)
+        self.assertEqual(scrape.count('# TYPE web_ui_singleflight_total counter'), 1)
+        self.assertIn('web_ui_singleflight_total{result="sent"} 2', scrape)
+
+    def test_server_timing_detail_only_for_metrics_clients(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/history/', REMOTE_ADDR='203.0.113.7')
+        timing = response['Server-Timing']
+        self.assertIn('backend;desc="2 calls"', timing)
+        self.assertNotIn('/api/groups/', timing)
+
+    async def test_async_server_timing(self):
+        self.login(self.async_client)
+        with override_settings(ROOT_URLCONF=_urlconf(async_views)):
+            response = await self.async_client.get('/groups/1/history/')
+        self.assertIn('backend;desc="2 calls"', response['Server-Timing'])
+
+    @override_settings(PROFILER_ENABLED=True)
+    def test_profile_toggle(self):
+        self.login(self.client)
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/groups/1/history/', {'_profile': '1'})
+        self.assertIn('load_history', response.content.decode())
+
+    def test_metrics_only_served_locally(self):
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_add_saves_every_valid_row(self):
+        self.login(self.client)
+        rows = "amount, description\n30, Taxi, equal_subset, user1;user2\n90, Dinner, custom, user1:60;3:30\n"
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.post('/add-expense/1/bulk/', {'rows': rows})
+        self.assertEqual([r['status'] for r in response.context['results']], ['saved', 'saved'])
+        self.assertEqual(self.fake.hits['/api/expenses'], 2)
+
+    def test_bulk_add_sends_nothing_if_a_row_is_invalid(self):
+        self.login(self.client)
+        rows = "30, Taxi\n90, Dinner, custom, user1:60;user2:10\n"
+        with override_settings(ROOT_URLCONF=_urlconf(views)):
+            response = self.client.post('/add-expense/1/bulk/', {'rows': rows})
+        self.assertEqual([r['status'] for r in response.context['results']], ['valid', 'invalid'])
+        self.assertEqual(self.fake.hits['/api/expenses'], 0)
+
+
+def _jwt(claims):
+    body = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return f"header.{body}.signature"
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cache',
+    CHAT_RELAY_ENABLED=True, CHAT_HISTORY_SIZE=5, CHAT_CLIENT_QUEUE=4,
+)
+class ChatRelayTests(SimpleTestCase):
+    """The websocket relay against the in-process chat stand-in."""
+
+    def setUp(self):
+        self.chat = FakeChat(FakeData(chat=8))
+        patcher = mock.patch.object(chat_relay, 'connect', self.chat.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def tab(self, group_id=1, logged_in=True, **kwargs):
+        cookies = {}
+        if logged_in:
+            session = SessionStore()
+            session['auth_token'] = 'test-token'
+            await session.asave()
+            cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        tab = WebSocketClient(chat_relay.application, f'/ws/chat/{group_id}', cookies=cookies, **kwargs)
+        await tab.connect()
+        return tab
+
+    async def test_tabs_share_one_upstream_and_history(self):
+        first = await self.tab()
+        history = await first.receive_json()
+        self.assertEqual([m['messageID'] for m in history['messages']], [4, 5, 6, 7, 8])
+        second = await self.tab()
+        self.assertEqual(await second.receive_json(), history)
+        self.assertEqual(self.chat.opened, 1)
+
+        await second.send_json({"type": "chat", "message": "hi", "userID": 2, "username": "user2"})
+        for tab in (first, second):
+            frame = await tab.receive_json()
+            self.assertEqual([m['message'] for m in frame['messages']], ['hi'])
+        third = await self.tab()
+        self.assertEqual([m['messageID'] for m in (await third.receive_json())['messages']], [5, 6, 7, 8, 9])
+        for tab in (first, second, third):
+            await tab.disconnect()
+        self.assertEqual(chat_relay.stats()['clients'], 0)
+        await chat_relay.aclose()
+
+    async def test_image_message_keeps_thumbnail_and_size(self):
+        tab = await self.tab()
+        await tab.receive_json()
+        await tab.send_json({
+            "type": "chat", "userID": 2, "file_url": "/uploads/files/a.jpg", "file_type": "image",
+            "thumb_url": "/uploads/files/a-thumb.jpg", "width": 640, "height": 480,
+        })
+        [message] = (await tab.receive_json())['messages']
+        self.assertEqual(message['thumb_url'], '/uploads/files/a-thumb.jpg')
+        self.assertEqual((message['width'], message['height']), (640, 480))
+        await tab.disconnect()
+        await chat_relay.aclose()
+
+    async def test_upstream_reconnect_only_forwards_new_messages(self):
+        tab = await self.tab()
+        await tab.receive_json()
+        with self.assertLogs('web_ui.chat_relay', 'WARNING'):
+            self.chat.drop(1)
+            self.chat.post(1, {"message": "while away", "userID": 1})
+            frame = await tab.receive_json()
+        self.assertEqual([m['message'] for m in frame['messages']], ['while away'])
+        self.assertEqual(self.chat.opened, 2)
+        await tab.disconnect()
+        await chat_relay.aclose()
+
+    async def test_slow_tab_is_disconnected(self):
+        slow = await self.tab(buffer=1)
+        fast = await self.tab()
+        await fast.receive_json()
+        for i in range(6):
+            self.chat.post(1, {"message": f"burst {i}", "userID": 1})
+            await fast.receive_json()
+        # The slow tab read nothing while the burst overflowed its queue; it
+        # gets what was already in flight, then the close.
+        received = []
+        while (text := await slow.receive()) is not None:
+            received.append(text)
+        self.assertLess(len(received), 7)
+        self.assertEqual(slow.close_code, chat_relay.TRY_AGAIN_LATER)
+        self.assertEqual(chat_relay.stats()['clients'], 1)
+        await fast.disconnect()
+        await chat_relay.aclose()
+
+    @override_settings(CHAT_BATCH_WINDOW=0.05, CHAT_BATCH_MAX=4)
+    async def test_bursts_are_batched_into_one_frame(self):
+        tab = await self.tab()
+        await tab.receive_json()
+        for i in range(6):
+            self.chat.post(1, {"message": f"burst {i}", "userID": 1})
+        first, second = await tab.receive_json(), await tab.receive_json()
+        self.assertEqual(len(first['messages']), 4)  # CHAT_BATCH_MAX flushes early
+        self.assertEqual([m['message'] for m in second['messages']], ['burst 4', 'burst 5'])
+        await tab.disconnect()
+        await chat_relay.aclose()
+
+    async def test_refuses_anonymous_and_cross_site_sockets(self):
+        anonymous = await self.tab(logged_in=False)
+        self.assertEqual(anonymous.close_code, chat_relay.POLICY_VIOLATION)
+        foreign = await self.tab(headers=[('origin', 'https://evil.example')])
+        self.assertEqual(foreign.close_code, chat_relay.POLICY_VIOLATION)
+        self.assertEqual(self.chat.opened, 0)
+
+    def test_chat_page_points_at_the_relay(self):
+        request = RequestFactory().get('/groups/1/chat/')
+        request.session = {'auth_token': 'test-token', 'user_id': 1, 'username': 'user1'}
+        self.assertEqual(views.chat_context(request, 1)['ws_backend_url'], 'ws://testserver/ws')
+        with override_settings(CHAT_RELAY_ENABLED=False, WS_BACKEND_URL='ws://go:8080'):
+            self.assertEqual(views.chat_context(request, 1)['ws_backend_url'], 'ws://go:8080')
+
+
+class IdentityTests(SimpleTestCase):
+    def test_claims_decoded_once_per_token(self):
+        session = {}
+        identity.remember_token(session, _jwt({'user_id': 7, 'username': 'asha', 'exp': 4102444800}))
+        self.assertEqual(session['user_id'], 7)
+        self.assertEqual(session['username'], 'asha')
+        with mock.patch.object(identity, 'decode_claims') as decode:
+            self.assertEqual(identity.get_claims(session)['user_id'], 7)
+        decode.assert_not_called()
+        self.assertFalse(identity.token_expired(session))
+
+    def test_group_snapshot_dropped_on_new_token(self):
+        session = {}
+        identity.remember_token(session, _jwt({'user_id': 1}))
+        identity.store_groups(session, [{'id': 1}])
+        self.assertEqual(identity.cached_groups(session), [{'id': 1}])
+        session['auth_token'] = _jwt({'user_id': 2})
+        self.assertIsNone(identity.cached_groups(session))
+
+
+class FeedTests(SimpleTestCase):
+    activity = [
+        {'id': i, 'created_at': f'2026-01-{i:02d}T00:00:00Z'} for i in range(1, 11)
+    ]
+
+    def test_pages_walk_the_feed_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = feed.window(self.activity, cursor, 4)
+            seen.extend(item['id'] for item in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(range(10, 0, -1)))
+
+    def test_cursor_and_limit_passed_to_backend(self):
+        self.assertEqual(
+            feed.activity_path(3, '2026-01-05T00:00:00Z|5', 4),
+            '/api/groups/3/activity?before=2026-01-05T00%3A00%3A00Z%7C5&limit=5',
+        )
+
+
+class LoaderTests(SimpleTestCase):
+    def response(self, status=200, body=None, stale=False):
+        res = requests.Response()
+        res.status_code = status
+        res._content = json.dumps(body).encode() if body is not None else b'not json'
+        res.stale = stale
+        return res
+
+    def test_members_parsing(self):
+        members = [{'id': 1, 'username': 'user1'}]
+        self.assertEqual(loaders.members(self.response(body=members)), (members, True))
+        self.assertEqual(loaders.members(self.response(body=members, stale=True)), (members, False))
+        self.assertEqual(loaders.members(self.response(500, {'error': 'x'})), (None, False))
+        self.assertEqual(loaders.members(self.response()), (None, False))
+        self.assertEqual(loaders.members(None), (None, False))
+        self.assertEqual(loaders.members_or_error(self.response(body={'not': 'a list'}))[2], "Backend returned invalid JSON for members.")
+
+    def test_group_parts_cache_only_fresh_data(self):
+        txns = [{'from': 2, 'to': 1, 'amount': 5}]
+        results = {
+            (1, 'members'): self.response(body=[{'id': 1, 'username': 'user1'}], stale=True),
+            (1, 'simplify'): self.response(body=txns),
+            (1, 'activity'): None,
+        }
+        members, index, recent, store, observed = loaders.group_parts(1, (None, None, None), results)
+        self.assertEqual(members, [{'id': 1, 'username': 'user1'}])
+        self.assertEqual(index['all'], txns)
+        self.assertIsNone(recent)
+        self.assertEqual(store, {'debts': txns})
+        self.assertEqual(observed, [('/api/groups/1/simplify', None)])
+
+
+class BulkParseTests(SimpleTestCase):
+    members = [{'id': 1, 'username': 'Asha'}, {'id': 2, 'username': 'ravi'}]
+
+    def test_members_by_name_or_id(self):
+        row = bulk.parse_row(['100', 'Rent', 'custom', 'asha:70; 2:30'], self.members)
+        self.assertEqual(row['values'], {1: '70', 2: '30'})
+        self.assertEqual(bulk.parse_row(['10', 'Tea'], self.members)['split_mode'], 'equal_all')
+
+    def test_bad_rows_raise(self):
+        for cells in (['x', 'Tea'], ['-5', 'Tea'], ['5', 'Tea', 'weird'], ['5', 'Tea', 'equal_subset', 'nobody']):
+            with self.assertRaises(ValueError):
+                bulk.parse_row(cells, self.members)
+
+
+class SplitTests(SimpleTestCase):
+    members = [{'id': i, 'username': f'user{i}'} for i in range(1, 4)]
+
+    def test_allocate_properties(self):
+        # Property check over seeded random inputs: exact sum, each share within
+        # one cent of the exact proportion, and stable across calls.
+        rng = random.Random(1234)
+        for _ in range(500):
+            total = rng.randint(1, 10_000_000)
+            weights = [rng.randint(0, 50) for _ in range(rng.randint(1, 40))]
+            weights[0] += 1
+            shares = splits.allocate(total, weights)
+            self.assertEqual(sum(shares), total)
+            for share, w in zip(shares, weights):
+                self.assertLess(abs(share * sum(weights) - total * w), sum(weights))
+            self.assertEqual(shares, splits.allocate(total, weights))
+
+    @skipIf(splits.np is None, 'numpy not installed')
+    def test_allocate_numpy_matches_pure_python(self):
+        rng = random.Random(4321)
+        for _ in range(200):
+            total = rng.randint(1, 10_000_000)
+            weights = [rng.randint(0, 10_000) for _ in range(rng.randint(1, 60))]
+            weights[-1] += 1
+            pure = splits.allocate(total, weights)
+            with mock.patch.object(splits, 'NUMPY_MIN_WEIGHTS', 1):
+                self.assertEqual(splits.allocate(total, weights), pure)
+
+    def test_remainder_goes_to_earliest_members(self):
+        self.assertEqual(splits.split(100, 'equal_all', self.members), [(1, 34), (2, 33), (3, 33)])
+        self.assertEqual(splits.split(200, 'equal_subset', self.members, ['3', '1']), [(1, 100), (3, 100)])
+
+    def test_weighted_modes(self):
+        self.assertEqual(
+            splits.split(1000, 'percentage', self.members, values={1: '50', 2: '33.33', 3: '16.67'}),
+            [(1, 500), (2, 333), (3, 167)],
+        )
+        self.assertEqual(splits.split(1001, 'shares', self.members, values={1: '2', 2: '', 3: '1'}), [(1, 667), (3, 334)])
+
+    def test_custom_must_match_exactly(self):
+        self.assertEqual(splits.split(1000, 'custom', self.members, values={1: '7.5', 2: '2.50'}), [(1, 750), (2, 250)])
+        with self.assertRaises(splits.SplitError):
+            splits.split(1000, 'custom', self.members, values={1: '7.5', 2: '2.49'})
+        with self.assertRaises(splits.SplitError):
+            splits.split(1000, 'percentage', self.members, values={1: '50', 2: '49.99'})
+        with self.assertRaises(splits.SplitError):
+            splits.split(1000, 'equal_subset', self.members, [9])
+
+    def test_to_cents_rounds_half_up(self):
+        self.assertEqual(splits.to_cents('0.105'), 11)
+        self.assertEqual(splits.to_cents(19.99), 1999)
+        with self.assertRaises(ValueError):
+            splits.to_cents('abc')
+
+
+class DebtTests(SimpleTestCase):
+    def test_transfers_settle_every_balance(self):
+        rng = random.Random(42)
+        for _ in range(300):
+            values = [rng.randint(-5000, 5000) for _ in range(rng.randint(1, 9))]
+            balances = {i: v for i, v in enumerate(values + [-sum(values)], start=1) if v}
+            greedy = debts.settle_greedy(balances)
+            exact = debts.settle_exact(balances)
+            for transfers in (greedy, exact):
+                left = dict(balances)
+                for debtor, creditor, cents in transfers:
+                    self.assertGreater(cents, 0)
+                    left[debtor] += cents
+                    left[creditor] -= cents
+                self.assertFalse(any(left.values()))
+            self.assertLessEqual(len(exact), len(greedy))
+            self.assertLessEqual(len(greedy), max(len(balances) - 1, 0))
+
+    def test_exact_uses_zero_sum_subsets(self):
+        balances = {1: 2, 2: 8, 3: -4, 4: -3, 5: 3, 6: -6}
+        self.assertEqual(len(debts.settle_greedy(balances)), 5)
+        self.assertEqual(len(debts.settle_exact(balances)), 4)
+
+    def test_balances_from_activity(self):
+        activity = [
+            {'payer_id': 1, 'payee_id': 0, 'amount': 30, 'splits': [{'user_id': u, 'amount': 10} for u in (1, 2, 3)]},
+            {'payer_id': 2, 'payee_id': 0, 'amount': 10, 'splits': [{'user_id': 1, 'amount': 10}]},
+            {'payer_id': 3, 'payee_id': 1, 'amount': 5},
+        ]
+        self.assertEqual(debts.balances_from_activity(activity), {1: 500, 3: -500})
+
+    def test_no_local_plan_without_every_split(self):
+        members = [{'id': 1, 'username': 'user1'}, {'id': 2, 'username': 'user2'}]
+        activity = [{'id': 7, 'payer_id': 1, 'payee_id': 0, 'amount': 30}]
+        with self.assertLogs('web_ui.debts', 'INFO'):
+            self.assertIsNone(debts.local_txns(activity, members))
+            self.assertIsNone(debts.cross_check(1, [], activity))
+        settled = [{'payer_id': 1, 'payee_id': 0, 'amount': 30, 'splits': [{'user_id': 2, 'amount': 30}]}]
+        self.assertEqual([(t['from'], t['to']) for t in debts.local_txns(settled, members)], [(2, 1)])
+        with self.assertLogs('web_ui.debts', 'WARNING'):
+            self.assertIsNone(debts.local_txns(settled, [{'username': 'no id'}]))
+
+
+class IdempotencyTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = types.SimpleNamespace(session=SessionStore())
+        self.request.session['user_id'] = 1
+
+    def test_concurrent_submits_share_one_call(self):
+        calls = []
+
+        def send():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'status': 201, 'text': 'ok'}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(idempotency.run_once(self.request, 'k', send)))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'status': 201, 'text': 'ok'}] * 5)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.1, BACKEND_TIMEOUTS={'default': (0.1, 0.2)})
+    def test_slow_write_is_not_sent_twice_after_the_wait(self):
+        calls = []
+
+        def send():
+            calls.append(1)
+            time.sleep(0.5)
+            return {'status': 201, 'text': 'ok'}
+
+        first = threading.Thread(target=idempotency.run_once, args=(self.request, 'k', send, '/api/expenses'))
+        first.start()
+        time.sleep(0.2)  # past IDEMPOTENCY_WAIT, still inside the write's timeouts
+        with self.assertRaises(idempotency.StillRunning):
+            idempotency.run_once(self.request, 'k', send, '/api/expenses')
+        first.join()
+        self.assertEqual(len(calls), 1)
+        self.assertGreaterEqual(idempotency.pending_ttl('/api/expenses'), 0.3 + idempotency.PENDING_MARGIN)
+
+    def test_unanswered_write_is_never_resent(self):
+        calls = []
+
+        def send():
+            calls.append(1)
+            raise requests.exceptions.ReadTimeout()
+
+        for _ in range(2):
+            with self.assertRaises(idempotency.OutcomeUnknown):
+                idempotency.run_once(self.request, 'k', send)
+        self.assertEqual(len(calls), 1)
+
+    def test_write_that_was_never_sent_can_be_retried(self):
+        responses = iter([backend.CircuitOpen('open'), {'status': 201, 'text': 'ok'}])
+
+        def send():
+            res = next(responses)
+            if isinstance(res, Exception):
+                raise res
+            return res
+
+        with self.assertRaises(backend.CircuitOpen):
+            idempotency.run_once(self.request, 'k', send)
+        self.assertEqual(idempotency.run_once(self.request, 'k', send)['status'], 201)
+
+    async def test_async_unanswered_write_is_never_resent(self):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            raise httpx.ReadTimeout('slow')
+
+        for _ in range(2):
+            with self.assertRaises(idempotency.OutcomeUnknown):
+                await idempotency.arun_once(self.request, 'k', send)
+        self.assertEqual(len(calls), 1)
+
+    def test_server_errors_can_be_retried(self):
+        responses = iter([{'status': 503, 'text': 'down'}, {'status': 201, 'text': 'ok'}])
+        self.assertEqual(idempotency.run_once(self.request, 'k', lambda: next(responses))['status'], 503)
+        self.assertEqual(idempotency.run_once(self.request, 'k', lambda: next(responses))['status'], 201)
+        self.assertEqual(idempotency.run_once(self.request, 'k', lambda: next(responses))['status'], 201)
+
+
+class AssetTests(SimpleTestCase):
+    def render_base(self):
+        request = RequestFactory().get('/')
+        request.session = {}
+        return render_to_string('web_ui/base.html', request=request)
+
+    def test_tailwind_from_cdn_by_default(self):
+        with override_settings(TAILWIND_PREBUILT=False):
+            html = self.render_base()
+        self.assertIn('cdn.tailwindcss.com', html)
+
+    def test_prebuilt_stylesheet_replaces_cdn(self):
+        with override_settings(TAILWIND_PREBUILT=True):
+            html = self.render_base()
+        self.assertIn('/static/styles.css', html)
+        self.assertNotIn('cdn.tailwindcss.com', html)
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def load_settings(self, **env):
+        env = {**os.environ, 'DJANGO_ENV': 'production', 'DJANGO_SECRET_KEY': 'k', 'ALLOWED_HOSTS': 'example.com', **env}
+        return subprocess.run(
+            [sys.executable, '-c', 'import frontend_server.settings'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+
+    def test_production_loads_when_configured(self):
+        result = self.load_settings()
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_production_requires_secret_key(self):
+        result = self.load_settings(DJANGO_SECRET_KEY='')
+        self.assertIn('ImproperlyConfigured: DJANGO_SECRET_KEY', result.stderr)
+
+    def test_production_requires_allowed_hosts(self):
+        result = self.load_settings(ALLOWED_HOSTS='')
+        self.assertIn('ImproperlyConfigured: ALLOWED_HOSTS', result.stderr)
+
+
+class UploadTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        storage = {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': os.path.join(tmp.name, 'files'), 'base_url': '/uploads/files/'},
+        }
+        overrides = override_settings(
+            UPLOAD_TEMP_DIR=os.path.join(tmp.name, 'parts'), UPLOAD_CHUNK_SIZE=4, UPLOAD_MAX_BYTES=10,
+            STORAGES={**settings.STORAGES, 'chat_uploads': storage},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.login(1)
+
+    def login(self, user_id):
+        session = SessionStore()
+        session['auth_token'] = 'test-token'
+        session['user_id'] = user_id
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def start(self, size=10):
+        response = self.client.post('/uploads/', {'name': '../notes.txt', 'size': size}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, first, data, size=10):
+        return self.client.put(f'/uploads/{upload_id}/', data, content_type='application/octet-stream',
+                               headers={'Content-Range': f'bytes {first}-{first + len(data) - 1}/{size}'})
+
+    def test_chunks_resume_and_finish_in_storage(self):
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, b'0123').json()['offset'], 4)
+        # A reloaded page asks where to carry on.
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').json()['offset'], 4)
+        self.put(upload_id, 4, b'4567')
+        done = self.put(upload_id, 8, b'89').json()
+        self.assertTrue(done['url'].startswith('/uploads/files/'))
+        self.assertTrue(done['url'].endswith('/notes.txt'))
+        response = self.client.get(done['url'])
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').status_code, 404)
+
+    def test_chunk_at_the_wrong_offset_gets_the_current_one(self):
+        upload_id = self.start()
+        self.put(upload_id, 0, b'0123')
+        response = self.put(upload_id, 0, b'0123')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4)
+
+    def test_limits(self):
+        response = self.client.post('/uploads/', {'name': 'big', 'size': 11}, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        upload_id = self.start()
+        self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 413)
+        self.assertEqual(self.put(upload_id, 0, b'0123', size=12).status_code, 400)
+
+    def test_uploads_belong_to_their_user(self):
+        upload_id = self.start()
+        self.login(2)
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').status_code, 404)
+        self.assertEqual(self.put(upload_id, 0, b'0123').status_code, 404)
+
+    def test_login_required(self):
+        self.client.cookies.clear()
+        response = self.client.post('/uploads/', {'name': 'a', 'size': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_cleanup_removes_stale_parts(self):
+        upload_id = self.start()
+        self.assertEqual(uploads.cleanup(3600), 0)
+        self.assertEqual(uploads.cleanup(-1), 1)
+        self.assertEqual(self.client.get(f'/uploads/{upload_id}/').status_code, 404)
@@ -0,0 +1,183 @@
+"""Chunked, resumable uploads for chat attachments.
+
+``chat.html`` uploads attachments in ``UPLOAD_CHUNK_SIZE`` pieces to the
+storage target named by ``CHAT_UPLOAD_TARGET``: Cloudinary directly, or this
+app (the "local" target, below). The local target speaks a small tus-like
+protocol:
+
+* ``POST /uploads/`` with ``{"name", "size", "type"}`` starts an upload and
+  returns its id;
+* ``GET /uploads/<id>/`` returns the number of bytes received so far, so an
+  interrupted upload resumes from there;
+* ``PUT /uploads/<id>/`` with ``Content-Range: bytes start-end/size`` appends
+  one chunk. A chunk that doesn't start at the current offset is refused
+  with 409 and that offset.
+
+Chunks go to ``UPLOAD_TEMP_DIR``, where unfinished uploads are removed after
+``UPLOAD_TEMP_TTL`` seconds. The finished file is saved to the
+``chat_uploads`` storage (the filesystem by default; any Django storage
+backend works) and its URL returned with the last chunk.
+"""
+import fcntl
+import json
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.utils.text import get_valid_filename
+
+STORAGE_ALIAS = 'chat_uploads'
+
+_ID_RE = re.compile(r'[0-9a-f]{32}')
+_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+_last_cleanup = 0.0
+
+
+class UploadError(Exception):
+    """The request can't be applied; ``status`` is the HTTP status to answer."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _paths(upload_id):
+    if not _ID_RE.fullmatch(upload_id or ''):
+        raise UploadError("Unknown upload", status=404)
+    base = os.path.join(settings.UPLOAD_TEMP_DIR, upload_id)
+    return base + '.json', base + '.part'
+
+
+def _load(upload_id, user_id):
+    meta_path, part_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise UploadError("Unknown upload", status=404)
+    # Other users' uploads don't exist, as far as they can tell.
+    if meta['user_id'] != user_id:
+        raise UploadError("Unknown upload", status=404)
+    return meta, part_path
+
+
+def start(user_id, name, size, content_type=''):
+    """Begin an upload of ``size`` bytes; returns its state."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Missing file size")
+    if size < 1:
+        raise UploadError("The file is empty")
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise UploadError(f"Files can be at most {settings.UPLOAD_MAX_BYTES // (1024 * 1024)} MB", status=413)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    _cleanup_now_and_then()
+    upload_id = uuid.uuid4().hex
+    meta = {
+        'id': upload_id,
+        'user_id': user_id,
+        'name': get_valid_filename(os.path.basename(name or '')) or 'file',
+        'size': size,
+        'type': (content_type or '')[:100],
+        'created': time.time(),
+    }
+    meta_path, part_path = _paths(upload_id)
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return {'id': upload_id, 'offset': 0, 'size': size, 'chunk_size': settings.UPLOAD_CHUNK_SIZE}
+
+
+def status(upload_id, user_id):
+    meta, part_path = _load(upload_id, user_id)
+    return {'id': upload_id, 'offset': os.path.getsize(part_path), 'size': meta['size']}
+
+
+def parse_range(header):
+    """(start, end exclusive, total) from a ``Content-Range`` header."""
+    match = _RANGE_RE.fullmatch((header or '').strip())
+    if not match:
+        raise UploadError("Content-Range must look like 'bytes start-end/size'")
+    first, last, total = map(int, match.groups())
+    if last < first:
+        raise UploadError("Content-Range ends before it starts")
+    return first, last + 1, total
+
+
+def write_chunk(upload_id, user_id, content_range, stream):
+    """Append one chunk read from ``stream``; returns the new state, with
+    ``url`` once the upload is complete."""
+    meta, part_path = _load(upload_id, user_id)
+    first, end, total = parse_range(content_range)
+    if total != meta['size'] or end > total:
+        raise UploadError("Content-Range doesn't match the upload")
+    if end - first > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError(f"Chunks can be at most {settings.UPLOAD_CHUNK_SIZE} bytes", status=413)
+
+    with open(part_path, 'r+b') as part:
+        # One writer at a time, also across worker processes.
+        fcntl.flock(part, fcntl.LOCK_EX)
+        offset = part.seek(0, os.SEEK_END)
+        if first != offset:
+            raise UploadError("Chunk doesn't start at the current offset", status=409, offset=offset)
+        remaining = end - first
+        while remaining:
+            block = stream.read(min(remaining, 64 * 1024))
+            if not block:
+                break
+            part.write(block)
+            remaining -= len(block)
+        if remaining:
+            part.truncate(offset)
+            raise UploadError("The chunk was cut short", offset=offset)
+
+    state = {'id': upload_id, 'offset': end, 'size': meta['size']}
+    if end == meta['size']:
+        state['url'] = _finish(meta, part_path)
+    return state
+
+
+def _finish(meta, part_path):
+    storage = storages[STORAGE_ALIAS]
+    with open(part_path, 'rb') as f:
+        name = storage.save(f"{meta['id'][:2]}/{meta['id']}/{meta['name']}", File(f))
+    os.remove(part_path)
+    os.remove(_paths(meta['id'])[0])
+    return storage.url(name)
+
+
+def _cleanup_now_and_then():
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup > 3600:
+        _last_cleanup = now
+        cleanup(settings.UPLOAD_TEMP_TTL)
+
+
+def cleanup(max_age):
+    """Remove unfinished uploads untouched for ``max_age`` seconds."""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        names = os.listdir(settings.UPLOAD_TEMP_DIR)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        upload_id, ext = os.path.splitext(name)
+        if ext != '.part':
+            continue
+        meta_path, part_path = _paths(upload_id)
+        try:
+            if os.path.getmtime(part_path) < cutoff:
+                os.remove(part_path)
+                os.remove(meta_path)
+                removed += 1
+        except (FileNotFoundError, UploadError):
+            pass
+    return removed
@@ -1,18 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-#app_name="web_ui"
-urlpatterns = [
-    path("", views.home, name="home"),
-    path("login/", views.login_page, name="login"),
-    path("signup/", views.signup_page, name="signup"),
-    path("dashboard/", views.dashboard_page, name="dashboard"),
-    path("logout/", views.logout_user, name="logout"),
-    path("create-group/", views.create_group, name="create_group"),
-    path("join-group/", views.join_group, name="join_group"),
-    path("add-expense/<int:group_id>/", views.add_expense, name="add_expense"),
-    path("groups/<int:group_id>/simplify/", views.simplify_group, name="simplify"),
-    path('groups/<int:group_id>/settle/', views.settle_debt, name='settle_debt'),
-    path('groups/<int:group_id>/history/', views.group_expenses, name='group_expenses'),
-    path('groups/<int:group_id>/chat/', views.chat_page, name='group_chat'),
-]
+
+def build_urlpatterns(v):
+    """Routes for the given views module (``views`` or ``async_views``)."""
+    return [
+        path("", v.home, name="home"),
+        path("login/", v.login_page, name="login"),
+        path("signup/", v.signup_page, name="signup"),
+        path("dashboard/", v.dashboard_page, name="dashboard"),
+        path("logout/", v.logout_user, name="logout"),
+        path("create-group/", v.create_group, name="create_group"),
+        path("join-group/", v.join_group, name="join_group"),
+        path("add-expense/<int:group_id>/", v.add_expense, name="add_expense"),
+        path("add-expense/<int:group_id>/bulk/", v.bulk_add_expense, name="bulk_add_expense"),
+        path("groups/<int:group_id>/simplify/", v.simplify_group, name="simplify"),
+        path('groups/<int:group_id>/settle/', v.settle_debt, name='settle_debt'),
+        path('groups/<int:group_id>/history/', v.group_expenses, name='group_expenses'),
+        path('groups/<int:group_id>/history/more/', v.group_expenses_more, name='group_expenses_more'),
+        path('groups/<int:group_id>/chat/', v.chat_page, name='group_chat'),
+        path('uploads/', v.upload_start, name='upload_start'),
+        path('uploads/files/<path:name>', v.upload_file, name='upload_file'),
+        path('uploads/<str:upload_id>/', v.upload_chunk, name='upload_chunk'),
+        path('metrics/', v.metrics_page, name='metrics'),
+    ]
+
+
+if settings.WEB_UI_ASYNC_VIEWS:
+    from . import async_views
+    urlpatterns = build_urlpatterns(async_views)
+else:
+    #app_name="web_ui"
+    urlpatterns = build_urlpatterns(views)
@@ -1,52 +1,67 @@
+import json
+import logging
 import token
 import requests
 import re
-import json
 import os
-import base64
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import storages
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.conf import settings
 from django.contrib import messages 
 
-GO_BACKEND_URL = os.getenv('GO_BACKEND_URL','http://127.0.0.1:8080')
+from . import backend, breaker, bulk, chat_relay, conditional, debts, feed, fragments, groupcache, identity, idempotency, loaders, metrics, overview, splits, uploads
+
+logger = logging.getLogger(__name__)
+
+GO_BACKEND_URL = settings.GO_BACKEND_URL
 
 
 def get_current_user_id(request):
-    """Extract user ID — session cache first, JWT fallback."""
+    """Extract user ID — session cache first, JWT claims fallback."""
     if request.session.get('user_id'):
         return int(request.session['user_id'])
-    
-    token = request.session.get("auth_token")
-    if not token:
+
+    claims = identity.get_claims(request.session)
+    if not claims or claims.get('user_id') is None:
         return None
-    
     try:
-        parts = token.split('.')
-        if len(parts) < 2: return None
-        # Fix padding
-        payload = parts[1] + '=' * (-len(parts[1]) % 4)
-        data = json.loads(base64.urlsafe_b64decode(payload))
-        return int(data.get('user_id'))
-    except Exception as e:
-        print(f"Token decode error: {e}")
+        return int(claims['user_id'])
+    except (TypeError, ValueError):
         return None
 
-def get_current_username(request):
-    """Extract username — session cache first, JWT fallback."""
+def get_current_username(request, group_id=None):
+    """Extract username — session cache, JWT claims, then group members.
+
+    The members fallback only runs when a ``group_id`` is given, and goes
+    through the shared members cache; the answer is kept in the session.
+    """
     if request.session.get('username'):
         return request.session['username']
-    
-    token = request.session.get("auth_token")
-    if not token:
-        return None
-    
-    try:
-        parts = token.split('.')
-        if len(parts) < 2: return None
-        payload = parts[1] + '=' * (-len(parts[1]) % 4)
-        data = json.loads(base64.urlsafe_b64decode(payload))
-        return data.get('username', f"User {data.get('user_id', '?')}")
-    except Exception:
+
+    claims = identity.get_claims(request.session)
+    if claims is None:
         return None
+    if claims.get('username'):
+        return claims['username']
+
+    uid = get_current_user_id(request)
+    if group_id is not None and uid is not None:
+        members = groupcache.cached_members(request, group_id)
+        if members is None:
+            try:
+                members, fresh = loaders.members(backend.get(loaders.members_path(group_id), request))
+            except requests.exceptions.RequestException:
+                members, fresh = None, False
+            if fresh:
+                groupcache.store_members(group_id, members)
+        username = loaders.username_in(members, uid)
+        if username:
+            request.session['username'] = username
+            return username
+    return f"User {claims.get('user_id', '?')}"
 
 
 def signup_page(request):
@@ -64,7 +79,7 @@ def signup_page(request):
         }
 
         try:
-            response = requests.post(f"{GO_BACKEND_URL}/api/signup", json=payload)
+            response = backend.post("/api/signup", json=payload)
 
             if response.status_code == 201:
                 messages.success(request, "Account created! Please log in.")
@@ -73,7 +88,7 @@ def signup_page(request):
                 error_msg = response.json().get('error', 'Signup failed')
                 return render(request, 'web_ui/signup.html', {'error': error_msg})
 
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             return render(request, 'web_ui/signup.html', {'error': 'Cannot connect to Backend Server'})
 
     return render(request, 'web_ui/signup.html')
@@ -90,7 +105,7 @@ def login_page(request):
         }
 
         try:
-            response = requests.post(f"{GO_BACKEND_URL}/api/login", json=payload)
+            response = backend.post("/api/login", json=payload)
 
             if response.status_code == 200:
                 try:
@@ -99,39 +114,12 @@ def login_page(request):
                 except ValueError:
                     return render(request, 'web_ui/login.html', {'error': 'Backend returned invalid JSON'})
 
-            
-                request.session['auth_token'] = token
-                request.session['user_email'] = email
-
-               
-                try:
-                    parts = token.split('.')
-                    padded = parts[1] + '=' * (-len(parts[1]) % 4)
-                    jwt_data = json.loads(base64.urlsafe_b64decode(padded))
-                    if jwt_data.get('user_id'):
-                        request.session['user_id'] = int(jwt_data['user_id'])
-                except Exception:
-                    pass
 
-                try:
-                    headers = {"Authorization": f"Bearer {token}"}
-                    uid = request.session.get('user_id')
-                    groups_res = requests.get(f"{GO_BACKEND_URL}/api/groups", headers=headers)
-                    if groups_res.status_code == 200:
-                        groups = groups_res.json() or []
-                        if groups:
-                            # Fetch members of the first group to find self
-                            members_res = requests.get(
-                                f"{GO_BACKEND_URL}/api/groups/{groups[0]['id']}/members",
-                                headers=headers
-                            )
-                            if members_res.status_code == 200:
-                                for m in (members_res.json() or []):
-                                    if m['id'] == uid:
-                                        request.session['username'] = m['username']
-                                        break
-                except Exception:
-                    pass
+                # Claims are decoded once here and cached in the session; the
+                # username comes from them, or lazily from the members cache
+                # the first time a page needs it (see get_current_username).
+                identity.remember_token(request.session, token)
+                request.session['user_email'] = email
 
                 return redirect('dashboard')
             else:
@@ -141,7 +129,7 @@ def login_page(request):
                     err = f"Login failed ({response.status_code})"
                 return render(request, 'web_ui/login.html', {'error': err})
 
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             return render(request, 'web_ui/login.html', {'error': 'Cannot connect to Backend Server'})
 
     return render(request, 'web_ui/login.html')
@@ -160,24 +148,69 @@ def dashboard_page(request):
         messages.error(request, "You must log in to view the dashboard.")
         return redirect('login')
 
-    headers = {'Authorization': f'Bearer {token}'}
-
-    try:
-        response = requests.get(f"{GO_BACKEND_URL}/api/dashboard", headers=headers)
-
-        if response.status_code == 200:
-            return render(request, 'web_ui/dashboard.html', {
-                'data': response.json(),
-                'user_email': request.session.get('user_email')
-            })
-        elif response.status_code == 401:
-            messages.error(request, "Session expired. Please login again.")
-            return redirect('login')
-        else:
-            return render(request, 'web_ui/dashboard.html', {'error': 'Could not fetch dashboard data'})
-
-    except requests.exceptions.ConnectionError:
-        return render(request, 'web_ui/dashboard.html', {'error': 'Backend is offline'})
+    # The whole page, group summaries included, gets DASHBOARD_DEADLINE.
+    deadline = backend.Deadline(settings.DASHBOARD_DEADLINE)
+    groups = identity.cached_groups(request.session)
+    paths = {"dashboard": "/api/dashboard"}
+    if groups is None:
+        paths["groups"] = "/api/groups"
+    results = backend.fetch_all(paths, request, deadline)
+
+    response = results["dashboard"]
+    if response is not None and response.status_code == 401:
+        messages.error(request, "Session expired. Please login again.")
+        return redirect('login')
+    if groups is None:
+        res_groups = results["groups"]
+        groups = overview.json_body(res_groups, []) or []
+        if groups and not backend.is_stale(res_groups):
+            identity.store_groups(request.session, groups)
+
+    summaries = load_overview(request, groups, deadline)
+    context = {
+        'user_email': request.session.get('user_email'),
+        'summaries': summaries,
+        'partial': any(s['partial'] for s in summaries),
+    }
+    data = overview.json_body(response, {})
+    if response is None:
+        context['error'] = 'Backend is offline'
+    elif data is None:
+        context['error'] = 'Could not fetch dashboard data'
+    else:
+        context['data'] = data
+    return render(request, 'web_ui/dashboard.html', context)
+
+
+def load_overview(request, groups, deadline):
+    """Dashboard summaries of ``groups``: cached parts plus one fan-out for
+    the rest, under ``deadline`` (see web_ui/overview.py)."""
+    my_id = get_current_user_id(request)
+    cached, paths = {}, {}
+    for g in groups:
+        gid = g['id']
+        cached[gid] = (
+            groupcache.cached_members(request, gid),
+            groupcache.cached_debts(gid),
+            groupcache.cached_recent(gid),
+        )
+        paths.update(overview.missing_paths(gid, *cached[gid]))
+    results = backend.fetch_all(paths, request, deadline) if paths else {}
+
+    summaries = []
+    for g in groups:
+        gid = g['id']
+        members, index, recent, store, observed = loaders.group_parts(gid, cached[gid], results)
+        for path, etag in observed:
+            groupcache.observe_activity(gid, path, etag)
+        if 'members' in store:
+            groupcache.store_members(gid, store['members'])
+        if 'debts' in store:
+            groupcache.store_debts(gid, store['debts'])
+        if 'recent' in store:
+            groupcache.store_recent(gid, store['recent'])
+        summaries.append(loaders.group_summary(g, my_id, members, index, recent))
+    return summaries
 
 
 def home(request):
@@ -185,18 +218,27 @@ def home(request):
     groups = []
 
     if token:
-        headers = {"Authorization": f"Bearer {token}"}
-        try:
-            res = requests.get(f"{GO_BACKEND_URL}/api/groups", headers=headers)
-            if res.status_code == 200:
-                groups = res.json()
-        except:
-            pass
-
-    return render(request, "web_ui/home.html", {
+        groups = identity.cached_groups(request.session)
+        if groups is None:
+            groups = []
+            try:
+                res = backend.get("/api/groups", request)
+                if res.status_code == 200:
+                    groups = res.json()
+                    if not backend.is_stale(res):
+                        identity.store_groups(request.session, groups)
+            except:
+                pass
+
+    etag = conditional.page_etag(request, "home", groups)
+    unchanged = conditional.not_modified(request, "home", etag)
+    if unchanged is not None:
+        return unchanged
+
+    return conditional.tag(render(request, "web_ui/home.html", {
         "is_logged_in": bool(token),
         "groups": groups
-    })
+    }), etag)
 
 
 def create_group(request):
@@ -205,23 +247,22 @@ def create_group(request):
 
     if request.method == "POST":
         name = request.POST.get("name")
-        headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            res = requests.post(
-                f"{GO_BACKEND_URL}/api/create-group",
-                json={"name": name},
-                headers=headers
-            )
+            res = backend.post("/api/create-group", request, json={"name": name})
             
             if res.status_code == 200:
                 data = res.json()
+                group_id = data.get("group_id") or data.get("id")
+                if group_id:
+                    groupcache.invalidate_members(group_id)
+                identity.invalidate_groups(request.session)
                 return render(request, "web_ui/group_created.html", {"code": data["join_code"]})
             else:
                 error_msg = res.json().get('error', f'Error {res.status_code}')
                 return render(request, "web_ui/create_group.html", {"error": error_msg})
 
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             return render(request, "web_ui/create_group.html", {"error": "Cannot connect to Backend Server"})
 
     return render(request, "web_ui/create_group.html")
@@ -233,158 +274,344 @@ def join_group(request):
 
     if request.method == "POST":
         code = request.POST.get("code")
-        headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            res = requests.post(
-                f"{GO_BACKEND_URL}/api/join-group",
-                json={"code": code},
-                headers=headers
-            )
+            res = backend.post("/api/join-group", request, json={"code": code})
             
             if res.status_code == 200:
+                identity.invalidate_groups(request.session)
+                group_id = joined_group_id(request, res, code)
+                if group_id:
+                    groupcache.invalidate_members(group_id)
                 messages.success(request, "Joined group successfully!")
                 return redirect("home")
             else:
                 # Capture specific error (e.g., "invalid code")
                 err = res.json().get("error", "Failed to join group")
                 messages.error(request, err)
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.RequestException:
             messages.error(request, "Backend unavailable")
 
     return render(request, "web_ui/join_group.html")
 
 
+def joined_group_id(request, res, code):
+    """Id of the group a join code resolved to, or None if it can't be told.
+
+    Uses the join response when it carries the id, otherwise looks the code
+    up in the user's group list.
+    """
+    try:
+        data = res.json() or {}
+        if isinstance(data, dict) and (data.get("group_id") or data.get("id")):
+            return data.get("group_id") or data.get("id")
+        groups_res = backend.get("/api/groups", request)
+        if groups_res.status_code == 200:
+            groups = groups_res.json() or []
+            # The list now includes the new group: reuse it for the home page.
+            if not backend.is_stale(groups_res):
+                identity.store_groups(request.session, groups)
+            for g in groups:
+                if g.get("join_code") == code:
+                    return g.get("id")
+    except (ValueError, requests.exceptions.RequestException):
+        pass
+    return None
+
+
+SPLIT_VALUE_FIELDS = {
+    "custom": "custom_amount_",
+    "percentage": "percent_",
+    "shares": "shares_",
+}
+
+
+def build_expense_payload(request, group_id, members):
+    """Turn the add-expense form into an /api/expenses payload.
+
+    Returns None when the form is invalid; the reason has already been added
+    with ``messages.error``.
+    """
+    description = request.POST.get("description")
+    split_mode = request.POST.get("split_mode")
+    prefix = SPLIT_VALUE_FIELDS.get(split_mode)
+    values = {int(m['id']): request.POST.get(f"{prefix}{m['id']}") for m in members} if prefix else None
+
+    try:
+        total = splits.to_cents(request.POST.get("amount"))
+        expense_splits = splits.payload_splits(
+            total,
+            split_mode,
+            members,
+            selected_ids=request.POST.getlist("selected_members"),
+            values=values,
+        )
+    except ValueError as e:
+        messages.error(request, str(e))
+        return None
+
+    return {
+        "group_id": int(group_id),
+        "amount": splits.from_cents(total),
+        "description": description,
+        "splits": expense_splits
+    }
+
+
+def load_members(request, group_id):
+    """Group members (cache first), a debug message if they couldn't load,
+    and whether they are fresh (not an outage's last good copy)."""
+    cached = groupcache.cached_members(request, group_id)
+    if cached is not None:
+        return cached, None, True
+    try:
+        res = backend.get(loaders.members_path(group_id), request)
+    except requests.exceptions.ConnectionError:
+        return [], f"Connection Refused. Is Go running at {GO_BACKEND_URL}?", False
+    except requests.exceptions.Timeout:
+        return [], "Backend timed out fetching members.", False
+    except requests.exceptions.RequestException as e:
+        return [], f"Backend request failed: {e}", False
+    members, fresh, debug_error = loaders.members_or_error(res)
+    if fresh:
+        groupcache.store_members(group_id, members)
+    return members, debug_error, fresh
+
+
+def post_once(request, path, payload, key=None):
+    """POST a form's write at most once per idempotency key.
+
+    ``key`` defaults to the form's ``idempotency_key``. Returns ``{"status",
+    "text"}`` of the backend response, or of the first response for this key
+    if the form was already submitted.
+    """
+    if key is None:
+        key = request.POST.get("idempotency_key")
+
+    def send():
+        res = backend.post(path, request, json=payload, headers=idempotency.headers(key))
+        return {"status": res.status_code, "text": res.text}
+
+    return idempotency.run_once(request, key, send, path)
+
+
 def add_expense(request, group_id):
     token = request.session.get("auth_token")
     if not token: return redirect("login")
-    headers = {"Authorization": f"Bearer {token}"}
-
-    members = []
-    debug_error = None  # <--- New variable to capture errors
 
     # 1. Fetch Members with Error Capture
-    try:
-        members_url = f"{GO_BACKEND_URL}/api/groups/{group_id}/members"
-        res = requests.get(members_url, headers=headers)
-        
-        if res.status_code == 200:
-            members = res.json() or []
-        else:
-            # Capture backend error (e.g., 404 or 500)
-            debug_error = f"Backend Error {res.status_code}: {res.text}"
-            
-    except requests.exceptions.ConnectionError:
-        debug_error = f"Connection Refused. Is Go running at {GO_BACKEND_URL}?"
-    except Exception as e:
-        debug_error = f"Python Exception: {str(e)}"
+    members, debug_error, fresh = load_members(request, group_id)
 
     # 2. Process POST (Save Expense)
+    key = None
     if request.method == "POST":
-        amount_str = request.POST.get("amount")
-        description = request.POST.get("description")
-        split_mode = request.POST.get("split_mode")
-        
-        try:
-            total_amount = float(amount_str)
-        except:
-            total_amount = 0.0
-
-        splits = []
-
-        # LOGIC: Equal All
-        if split_mode == "equal_all":
-            if members:
-                count = len(members)
-                share = round(total_amount / count, 2)
-                rem = round(total_amount - (share * count), 2)
-                for i, m in enumerate(members):
-                    amt = share + rem if i == 0 else share
-                    splits.append({"user_id": int(m['id']), "amount": float(f"{amt:.2f}")})
-            else:
-                messages.error(request, "Cannot split: No members found.")
-
-        # LOGIC: Equal Subset
-        elif split_mode == "equal_subset":
-            selected_ids = request.POST.getlist("selected_members")
-            if not selected_ids:
-                messages.error(request, "Please select at least one member.")
-                return render(request, "web_ui/add_expense.html", {"group_id": group_id, "members": members, "debug_error": debug_error})
-            
-            count = len(selected_ids)
-            share = round(total_amount / count, 2)
-            rem = round(total_amount - (share * count), 2)
-            
-            for i, uid in enumerate(selected_ids):
-                amt = share + rem if i == 0 else share
-                splits.append({"user_id": int(uid), "amount": float(f"{amt:.2f}")})
-
-        # LOGIC: Custom Split
-        elif split_mode == "custom":
-            custom_total = 0.0
-            for m in members:
-                val = request.POST.get(f"custom_amount_{m['id']}")
-                if val: 
-                    try:
-                        amt = float(val)
-                        if amt > 0: 
-                            splits.append({"user_id": int(m['id']), "amount": amt})
-                            custom_total += amt
-                    except: pass
-            
-            if abs(custom_total - total_amount) > 0.01:
-                messages.error(request, f"Total ({custom_total}) does not match Amount ({total_amount})")
-                return render(request, "web_ui/add_expense.html", {"group_id": group_id, "members": members, "debug_error": debug_error})
+        # A re-rendered form keeps its key unless the backend gave a final
+        # answer, so resubmitting can't repeat a write that may have landed.
+        key = request.POST.get("idempotency_key")
+        payload = build_expense_payload(request, group_id, members)
+        if payload is not None:
+            try:
+                res = post_once(request, "/api/expenses", payload)
+                groupcache.invalidate_debts(group_id)
+                if expense_saved(request, res):
+                    return redirect("home")
+                if idempotency.final(res):
+                    key = None
+            except idempotency.StillRunning:
+                messages.error(request, EXPENSE_STILL_RUNNING)
+            except idempotency.OutcomeUnknown:
+                groupcache.invalidate_debts(group_id)
+                messages.error(request, EXPENSE_OUTCOME_UNKNOWN)
+            except requests.exceptions.RequestException:
+                messages.error(request, "Backend unavailable during save.")
+
+    return render(request, "web_ui/add_expense.html", expense_form_context(
+        request, group_id, members, debug_error, fresh, groupcache.group_version(group_id), key
+    ))
+
+
+EXPENSE_STILL_RUNNING = "This expense is still being saved; check the history before retrying."
+EXPENSE_OUTCOME_UNKNOWN = "The backend didn't confirm this expense; it may have been saved. Check the history before adding it again."
+
+
+def expense_saved(request, res):
+    """Flash the outcome of an /api/expenses write; True if it was saved."""
+    if res["status"] in [200, 201]:
+        messages.success(request, "Expense added successfully!")
+        return True
+    messages.error(request, f"Backend Error: {res['text']}")
+    return False
+
+
+def expense_form_context(request, group_id, members, debug_error, fresh, group_version, key=None):
+    return {
+        "group_id": group_id,
+        "members": members,
+        "debug_error": debug_error,
+        "idempotency_key": key or idempotency.new_key(),
+        "group_version": group_version,
+        "members_fragment_key": fragments.members_key(get_current_user_id(request), members, fresh)
+    }
 
-        payload = {
-            "group_id": int(group_id),
-            "amount": total_amount,
-            "description": description,
-            "splits": splits
-        }
-        
-        try:
-            res = requests.post(f"{GO_BACKEND_URL}/api/expenses", json=payload, headers=headers)
-            if res.status_code in [200, 201]:
-                messages.success(request, "Expense added successfully!")
-                return redirect("home")
-            else:
-                messages.error(request, f"Backend Error: {res.text}")
-        except:
-            messages.error(request, "Backend unavailable during save.")
 
-    # Pass 'debug_error' to the template
-    return render(request, "web_ui/add_expense.html", {
-        "group_id": group_id, 
+def bulk_add_expense(request, group_id):
+    """Add many expenses at once from pasted lines or an uploaded CSV.
+
+    Every row is validated up front; nothing is sent unless all rows are
+    valid, so fixing a typo and resubmitting can't duplicate expenses. Valid
+    batches are posted concurrently on the backend client's bounded pool.
+    """
+    token = request.session.get("auth_token")
+    if not token: return redirect("login")
+
+    members, debug_error, _ = load_members(request, group_id)
+    rows_text = ""
+    results = []
+
+    if request.method == "POST":
+        rows_text = request.POST.get("rows", "")
+        upload = request.FILES.get("csv_file")
+        if upload:
+            rows_text = upload.read().decode("utf-8-sig", errors="replace")
+        rows = bulk.read_rows(rows_text)
+
+        if not rows:
+            messages.error(request, "No expenses found.")
+        elif len(rows) > settings.BULK_EXPENSE_MAX_ROWS:
+            messages.error(request, f"Too many rows ({len(rows)}); the limit is {settings.BULK_EXPENSE_MAX_ROWS}.")
+        else:
+            calls = {}
+            for line_no, cells in rows:
+                result = {"line": line_no, "raw": ", ".join(cells), "status": "invalid"}
+                results.append(result)
+                try:
+                    row = bulk.parse_row(cells, members)
+                    expense_splits = splits.payload_splits(
+                        row["amount"], row["split_mode"], members, row["selected_ids"], row["values"]
+                    )
+                except ValueError as e:
+                    result["message"] = str(e)
+                    continue
+                amount = splits.from_cents(row["amount"])
+                result.update(status="valid", description=row["description"], amount=amount)
+                calls[line_no] = ("POST", "/api/expenses", {"json": {
+                    "group_id": int(group_id),
+                    "amount": amount,
+                    "description": row["description"],
+                    "splits": expense_splits
+                }})
+
+            invalid = [r for r in results if r["status"] == "invalid"]
+            if invalid:
+                messages.error(request, f"{len(invalid)} of {len(rows)} rows are invalid; nothing was saved.")
+            else:
+                responses = backend.send_all(
+                    calls, request, backend.Deadline(settings.BULK_EXPENSE_DEADLINE)
+                )
+                groupcache.invalidate_debts(group_id)
+                for result in results:
+                    res = responses[result["line"]]
+                    if res is None:
+                        result.update(status="failed", message="No response from backend; check history before retrying this row.")
+                    elif res.status_code in [200, 201]:
+                        result.update(status="saved", message="Saved")
+                    else:
+                        result.update(status="failed", message=f"Backend Error {res.status_code}: {res.text}")
+                saved = sum(r["status"] == "saved" for r in results)
+                if saved == len(results):
+                    messages.success(request, f"Added {saved} expenses.")
+                    rows_text = ""
+                else:
+                    messages.error(request, f"Saved {saved} of {len(results)} expenses.")
+
+    return render(request, "web_ui/bulk_expense.html", {
+        "group_id": group_id,
         "members": members,
-        "debug_error": debug_error
+        "debug_error": debug_error,
+        "rows_text": rows_text,
+        "results": results,
+        "max_rows": settings.BULK_EXPENSE_MAX_ROWS,
     })
 
 
+def load_ledger(request, group_id):
+    """Full activity feed and members for local balances; activity is None on failure."""
+    members = groupcache.cached_members(request, group_id)
+    paths = {"activity": loaders.ledger_path(group_id)}
+    if members is None:
+        paths["members"] = loaders.members_path(group_id)
+    results = backend.fetch_all(paths, request)
+
+    if members is None:
+        members, fresh = loaders.members(results["members"])
+        if fresh:
+            groupcache.store_members(group_id, members)
+    activity = loaders.activity(results["activity"])
+    if activity is not None:
+        groupcache.observe_activity(group_id, paths["activity"], loaders.etag(results["activity"]))
+    return activity, members or []
+
+
+def load_debts(request, group_id):
+    """The current user's simplified transactions: ``(txns, computed_locally)``.
+
+    Served from the group's cached index. On a miss the backend's plan is
+    fetched; if that fails the plan is computed here from the activity feed,
+    provided it records every split. ``txns`` is None when there's no plan.
+    """
+    my_id = get_current_user_id(request)
+    index = groupcache.cached_debts(group_id)
+    if index is not None:
+        return groupcache.debts_for(index, my_id), False
+
+    path = loaders.simplify_path(group_id)
+    try:
+        res = backend.get(path, request)
+    except requests.exceptions.RequestException as e:
+        logger.warning("simplify: group %s unavailable: %s", group_id, e)
+        res = None
+    txns, stale = loaders.plan(res)
+    if txns is not None:
+        # Debts changed by other clients bump the group's version too.
+        groupcache.observe_activity(group_id, path, loaders.etag(res))
+
+    if txns is not None and stale:
+        # Last known plan during an outage: show it, but don't cache it.
+        return groupcache.debts_for(groupcache.index_debts(txns), my_id), False
+    if txns is not None:
+        index = groupcache.store_debts(group_id, txns)
+        if settings.DEBTS_CROSS_CHECK:
+            activity, _ = load_ledger(request, group_id)
+            if activity is not None:
+                debts.cross_check(group_id, txns, activity)
+        return groupcache.debts_for(index, my_id), False
+
+    if not settings.DEBTS_LOCAL_FALLBACK:
+        return None, False
+    return loaders.local_plan(*load_ledger(request, group_id), my_id)
+
+
 def simplify_group(request, group_id):
     token = request.session.get("auth_token")
     if not token: return redirect('login')
-    
-    headers = {"Authorization": f"Bearer {token}"}
-    txns = []
-    my_id = get_current_user_id(request)
 
-    try:
-        res = requests.get(f"{GO_BACKEND_URL}/api/groups/{group_id}/simplify", headers=headers)
-        if res.status_code == 200:
-            all_txns = res.json() or []
-            # Filter for current user only
-            if my_id:
-                txns = [t for t in all_txns if t.get('from') == my_id or t.get('to') == my_id]
-            else:
-                txns = all_txns
-    except Exception as e:
-        print(f"Error fetching debts: {e}")
+    txns, computed_locally = load_debts(request, group_id)
+    # The idempotency key is left out on purpose: a 304 keeps the page's old
+    # key, which is still unused unless a settlement (and so new debts) followed.
+    etag = conditional.page_etag(request, "simplify", [group_id, txns, computed_locally])
+    unchanged = conditional.not_modified(request, "simplify", etag)
+    if unchanged is not None:
+        return unchanged
 
-    return render(request, "web_ui/simplify.html", {
+    return conditional.tag(render(request, "web_ui/simplify.html", {
         "txns": txns,
-        "group_id": group_id
-    })
+        "group_id": group_id,
+        "computed_locally": computed_locally,
+        "idempotency_key": idempotency.new_key(),
+        "group_version": groupcache.group_version(group_id),
+        "viewer_key": fragments.viewer_key(request),
+        "plan_key": fragments.data_key(txns, computed_locally)
+    }), etag)
 
 
 def settle_debt(request, group_id):
@@ -396,8 +623,6 @@ def settle_debt(request, group_id):
         payee_name = request.POST.get('payee_name')
         amount = request.POST.get('amount')
 
-        headers = {"Authorization": f"Bearer {token}"}
-        
         # CORRECTED PAYLOAD for Settlement Endpoint
         payload = {
             "group_id": int(group_id),
@@ -407,109 +632,198 @@ def settle_debt(request, group_id):
 
         try:
             # CORRECTED URL: Hits /api/settlements
-            response = requests.post(
-                f"{GO_BACKEND_URL}/api/settlements",
-                json=payload,
-                headers=headers
+            # One key per simplify page render; each payee's form is its own write.
+            page_key = request.POST.get("idempotency_key")
+            response = post_once(
+                request, "/api/settlements", payload, key=f"{page_key}:{payee_id}" if page_key else ""
             )
+            groupcache.invalidate_debts(group_id)
 
-            if response.status_code in [200, 201]:
+            if response["status"] in [200, 201]:
                 messages.success(request, f"Paid ₹{amount} to {payee_name}")
             else:
-                messages.error(request, f"Error: {response.text}")
-
-        except requests.exceptions.ConnectionError:
+                messages.error(request, f"Error: {response['text']}")
+
+        except idempotency.StillRunning:
+            messages.error(request, "This payment is still being recorded.")
+        except idempotency.OutcomeUnknown:
+            groupcache.invalidate_debts(group_id)
+            messages.error(request, "The backend didn't confirm this payment; it may have gone through. Check the history before paying again.")
+        except requests.exceptions.RequestException:
             messages.error(request, "Backend unavailable.")
 
     return redirect('simplify', group_id=group_id)
 
 
+def feed_params(request):
+    """``?before=<cursor>&limit=N`` for the history feed, clamped."""
+    before = request.GET.get('before') or None
+    try:
+        limit = int(request.GET.get('limit', settings.ACTIVITY_PAGE_SIZE))
+    except ValueError:
+        limit = settings.ACTIVITY_PAGE_SIZE
+    return before, max(1, min(limit, settings.ACTIVITY_PAGE_MAX))
+
+
+def load_history(request, group_id):
+    """One page of the formatted activity feed: ``(expenses, next_cursor)``."""
+    before, limit = feed_params(request)
+
+    # Members and activity are independent: fetch them side by side under one
+    # deadline. If members is slow, names fall back to "User {id}".
+    members = groupcache.cached_members(request, group_id)
+    paths = {"activity": feed.activity_path(group_id, before, limit)}
+    if members is None:
+        paths["members"] = loaders.members_path(group_id)
+    results = backend.fetch_all(paths, request)
+
+    if members is None:
+        members, fresh = loaders.members(results["members"])
+        if fresh:
+            groupcache.store_members(group_id, members)
+    activity = loaders.activity(results["activity"])
+    if activity is not None and before is None:
+        # The newest page changes whenever the group does.
+        groupcache.observe_activity(group_id, paths["activity"], loaders.etag(results["activity"]))
+    return loaders.history_page(activity, members, before, limit)
+
+
 def group_expenses(request, group_id):
     token = request.session.get("auth_token")
     if not token: return redirect('login')
     
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    # 1. Helper to map User IDs to Names
-    user_map = {}
-    try:
-        res_members = requests.get(f"{GO_BACKEND_URL}/api/groups/{group_id}/members", headers=headers)
-        if res_members.status_code == 200:
-            for m in (res_members.json() or []):
-                user_map[m['id']] = m['username']
-    except:
-        pass
+    expenses, next_cursor = load_history(request, group_id)
+    etag = conditional.page_etag(request, "group_expenses", [group_id, expenses, next_cursor])
+    unchanged = conditional.not_modified(request, "group_expenses", etag)
+    if unchanged is not None:
+        return unchanged
+
+    return conditional.tag(render(request, "web_ui/group_expenses.html", {
+        "expenses": expenses,
+        "rows_key": fragments.data_key(expenses),
+        "group_id": group_id,
+        "next_cursor": next_cursor,
+        "group_version": groupcache.group_version(group_id)
+    }), etag)
 
-    # 2. Fetch Activity
-    activity = []
-    try:
-        res_act = requests.get(f"{GO_BACKEND_URL}/api/groups/{group_id}/activity", headers=headers)
-        if res_act.status_code == 200:
-            data = res_act.json()
-            activity = data.get('activity_feed', [])
-    except:
-        pass
 
-    # 3. Format for Template
-    payload = []
-    for item in activity:
-        payer_id = item.get('payer_id')
-        payee_id = item.get('payee_id') # Usually 0 for expenses, valid ID for settlements
-
-        payer_name = user_map.get(payer_id, f"User {payer_id}")
-        payee_name = user_map.get(payee_id, f"User {payee_id}")
-
-        description = item.get('description', '')
-        # Simple heuristic to detect settlement if payee_id is used
-        is_settlement = (payee_id is not None and payee_id != 0) or ('Payment to' in description)
-
-        payload.append({
-            "amount": item.get('amount'),
-            "description": description,
-            "created_at": item.get('created_at'),
-            "payer_name": payer_name,
-            "payee_name": payee_name,
-            "is_settlement": is_settlement
-        })
-
-    return render(request, "web_ui/group_expenses.html", {
-        "expenses": payload,
-        "group_id": group_id
-    })
+def group_expenses_more(request, group_id):
+    """"Load more" for the history page: rendered rows plus the next cursor."""
+    token = request.session.get("auth_token")
+    if not token:
+        return JsonResponse({"error": "Not logged in"}, status=401)
+
+    expenses, next_cursor = load_history(request, group_id)
+    html = render_to_string("web_ui/_expense_rows.html", {
+        "expenses": expenses,
+        "rows_key": fragments.data_key(expenses),
+        "group_id": group_id,
+        "group_version": groupcache.group_version(group_id)
+    }, request=request)
+    return JsonResponse({"html": html, "next_cursor": next_cursor, "stale": metrics.served_stale()})
 
 
 def chat_page(request, group_id):
-    # print("page called")
+    # No backend call here: history arrives over the WebSocket "history"
+    # message and older pages via /chat-pagination.
     token = request.session.get("auth_token")
     if not token: return redirect('login')
-    headers = {"Authorization": f"Bearer {token}"}
-    # print(f"Fetching chat history for group {group_id} with token: {token}")
-    chat_history = []
-    user_id = get_current_user_id(request)
-    username = get_current_username(request)
-    try:
-        response = requests.get(f"{GO_BACKEND_URL}/api/groups/{group_id}/activity", headers=headers)
-        # print(f"Activity response status: {response.status_code}")
-        if response.status_code == 200:
-            data = response.json()
-            # print("Raw activity data:", data);
-            # Extract the chat specific part from the combined JSON
-            chat_history = data.get('chat_history', [])
-            # print(f"Fetched chat history: {chat_history}")
-    except:
-        pass
 
-    # print("DEBUG chat_history:", chat_history)
-    ws_url = os.getenv("WS_BACKEND_URL", "ws://localhost:8080")
+    return render(request, "web_ui/chat.html", chat_context(request, group_id))
+
 
-    return render(request, "web_ui/chat.html", {
+def chat_context(request, group_id, username=None):
+    ws_url = settings.WS_BACKEND_URL
+    if settings.CHAT_RELAY_ENABLED:
+        ws_url = f"{'wss' if request.is_secure() else 'ws'}://{request.get_host()}/ws"
+
+    return {
         "go_backend_url": GO_BACKEND_URL,
         "ws_backend_url": ws_url,
-        "token": token,
+        "token": request.session.get("auth_token"),
         "group_id": group_id,
-        "user_id": user_id,
-        "username": username,
-        "chat_history": json.dumps(chat_history),
+        "user_id": get_current_user_id(request),
+        "username": username or get_current_username(request, group_id),
         "cloud_name": os.getenv("CLOUDINARY_CLOUD_NAME"),
-        "upload_preset": os.getenv("CLOUDINARY_UPLOAD_PRESET")
-    })
\ No newline at end of file
+        "upload_preset": os.getenv("CLOUDINARY_UPLOAD_PRESET"),
+        "upload_target": settings.CHAT_UPLOAD_TARGET,
+        "upload_chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "upload_image_max_px": settings.UPLOAD_IMAGE_MAX_PX,
+        "upload_thumb_px": settings.UPLOAD_THUMB_PX,
+    }
+
+
+def _upload_error(e):
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return JsonResponse(body, status=e.status)
+
+
+def upload_start(request):
+    """Begin a chunked chat attachment upload (web_ui/uploads.py)."""
+    if not request.session.get("auth_token"):
+        return JsonResponse({"error": "Not logged in"}, status=401)
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only"}, status=405)
+    try:
+        body = json.loads(request.body or b"{}")
+        state = uploads.start(get_current_user_id(request), body.get("name"), body.get("size"), body.get("type"))
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Expected a JSON object"}, status=400)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(state, status=201)
+
+
+def upload_chunk(request, upload_id):
+    """GET: bytes received so far. PUT: append the chunk in the body."""
+    if not request.session.get("auth_token"):
+        return JsonResponse({"error": "Not logged in"}, status=401)
+    user_id = get_current_user_id(request)
+    try:
+        if request.method == "GET":
+            return JsonResponse(uploads.status(upload_id, user_id))
+        if request.method == "PUT":
+            # Read the body as a stream: chunks are bigger than
+            # DATA_UPLOAD_MAX_MEMORY_SIZE and go straight to disk.
+            return JsonResponse(uploads.write_chunk(upload_id, user_id, request.headers.get("Content-Range"), request))
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    return JsonResponse({"error": "GET or PUT only"}, status=405)
+
+
+def upload_file(request, name):
+    """Serve a finished upload from the filesystem storage to logged-in users."""
+    if not request.session.get("auth_token"):
+        raise Http404()
+    storage = storages[uploads.STORAGE_ALIAS]
+    try:
+        f = storage.open(name)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404()
+    is_image = name.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))
+    response = FileResponse(f, as_attachment=not is_image)
+    # Uploaded markup must never run as a page of this site.
+    response["Content-Security-Policy"] = "sandbox"
+    # Names are unique per upload, so the content never changes.
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def metrics_page(request):
+    """Prometheus scrape endpoint; only answers the addresses in METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404()
+    metrics.clear_gauge('web_ui_breaker_open')
+    for family, state in breaker.states().items():
+        if state != breaker.CLOSED:
+            metrics.set_gauge('web_ui_breaker_open', 1 if state == breaker.OPEN else 0.5, endpoint=family)
+    usage = fragments.stats()
+    if 'bytes' in usage:
+        metrics.set_gauge('web_ui_fragment_cache_bytes', usage['bytes'])
+        metrics.set_gauge('web_ui_fragment_cache_entries', usage['entries'])
+    relay = chat_relay.stats()
+    metrics.set_gauge('web_ui_chat_clients', relay['clients'])
+    metrics.set_gauge('web_ui_chat_upstreams', relay['upstreams'])
+    return HttpResponse(metrics.exposition(), content_type="text/plain; version=0.0.4")